@@ -10,7 +10,7 @@ Functions:
 - refresh(refresh_token): Refresh the access token using the refresh token.
 - auth(): Catchall authentication.
 """
-from os import chmod, makedirs
+from os import chmod, environ
 from os.path import exists
 from datetime import datetime, timedelta
 
@@ -20,13 +20,15 @@ from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 
-API_ROOT = "https://log.concept2.com"
+import storage
+
+API_ROOT = environ.get("VALKYRIE_API_ROOT", "https://log.concept2.com")
 REDIRECT_URI = "insert_redirect_uri_here"
 SCOPE = "user:read,results:read"
 CLIENT_ID = "hidden"  # "hidden" for security reasons
 CLIENT_SECRET = "hidden"  # "hidden" for security reasons
 AUTH_URL = f"{API_ROOT}/oauth/authorize?client_id={CLIENT_ID}&scope={SCOPE}&response_type=code&redirect_uri={REDIRECT_URI}"
-TOKEN_URL = "https://log.concept2.com/oauth/access_token"
+TOKEN_URL = f"{API_ROOT}/oauth/access_token"
 EMAIL = "insert_email_here"
 USERNAME = "insert_username_here"
 PASSWORD = "insert_password_here"
@@ -38,11 +40,18 @@ access_tokens = {}
 refresh_tokens = {}
 
 
+def _make_writable(path):
+    """Make a file on disk writable by everyone, if it exists."""
+    local = storage.local_path(path)
+    if local is not None and exists(local):
+        chmod(local, 0o777)
+
+
 def read_refresh_token():
     """Read the refresh token from a file."""
     path = "data/refresh_token.txt"
-    chmod(path, 0o777)
-    with open(path, "r", encoding="utf-8") as f:
+    _make_writable(path)
+    with storage.open_file(path, "r", encoding="utf-8") as f:
         refresh_token = f.read()
     return refresh_token
 
@@ -50,10 +59,8 @@ def read_refresh_token():
 def write_refresh_token(refresh_token):
     """Write the refresh token to a file."""
     path = "data/refresh_token.txt"
-    if not exists("data"):
-        makedirs("data")
-    chmod(path, 0o777)
-    with open(path, "w", encoding="utf-8") as f:
+    _make_writable(path)
+    with storage.atomic(path, "w", encoding="utf-8") as f:
         f.write(refresh_token)
 
 
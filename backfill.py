@@ -0,0 +1,301 @@
+"""
+This module backfills the results and stroke data of every athlete over a long
+date range, e.g. the last three seasons, for season history and PB baselines.
+
+The sync only keeps the last MAX_DAYS days warm. The backfill splits the range
+into shards of SHARD_DAYS days and fetches every (athlete, shard) in parallel
+through the downloader, so the adaptive limits and token refresh apply. The
+stroke data of each piece is queued as soon as its shard lands:
+
+    python backfill.py --years 3
+    python backfill.py --start 2023-05-01 --end 2024-04-30 --shard-days 14
+
+Results are merged into history/<user_id>.json.gz, which the sync never trims,
+and stroke data into strokes/. The power curves, the heart rate zones, the weekly
+team statistics, the live leaderboards and the Parquet export (if pyarrow is
+installed) are then updated from the whole history.
+Finished shards are recorded in BACKFILL_MANIFEST by user and first and last day,
+so an interrupted backfill skips them when it is run again with the same shards.
+
+Classes:
+- Reporter: Prints the progress of a backfill with its throughput and ETA.
+
+Functions:
+- shards(start: str, end: str, days: int) -> list: Split a date range into shards.
+- merge_history(user_id: int, results: list) -> int: Merge results into the history of a user.
+- history(user_ids: list) -> list: The saved history of the users.
+- eta(done: int, total: int, elapsed: float) -> float: The seconds left at the current rate.
+- backfill(api_token: str, start: str, end: str, ...) -> dict: Backfill a date range.
+"""
+
+import argparse
+import concurrent.futures
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+from threading import Event
+from typing import Callable
+
+import cache
+import downloader as dl
+import hr_zones
+import live_leaderboards
+import logs
+import parquet_export
+import power_curve
+import team_stats
+from manifest import FAILED, Manifest
+from workouts import needs_strokes
+
+HISTORY = "history"
+BACKFILL_MANIFEST = "data/backfill_manifest.json"
+SHARD_DAYS = 30
+DAYS_PER_YEAR = 365
+REPORT_INTERVAL = 5
+DATE_FORMAT = "%Y-%m-%d"
+
+
+def shards(start: str, end: str, days: int = SHARD_DAYS) -> list:
+    """Split a date range into consecutive shards.
+
+    Args:
+        start (str): The first date ('YYYY-MM-DD').
+        end (str): The last date, included.
+        days (int): The number of days in each shard; the last may be shorter.
+
+    Returns:
+        list: The (first, last) dates of each shard, both included.
+    """
+    first = datetime.strptime(start, DATE_FORMAT)
+    final = datetime.strptime(end, DATE_FORMAT)
+    ranges = []
+    while first <= final:
+        last = min(first + timedelta(days=days - 1), final)
+        ranges.append((first.strftime(DATE_FORMAT), last.strftime(DATE_FORMAT)))
+        first = last + timedelta(days=1)
+    return ranges
+
+
+def merge_history(user_id: int, results: list) -> int:
+    """Merge results into the saved history of a user, newest first.
+
+    Returns:
+        int: The number of results that were not saved before.
+    """
+    saved = []
+    if cache.exists(HISTORY, user_id):
+        saved = cache.read_json(HISTORY, user_id).get("data", [])
+    merged = {result["id"]: result for result in saved}
+    before = len(merged)
+    merged.update((result["id"], result) for result in results)
+    cache.write_json(
+        HISTORY,
+        user_id,
+        {"data": sorted(merged.values(), key=lambda x: x["date"], reverse=True)},
+    )
+    return len(merged) - before
+
+
+def history(user_ids: list) -> list:
+    """Get the saved history of the users."""
+    return [
+        result
+        for user_id in user_ids
+        if cache.exists(HISTORY, user_id)
+        for result in cache.read_json(HISTORY, user_id).get("data", [])
+    ]
+
+
+def eta(done: int, total: int, elapsed: float) -> float:
+    """Estimate the seconds left at the rate so far, or None before any is done."""
+    if done == 0:
+        return None
+    return elapsed / done * (total - done)
+
+
+def backfill(
+    api_token: str,
+    start: str,
+    end: str,
+    shard_days: int = SHARD_DAYS,
+    strokes: bool = True,
+    progress: Callable = None,
+    cancel: Event = None,
+    manifest_path: str = BACKFILL_MANIFEST,
+) -> dict:
+    """Fetch the results and stroke data of every user over a date range.
+
+    Args:
+        api_token (str): The API token for authentication.
+        start (str): The first date ('YYYY-MM-DD').
+        end (str): The last date, included.
+        shard_days (int): The number of days fetched by each request.
+        strokes (bool): Flag indicating whether to download the stroke data.
+        progress (callable, optional): Called with ("shards", done, total) after
+            each shard and ("strokes", done, queued) after each stroke download.
+        cancel (Event, optional): Stops the backfill when set; the shards done
+            are kept and skipped by the next run.
+        manifest_path (str): The file the finished shards are recorded in.
+
+    Returns:
+        dict: The shards, new results, stroke downloads and failed shards, the
+        seconds taken, the requests per second and the concurrency and throughput
+        of each endpoint.
+    """
+    headers = {"Authorization": f"Bearer {api_token}"}
+    users = dl.glui()
+    tasks = [
+        (user, first, last)
+        for user in users
+        for first, last in shards(start, end, shard_days)
+    ]
+    manifest = Manifest.resume(start, start, manifest_path)
+    # Shards of the same user merge into the same file
+    user_locks = {user: threading.Lock() for user in users}
+    stop = Event()
+    counts = {"shards": 0, "results": 0, "strokes": 0}
+    lock = threading.Lock()
+    dl.stats(reset=True)
+    started = time.perf_counter()
+
+    def cancelled():
+        return stop.is_set() or (cancel is not None and cancel.is_set())
+
+    def fetch(task):
+        user, first, last = task
+        # The last day is part of the key, so a rerun with other shard sizes
+        # does not take a shorter shard done earlier for its own
+        key = f"{HISTORY}/{user}/{first}..{last}"
+        if cancelled():
+            return []
+        if not manifest.plan(key):
+            # Done by an earlier run, which may not have finished its strokes
+            with user_locks[user]:
+                saved = history([user])
+            return [r for r in saved if first <= r["date"][:10] <= last]
+        endpoint = f"{dl.API_ROOT}/api/users/{user}/results?from={first}&to={last}"
+        body = dl.get_all_pages(endpoint, headers)
+        if "data" not in body:
+            logging.warning(
+                "Shard %s of user %s failed: %s",
+                first,
+                user,
+                body,
+                extra={"user_id": user},
+            )
+            manifest.failed(key, str(body))
+            return []
+        with user_locks[user]:
+            added = merge_history(user, body["data"])
+        manifest.done(key)
+        with lock:
+            counts["results"] += added
+        return body["data"]
+
+    def download(result):
+        if not cancelled():
+            dl.get_stroke_data(result["user_id"], result["id"], api_token)
+
+    queued = []
+    with logs.run("backfill"):
+        logging.info("Backfilling %s to %s in %d shards", start, end, len(tasks))
+        executor = concurrent.futures.ThreadPoolExecutor(dl.MAX_WORKERS)
+        try:
+            fetches = [executor.submit(logs.in_context(fetch), t) for t in tasks]
+            for future in concurrent.futures.as_completed(fetches):
+                counts["shards"] += 1
+                for result in future.result():
+                    if strokes and needs_strokes(result):
+                        if not cache.exists("strokes", result["id"]):
+                            queued.append(
+                                executor.submit(logs.in_context(download), result)
+                            )
+                if progress is not None:
+                    progress("shards", counts["shards"], len(tasks))
+            for future in concurrent.futures.as_completed(queued):
+                future.result()
+                counts["strokes"] += 1
+                if progress is not None:
+                    progress("strokes", counts["strokes"], len(queued))
+        except BaseException:
+            # The queued requests return at once instead of failing one by one
+            stop.set()
+            raise
+        finally:
+            executor.shutdown(wait=True)
+            manifest.save()
+
+        if not cancelled():
+            saved = history(users)
+            power_curve.update_curves(saved)
+            hr_zones.update_pieces(saved)
+            team_stats.update_weeks(saved)
+            live_leaderboards.update(saved)
+            if parquet_export.available():
+                parquet_export.export(saved)
+            if not manifest.count(FAILED):
+                manifest.finish()
+
+    elapsed = time.perf_counter() - started
+    concurrency = dl.stats()
+    requests = sum(endpoint["requests"] for endpoint in concurrency.values())
+    return {
+        **counts,
+        "failed": manifest.count(FAILED),
+        "seconds": round(elapsed, 3),
+        "requests_per_second": round(requests / elapsed, 1),
+        "concurrency": concurrency,
+    }
+
+
+class Reporter:
+    """Prints the progress of a backfill with its throughput and ETA."""
+
+    def __init__(self, interval: float = REPORT_INTERVAL):
+        self.interval = interval
+        self.started = time.perf_counter()
+        self.stage_started = {}
+        self.printed = 0.0
+
+    def __call__(self, stage: str, done: int, total: int) -> None:
+        now = time.perf_counter()
+        self.stage_started.setdefault(stage, now)
+        if done < total and now - self.printed < self.interval:
+            return
+        self.printed = now
+        elapsed = now - self.stage_started[stage]
+        left = eta(done, total, elapsed)
+        rate = done / elapsed if elapsed else 0.0
+        print(
+            f"{stage}: {done}/{total} ({rate:.1f}/s), "
+            f"ETA {'?' if left is None else timedelta(seconds=round(left))}"
+        )
+
+
+if __name__ == "__main__":
+    import authorization as auth
+
+    logs.setup()
+    today = datetime.today()
+    parser = argparse.ArgumentParser(description="Backfill results and strokes.")
+    parser.add_argument("--years", type=float, default=1)
+    parser.add_argument("--start", help="first date, YYYY-MM-DD (overrides --years)")
+    parser.add_argument("--end", default=today.strftime(DATE_FORMAT))
+    parser.add_argument("--shard-days", type=int, default=SHARD_DAYS)
+    parser.add_argument("--no-strokes", action="store_true")
+    args = parser.parse_args()
+
+    first_date = args.start or (
+        today - timedelta(days=round(args.years * DAYS_PER_YEAR))
+    ).strftime(DATE_FORMAT)
+    print(
+        backfill(
+            auth.auth(),
+            first_date,
+            args.end,
+            args.shard_days,
+            strokes=not args.no_strokes,
+            progress=Reporter(),
+        )
+    )
@@ -0,0 +1,221 @@
+"""
+This module stores the json/, strokes/ and history/ caches as compressed JSON files.
+
+Files are written as compact, gzip compressed JSON (<key>.json.gz) and read back
+transparently. Every file is written to a temporary file in the same directory and
+renamed into place, so readers never see a partially written file. Pretty-printed
+<key>.json files from older versions are still read until they are migrated.
+The files go through the storage in use (see storage.py), on disk or in memory:
+
+    python cache.py migrate
+    python cache.py bench
+
+Functions:
+- atomic_path(path: str) -> Iterator[str]: Write a file on disk under a temporary name first.
+- remove_partial(directory: str, older_than: float) -> int: Delete temporary files left by a crash.
+- cache_path(directory: str, key) -> str: The path a key is written to.
+- locate(directory: str, key) -> str: The path a key is read from.
+- open_text(path: str) -> TextIO: Open a cache file for reading.
+- exists(directory: str, key) -> bool: Check if a key is cached.
+- keys(directory: str) -> list: List the cached keys.
+- read_json(directory: str, key) -> dict: Read a cached file.
+- write_json(directory: str, key, data: dict) -> None: Write a cached file.
+- migrate(directory: str) -> dict: Compress the uncompressed files in a cache.
+- benchmark(directory: str) -> dict: Compare the size and read time of both formats.
+"""
+
+import gzip
+import io
+import os
+import sys
+import time
+from json import dump, dumps, load, loads
+from typing import TextIO
+
+import storage
+from storage import TMP_SUFFIX, atomic_path
+
+SUFFIX = ".json.gz"
+LEGACY_SUFFIX = ".json"
+COMPRESS_LEVEL = 6
+CACHES = ("json", "strokes", "history")
+PARTIAL_AGE = 600
+
+
+class _GzipReader(gzip.GzipFile):
+    """A gzip file that closes the file it decompresses when it is closed."""
+
+    def __init__(self, raw):
+        super().__init__(fileobj=raw, mode="rb")
+        self.raw = raw
+
+    def close(self) -> None:
+        try:
+            super().close()
+        finally:
+            self.raw.close()
+
+
+def _compress(data: dict) -> bytes:
+    """Serialise data as gzip compressed, compact JSON."""
+    return gzip.compress(
+        dumps(data, separators=(",", ":")).encode("utf-8"), COMPRESS_LEVEL
+    )
+
+
+def remove_partial(directory: str, older_than: float = PARTIAL_AGE) -> int:
+    """Delete the temporary files a crash left in a directory.
+
+    Args:
+        directory (str): The directory to clean.
+        older_than (float): Only files untouched for this many seconds are deleted,
+            so writes in progress are left alone.
+
+    Returns:
+        int: The number of files deleted.
+    """
+    removed = 0
+    for filename in storage.listdir(directory):
+        path = os.path.join(directory, filename)
+        if not filename.endswith(TMP_SUFFIX):
+            continue
+        if time.time() - storage.mtime(path) > older_than:
+            storage.remove(path)
+            removed += 1
+    return removed
+
+
+def cache_path(directory: str, key) -> str:
+    """The path a key is written to."""
+    return os.path.join(directory, f"{key}{SUFFIX}")
+
+
+def locate(directory: str, key) -> str:
+    """The path a key is read from: the compressed file, unless only a legacy one exists."""
+    path = cache_path(directory, key)
+    legacy = os.path.join(directory, f"{key}{LEGACY_SUFFIX}")
+    if not storage.exists(path) and storage.exists(legacy):
+        return legacy
+    return path
+
+
+def open_text(path: str) -> TextIO:
+    """Open a compressed or legacy cache file for reading as text."""
+    if path.endswith(".gz"):
+        reader = _GzipReader(storage.open_file(path, "rb"))
+        return io.TextIOWrapper(reader, encoding="utf-8")
+    return storage.open_file(path, "r", encoding="utf-8")
+
+
+def exists(directory: str, key) -> bool:
+    """Check if a key is cached in either format."""
+    return storage.exists(locate(directory, key))
+
+
+def keys(directory: str) -> list:
+    """List the keys cached in a directory, in either format."""
+    found = []
+    for filename in storage.listdir(directory):
+        for suffix in (SUFFIX, LEGACY_SUFFIX):
+            if filename.endswith(suffix):
+                key = filename[: -len(suffix)]
+                if key not in found:
+                    found.append(key)
+                break
+    return found
+
+
+def read_json(directory: str, key) -> dict:
+    """Read a cached file.
+
+    Raises:
+        FileNotFoundError: If the key is not cached.
+    """
+    with open_text(locate(directory, key)) as f:
+        return load(f)
+
+
+def write_json(directory: str, key, data: dict) -> None:
+    """Write a cached file atomically as compressed, compact JSON, replacing any
+    legacy file."""
+    with storage.atomic(cache_path(directory, key), "wb") as f:
+        f.write(_compress(data))
+    legacy = os.path.join(directory, f"{key}{LEGACY_SUFFIX}")
+    if storage.exists(legacy):
+        storage.remove(legacy)
+
+
+def migrate(directory: str) -> dict:
+    """Compress the legacy files in a cache.
+
+    Returns:
+        dict: The number of files migrated and the bytes before and after.
+    """
+    migrated, before, after = 0, 0, 0
+    for filename in storage.listdir(directory):
+        if not filename.endswith(LEGACY_SUFFIX):
+            continue
+        key = filename[: -len(LEGACY_SUFFIX)]
+        legacy = os.path.join(directory, filename)
+        before += storage.size(legacy)
+        with storage.open_file(legacy, "r", encoding="utf-8") as f:
+            data = load(f)
+        write_json(directory, key, data)
+        after += storage.size(cache_path(directory, key))
+        migrated += 1
+    return {"files": migrated, "bytes_before": before, "bytes_after": after}
+
+
+def benchmark(directory: str) -> dict:
+    """Compare the size and read time of the pretty-printed and compressed formats.
+
+    Each file is written in both formats to scratch files in the cache, through
+    the storage in use, and deleted after. The scratch files are temporary files,
+    so remove_partial deletes any a crash leaves.
+
+    Returns:
+        dict: The total bytes and read seconds of both formats for the cache.
+    """
+    stats = {"files": 0, "plain_bytes": 0, "plain_read": 0.0}
+    stats.update({"compressed_bytes": 0, "compressed_read": 0.0})
+    plain = os.path.join(directory, f"benchmark{LEGACY_SUFFIX}{TMP_SUFFIX}")
+    compressed = os.path.join(directory, f"benchmark{SUFFIX}{TMP_SUFFIX}")
+    try:
+        for key in keys(directory):
+            data = read_json(directory, key)
+            with storage.open_file(plain, "w", encoding="utf-8") as f:
+                dump(data, f, indent=4)
+            with storage.open_file(compressed, "wb") as f:
+                f.write(_compress(data))
+
+            start = time.perf_counter()
+            with storage.open_file(plain, "r", encoding="utf-8") as f:
+                load(f)
+            stats["plain_read"] += time.perf_counter() - start
+            start = time.perf_counter()
+            with storage.open_file(compressed, "rb") as f:
+                loads(gzip.decompress(f.read()))
+            stats["compressed_read"] += time.perf_counter() - start
+
+            stats["files"] += 1
+            stats["plain_bytes"] += storage.size(plain)
+            stats["compressed_bytes"] += storage.size(compressed)
+    finally:
+        for path in (plain, compressed):
+            if storage.exists(path):
+                storage.remove(path)
+    return stats
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "bench"
+    for cache in CACHES:
+        if not storage.exists(cache):
+            continue
+        if command == "migrate":
+            print(cache, migrate(cache))
+        elif command == "bench":
+            print(cache, benchmark(cache))
+        else:
+            print("Usage: python cache.py [migrate|bench]")
+            break
@@ -0,0 +1,134 @@
+"""
+This module tunes the number of requests in flight to the Concept2 API.
+
+Each endpoint (results, strokes, profile) gets its own AdaptiveLimiter, which
+follows additive increase, multiplicative decrease (AIMD): every successful
+request adds 1 / limit to the limit, so it grows by about one per round trip,
+while a 429 or 5xx response halves it. Latency is tracked as a fast and a slow
+moving average; when the recent round trips are much slower than the long-run
+baseline the server is queueing, and the limit is cut by a quarter. Only
+requests started after the last cut can cut it again, so a burst of slow or
+throttled responses counts once.
+
+Download threads wait for a slot before each request, so the thread pools can
+be sized for the highest limit.
+
+Classes:
+- AdaptiveLimiter: An AIMD limit on the requests in flight to one endpoint.
+"""
+
+import threading
+import time
+
+INITIAL_LIMIT = 4
+MIN_LIMIT = 1
+MAX_LIMIT = 32
+BACKOFF = 0.5
+LATENCY_BACKOFF = 0.75
+# Recent latency above this multiple of the baseline counts as congestion
+LATENCY_TOLERANCE = 2.0
+RECENT_WEIGHT = 0.2
+BASELINE_WEIGHT = 0.02
+THROTTLED = (429, 500, 502, 503, 504)
+
+
+class AdaptiveLimiter:
+    """An AIMD limit on the requests in flight to one endpoint."""
+
+    def __init__(
+        self,
+        initial: float = INITIAL_LIMIT,
+        minimum: float = MIN_LIMIT,
+        maximum: float = MAX_LIMIT,
+    ):
+        """
+        Args:
+            initial (float): The starting number of requests in flight.
+            minimum (float): The lowest the limit is cut to.
+            maximum (float): The highest the limit grows to.
+        """
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.in_flight = 0
+        self.latency = None
+        self.baseline = None
+        self.requests = 0
+        self.throttled = 0
+        self.peak = 0
+        self.started = None
+        self._last_cut = 0.0
+        self._condition = threading.Condition()
+
+    def acquire(self) -> float:
+        """Wait for a free slot.
+
+        Returns:
+            float: The time the request started, to be passed to release.
+        """
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                self._condition.wait()
+            self.in_flight += 1
+            self.peak = max(self.peak, self.in_flight)
+            now = time.perf_counter()
+            if self.started is None:
+                self.started = now
+            return now
+
+    def release(self, started: float, status: int) -> None:
+        """Free a slot and adjust the limit from the outcome of the request.
+
+        Args:
+            started (float): The time returned by acquire.
+            status (int): The HTTP status code, or 0 if the request failed.
+        """
+        latency = time.perf_counter() - started
+        with self._condition:
+            self.in_flight -= 1
+            self.requests += 1
+            if status in THROTTLED or status == 0:
+                self.throttled += 1
+                self._cut(started, BACKOFF)
+            else:
+                self.latency = _average(self.latency, latency, RECENT_WEIGHT)
+                self.baseline = _average(self.baseline, latency, BASELINE_WEIGHT)
+                if self.latency > LATENCY_TOLERANCE * self.baseline:
+                    self._cut(started, LATENCY_BACKOFF)
+                else:
+                    self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self._condition.notify_all()
+
+    def _cut(self, started: float, factor: float) -> None:
+        if started > self._last_cut:
+            self.limit = max(self.minimum, self.limit * factor)
+            self._last_cut = time.perf_counter()
+
+    def reset_stats(self) -> None:
+        """Start counting requests afresh, keeping the limit learned so far."""
+        with self._condition:
+            self.requests = self.throttled = self.peak = 0
+            self.started = None
+
+    def stats(self) -> dict:
+        """Get the current limit and the throughput since the first request.
+
+        Returns:
+            dict: The limit, peak requests in flight, request and throttled counts,
+            recent latency in seconds and requests per second.
+        """
+        with self._condition:
+            elapsed = time.perf_counter() - self.started if self.started else 0
+            return {
+                "limit": round(self.limit, 1),
+                "peak": self.peak,
+                "requests": self.requests,
+                "throttled": self.throttled,
+                "latency": round(self.latency, 3) if self.latency else None,
+                "throughput": round(self.requests / elapsed, 1) if elapsed else 0.0,
+            }
+
+
+def _average(average: float, value: float, weight: float) -> float:
+    """Update an exponential moving average."""
+    return value if average is None else (1 - weight) * average + weight * value
@@ -4,9 +4,11 @@ This module provides functions for converting and formatting data.
 Functions:
 - calculate_split(time_tenths:int, distance_m:int) -> str: Calculates split for a distance and time
 - split_to_watts(split:str) -> int: Converts split to watts using the formula watts = 2.80 / pace^3
+- split_seconds_to_watts(split_seconds) -> float: Converts splits in seconds per 500m to watts, element-wise for arrays
 - time_to_real(time:int) -> str: Converts a time in tenths of a second to a time in 'm:ss.f' format
 - watts_to_split(watts:float) -> str: Converts watts to split time using pace = (2.8 / watts)^(1/3)
 - format_name(name:str) -> str: Formats a name from 'First Last' to 'Last, First'
+- split_tenths(time_tenths:int, distance_m:float) -> float: Calculates split in tenths of a second per 500m
 """
 
 def calculate_split(time_tenths:int, distance_m:int) -> str:
@@ -39,9 +41,22 @@ def split_to_watts(split:str) -> int:
     """
     minutes, seconds = split.split(":")
     seconds = float(minutes) * 60 + float(seconds)
-    pace = seconds / 500
-    watts = 2.80 / pace**3
-    return round(watts)
+    return round(split_seconds_to_watts(seconds))
+
+
+def split_seconds_to_watts(split_seconds):
+    """
+    Converts splits in seconds per 500m to watts using the formula watts = 2.80 / pace^3,
+    where pace is in seconds per meter.
+
+    Args:
+        split_seconds (float or np.ndarray): The splits in seconds per 500m
+
+    Returns:
+        float or np.ndarray: The watts of each split
+    """
+    pace = split_seconds / 500
+    return 2.80 / pace**3
 
 
 def time_to_real(time:int) -> str:
@@ -106,3 +121,17 @@ def format_name(name:str) -> str:
     if len(name) == 3:
         return f"{name[1]} {name[2]}, {name[0]}"
     return f"{name[1]}, {name[0]}"
+
+
+def split_tenths(time_tenths:int, distance_m:float) -> float:
+    """
+    Calculates the split for a given distance and time, as a number for sorting.
+
+    Args:
+        time_tenths (int): The time in tenths of a second
+        distance_m (float): The distance in meters
+
+    Returns:
+        float: The split in tenths of a second per 500m
+    """
+    return time_tenths * 500 / distance_m
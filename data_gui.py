@@ -1,49 +1,24 @@
 """
 This module provides a graphical user interface for managing a user database.
-It allows users to insert, remove, update, and retrieve user information
+It allows users to insert, remove, update, and retrieve user information,
+and to import or export the whole roster as a CSV or JSON file (see roster.py).
 
 Functions:
-- create_table(): Create the users table in the database.
 - update_pb(user_id, option, pb): Update the PB of a user for a specific workout.
 - execute_sql(sql, params=None): Connect to the database and execute an SQL command.
 """
 
-from os import listdir, remove
-from sqlite3 import connect, Error
+from sqlite3 import Error
 import PySimpleGUI as sg
 
-
-def create_table():
-    """Create the users table in the database."""
-    con = connect("data/user_database.db")
-    marker = con.cursor()
-    marker.execute(
-        """
-        CREATE TABLE IF NOT EXISTS users (
-            user_id TEXT PRIMARY KEY,
-            name TEXT,
-            lightweight BOOLEAN,
-            novice BOOLEAN
-            One_Minute TEXT,
-            One_KM TEXT,
-            Two_KM TEXT,
-            Six_KM TEXT,
-            Hour TEXT,
-            Fourx1K TEXT,
-            Threex6k TEXT,
-            Threex12Min TEXT,
-            Threex30Min TEXT,
-            Peak_Power INTEGER
-        )
-    """
-    )
-    con.commit()
-    con.close()
+from roster import create_table, export_roster, import_roster
+import storage
+from storage import DATABASE, connect
 
 
 def update_pb(uid, workout, pr):
     """Update the PB of a user for a specific workout"""
-    con = connect("data/user_database.db")
+    con = connect(DATABASE)
     marker = con.cursor()
     marker.execute(f"UPDATE users SET {workout} = ? WHERE user_id = ?", (pr, uid))
     con.commit()
@@ -88,6 +63,10 @@ layout = [
         sg.Button("Get List of Users", key="-GET-LIST-"),
         sg.Button("Get List of PBs", key="-GET-PB-"),
     ],
+    [
+        sg.Button("Import Roster", key="-IMPORT-"),
+        sg.Button("Export Roster", key="-EXPORT-"),
+    ],
     [sg.Output(size=(60, 10), key="-OUTPUT-")],
     [sg.Button("Exit")],
 ]
@@ -101,7 +80,7 @@ window = sg.Window("User Database", layout, icon="resources/VarsityV.ico")
 def execute_sql(sql, params=None):
     """Connect to the database and execute an SQL command."""
     # Connect to the database
-    con = connect("data/user_database.db")
+    con = connect(DATABASE)
     # Create a cursor object to execute SQL commands
     marker = con.cursor()
     # Execute the SQL command with or without parameters
@@ -110,8 +89,8 @@ def execute_sql(sql, params=None):
     else:
         marker.execute(sql)
     # Commit the changes and close the connection
-    conn.commit()
-    conn.close()
+    con.commit()
+    con.close()
 
 
 # Create a loop to read the events and values from the window
@@ -156,8 +135,8 @@ while True:
                 window["-NAME-"].update("")
                 window["-LIGHTWEIGHT-"].update(False)
                 window["-NOVICE-"].update(False)
-                if f"{user_id}.json" in listdir("data"):
-                    remove(f"data/{user_id}.json")
+                if storage.exists(f"data/{user_id}.json"):
+                    storage.remove(f"data/{user_id}.json")
             except Error as e:
                 print(f"Error: {e}")
         else:
@@ -177,10 +156,27 @@ while True:
         else:
             print("Please enter a user ID, a PB option, and a PB.")
 
+    elif event in ("-IMPORT-", "-EXPORT-"):
+        file_types = (("Roster", "*.csv *.json"),)
+        if event == "-IMPORT-":
+            path = sg.popup_get_file("Roster to import", file_types=file_types)
+        else:
+            path = sg.popup_get_file(
+                "Export the roster to", save_as=True, file_types=file_types
+            )
+        if path:
+            try:
+                if event == "-IMPORT-":
+                    print(f"Imported {import_roster(path)} athletes from {path}.")
+                else:
+                    print(f"Exported {export_roster(path)} athletes to {path}.")
+            except (Error, OSError, ValueError) as e:
+                print(f"Error: {e}")
+
     elif event == "-GET-LIST-":
         try:
             # Connect to the database
-            conn = connect("data/user_database.db")
+            conn = connect(DATABASE)
             # Create a cursor object to execute SQL commands
             cursor = conn.cursor()
             # Get all data from the users table
@@ -203,7 +199,7 @@ while True:
 
     elif event == "-GET-PB-":
         try:
-            conn = connect("data/user_database.db")
+            conn = connect(DATABASE)
             cursor = conn.cursor()
             cursor.execute("SELECT * FROM users")
             users = cursor.fetchall()
@@ -7,8 +7,9 @@ Functions:
     - get_name(user_id) -> str: Get the name of a user given their user ID.
     - get_number_users() -> int: Get the number of users in the database.
     - get_pb(user_id, option) -> int: Get the PB of a user given a user ID and option.
+    - get_roster() -> dict: Get the name and roster flags of every user.
 """
-from sqlite3 import connect
+from storage import DATABASE, connect
 
 
 def get_list_user_ids()->list[int]:
@@ -17,7 +18,7 @@ def get_list_user_ids()->list[int]:
     Returns:
         list: A list of all user IDs.
     """
-    conn = connect("data/user_database.db")
+    conn = connect(DATABASE)
     cursor = conn.cursor()
     cursor.execute("SELECT user_id FROM users")
     user_ids = cursor.fetchall()
@@ -36,7 +37,7 @@ def get_name(user_id: int) -> str:
     Returns:
         str: The name of the user with the given ID, or a message if no user is found.
     """
-    conn = connect("data/user_database.db")
+    conn = connect(DATABASE)
     cursor = conn.cursor()
     cursor.execute("SELECT name FROM users WHERE user_id = ?", (user_id,))
     result = cursor.fetchone()
@@ -65,7 +66,7 @@ def get_pb(user_id: int, option: str) -> int:
     Returns:
         int: PB of the user with the given ID and option, or a message if no user is found.
     """
-    conn = connect("data/user_database.db")
+    conn = connect(DATABASE)
     cursor = conn.cursor()
     query = f"SELECT {option} FROM users WHERE user_id = ?"
     cursor.execute(query, (user_id,))
@@ -75,6 +76,25 @@ def get_pb(user_id: int, option: str) -> int:
         return result[0]
     else:
         return f"No user found with ID {user_id}"
+
+
+def get_roster() -> dict:
+    """Get the name, lightweight and novice flags of every user.
+
+    Returns:
+        dict: The name, lightweight and novice flags keyed by user ID.
+    """
+    conn = connect(DATABASE)
+    cursor = conn.cursor()
+    cursor.execute("SELECT user_id, name, lightweight, novice FROM users")
+    roster = {
+        int(user_id): {"name": name, "lightweight": bool(lw), "novice": bool(nov)}
+        for user_id, name, lw, nov in cursor.fetchall()
+    }
+    conn.close()
+    return roster
+
+
 if __name__ == "__main__":
     print(get_list_user_ids())
     print(get_name(1524007))
@@ -1,75 +1,303 @@
 """
 This module provides functions for downloading data from the Concept2 Log API.
 
+An expired access token is refreshed once, however many threads hit it, and the
+requests it failed are sent again with the new token, so a long sync outlives
+the token it started with.
+
 Functions:
+- request: Get a URL within the adaptive concurrency limit of its endpoint.
+- send: Send a request, retrying throttled and failed ones.
+- refresh_access_token: Get a new access token with the saved refresh token.
+- replace_token: Get the access token replacing an expired one, refreshing it once.
+- stats: Get the concurrency and throughput of each endpoint.
 - get_page: Get the next page of results and save it to a file.
+- get_all_pages: Get every page of an endpoint, following its pagination links.
 - get_page2: Get the next page of results and save it to a file.
-- get_results: Get the results for all users in the database and save them to a file.
+- merge_results: Merge the results of a user since a date into their saved results.
 - get_stroke_data: Get the stroke data for a specific result and save it to a file.
+- get_profile: Get the profile of a user.
 - get_age: Get the age of a user.
 """
 
-import concurrent.futures
-from json import dump
-from datetime import datetime, timedelta
+import logging
+import os
+import threading
+import time
+from datetime import datetime
 
 from requests import get
+from requests.exceptions import HTTPError, RequestException
 
+import cache
+from concurrency import MAX_LIMIT, THROTTLED, AdaptiveLimiter
 from database_request import get_list_user_ids as glui
 
-API_ROOT = "https://log.concept2.com"
+API_ROOT = os.environ.get("VALKYRIE_API_ROOT", "https://log.concept2.com")
+
+MAX_RETRIES = 3
+# Threads only wait for a slot, so the pools are sized for the highest limit
+MAX_WORKERS = MAX_LIMIT
+LIMITERS = {
+    "results": AdaptiveLimiter(),
+    "strokes": AdaptiveLimiter(),
+    "profile": AdaptiveLimiter(),
+}
+
+UNAUTHORIZED = 401
+# Seconds before the refresh of an expired token is tried again after failing
+REFRESH_RETRY = 60
 
 access_tokens = {}
 refresh_tokens = {}
+# Each expired access token and the token that replaced it
+replaced_tokens = {}
+# Each expired access token and when its refresh last failed
+failed_refreshes = {}
+refresh_lock = threading.Lock()
+
+
+def bearer(headers):
+    """Get the access token of the Authorization header, or None."""
+    value = headers.get("Authorization", "")
+    return value[len("Bearer ") :] if value.startswith("Bearer ") else None
+
+
+def latest_token(token):
+    """Follow the refreshes of an access token to the newest one."""
+    while replaced_tokens.get(token) is not None:
+        token = replaced_tokens[token]
+    return token
+
+
+def refresh_access_token():
+    """Get a new access token with the saved refresh token, or None."""
+    import authorization as auth  # pylint: disable=import-outside-toplevel
+
+    return auth.refresh(auth.read_refresh_token())[0]
+
+
+def replace_token(expired):
+    """Get the access token replacing an expired one, refreshing it only once.
+
+    The first thread to hit an expired token refreshes it; the others wait for
+    that refresh and share its token. Returns None if the refresh failed, and
+    the expired token is kept so it is refreshed again after REFRESH_RETRY
+    seconds."""
+    with refresh_lock:
+        if expired in replaced_tokens:
+            return latest_token(expired)
+        failed = failed_refreshes.get(expired)
+        if failed is not None and time.monotonic() - failed < REFRESH_RETRY:
+            return None
+        try:
+            token = refresh_access_token()
+        except (RequestException, OSError, ValueError) as e:
+            logging.error("Could not refresh the access token: %s", e)
+            token = None
+        # The same token back would loop, so it counts as a failed refresh
+        if token is None or token == expired:
+            failed_refreshes[expired] = time.monotonic()
+            logging.warning("The access token expired and was not refreshed")
+            return None
+        failed_refreshes.pop(expired, None)
+        replaced_tokens[expired] = token
+        logging.info("Refreshed the expired access token")
+        return latest_token(expired)
+
+
+def request(kind, url, headers):
+    """Get a URL within the adaptive concurrency limit of its endpoint.
+
+    Headers carrying an access token that was refreshed are sent with the new
+    token. A 401 response refreshes the token (see replace_token) and the request
+    is sent again; if the token cannot be refreshed, HTTPError is raised rather
+    than returning the error body to be saved as data."""
+    token = bearer(headers)
+    if token is not None and latest_token(token) != token:
+        headers = {**headers, "Authorization": f"Bearer {latest_token(token)}"}
+    res = send(kind, url, headers)
+    # The new token may itself expire before a request that waited for it is sent
+    for _ in range(MAX_RETRIES):
+        if res.status_code != UNAUTHORIZED or bearer(headers) is None:
+            break
+        token = replace_token(bearer(headers))
+        if token is None:
+            break
+        headers = {**headers, "Authorization": f"Bearer {token}"}
+        res = send(kind, url, headers)
+    if res.status_code == UNAUTHORIZED:
+        raise HTTPError(f"Unauthorized: {url}", response=res)
+    return res
+
+
+def send(kind, url, headers):
+    """Send a request within the adaptive concurrency limit of its endpoint.
+
+    Throttled (429 or 5xx) and failed requests are retried up to MAX_RETRIES
+    times, waiting for the Retry-After header or an exponential backoff."""
+    limiter = LIMITERS[kind]
+    for attempt in range(MAX_RETRIES + 1):
+        started = limiter.acquire()
+        try:
+            res = get(url, headers=headers, timeout=10)
+        except RequestException as e:
+            limiter.release(started, 0)
+            if attempt == MAX_RETRIES:
+                raise
+            logging.info("Retrying %s after %r", url, e, extra={"attempt": attempt})
+            time.sleep(2**attempt)
+            continue
+        limiter.release(started, res.status_code)
+        if res.status_code not in THROTTLED or attempt == MAX_RETRIES:
+            return res
+        logging.info(
+            "Retrying %s after status %d",
+            url,
+            res.status_code,
+            extra={"attempt": attempt},
+        )
+        try:
+            time.sleep(float(res.headers.get("Retry-After", 2**attempt)))
+        except ValueError:
+            time.sleep(2**attempt)
+    return res
+
+
+def stats(reset=False):
+    """Get the concurrency limit and throughput of each endpoint.
+
+    With reset, the counts start afresh afterwards, keeping the learned limits."""
+    snapshot = {kind: limiter.stats() for kind, limiter in LIMITERS.items()}
+    if reset:
+        for limiter in LIMITERS.values():
+            limiter.reset_stats()
+    return snapshot
 
 
 def get_page(next_page, headers, user_id, output):
-    """Get the next page of results and save it to a file."""
-    res = get(next_page, headers=headers, timeout=10)
-    outfile = f'{output}/{str(user_id)}.json'
-    with open(outfile, "w", encoding="utf-8") as f:
-        dump(res.json(), f, indent=4)
+    """Get the next page of results and save it to a file.
 
+    Only a successful response with data is saved. An error body, e.g. of a 404
+    or of a 503 once the retries run out, is logged and not cached, so the
+    request is made again next time. Returns True if the page was saved."""
+    res = request(output, next_page, headers)
+    try:
+        body = res.json()
+    except ValueError:
+        body = None
+    if res.status_code // 100 != 2 or not isinstance(body, dict) or "data" not in body:
+        logging.warning(
+            "Not saving %s %s: status %d, %s",
+            output,
+            user_id,
+            res.status_code,
+            body if body is not None else res.text[:200],
+        )
+        return False
+    cache.write_json(output, user_id, body)
+    return True
 
 
-def get_results(api_token, days):
-    """Get the results for all users in the database and save them to a file."""
-    date = (datetime.today() - timedelta(days=days)).strftime("%Y-%m-%d")
-    headers = {"Authorization": f"Bearer {api_token}"}
-    users = glui()
+def next_link(body):
+    """Get the link to the next page from the pagination of a response body."""
+    links = body.get("meta", {}).get("pagination", {}).get("links")
+    return links.get("next") if isinstance(links, dict) else None
+
 
-    def fetch_and_update(user):
-        endpoint = f"{API_ROOT}/api/users/{user}/results?from={date}"
-        get_page(endpoint, headers, user, 'json')
-        print(f"User ID {user} updated successfully.")
+def get_all_pages(endpoint, headers, kind="results"):
+    """Get every page of an endpoint, following its pagination links.
 
-    # Use a ThreadPoolExecutor to run `fetch_and_update` in multiple threads
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        executor.map(fetch_and_update, users)
+    Returns the combined data, or the body of the first page that has no data."""
+    body = request(kind, endpoint, headers).json()
+    if "data" not in body:
+        return body
+    data, next_page = body["data"], next_link(body)
+    while next_page:
+        body = request(kind, next_page, headers).json()
+        if "data" not in body:
+            return body
+        data += body["data"]
+        next_page = next_link(body)
+    return {"data": data}
 
-    # Wait for all threads to complete
-    executor.shutdown(wait=True)
+
+def merge_results(user, headers, since, keep_from, manifest=None):
+    """Merge the results of a user since a date into their saved results.
+
+    Saved results from before keep_from are dropped. With a manifest, the user is
+    recorded as done or failed. Returns the new results and all saved results of
+    the user, newest first; a failed request leaves the saved results as they were."""
+    endpoint = f"{API_ROOT}/api/users/{user}/results?from={since}"
+    new = get_all_pages(endpoint, headers)
+    saved = {"data": []}
+    if cache.exists("json", user):
+        saved = cache.read_json("json", user)
+    if "data" not in new:
+        logging.warning(
+            "Results of user %s could not be updated: %s",
+            user,
+            new,
+            extra={"user_id": user},
+        )
+        if manifest is not None:
+            manifest.failed(f"results/{user}", str(new))
+        return [], saved.get("data", [])
+    merged = {
+        result["id"]: result
+        for result in saved.get("data", [])
+        if result["date"][:10] >= keep_from
+    }
+    merged.update((result["id"], result) for result in new["data"])
+    results = sorted(merged.values(), key=lambda x: x["date"], reverse=True)
+    cache.write_json("json", user, {"data": results})
+    logging.debug(
+        "Merged %d new results of user %s",
+        len(new["data"]),
+        user,
+        extra={"user_id": user},
+    )
+    if manifest is not None:
+        manifest.done(f"results/{user}", results=new["data"])
+    return new["data"], results
 
 
 def get_stroke_data(user_id, result_id, api_token):
-    """Get the stroke data for a specific result and save it to a file."""
+    """Get the stroke data for a specific result and save it to a file.
+
+    Stroke data never changes once a result is logged, so saved files are kept.
+    Returns True if the stroke data is saved, False if the request failed."""
+    if cache.exists("strokes", result_id):
+        return True
     headers = {"Authorization": f"Bearer {api_token}"}
     endpoint = f"{API_ROOT}/api/users/{user_id}/results/{result_id}/strokes"
-    get_page(endpoint, headers, result_id, 'strokes')
+    if not get_page(endpoint, headers, result_id, 'strokes'):
+        return False
+    logging.debug(
+        "Downloaded strokes of result %s",
+        result_id,
+        extra={"user_id": user_id, "result_id": result_id},
+    )
+    return True
 
 
-def get_age(user_id, api_token):
-    """Get the age of a user."""
-    headers = {
-        "Authorization": "Bearer " + str(api_token),
-    }
+def get_profile(user_id, api_token):
+    """Get the profile of a user.
 
-    response = get(API_ROOT + "/api/users/" + str(user_id), headers=headers, timeout=10)
+    Raises ValueError if the response has no profile, e.g. for an expired token."""
+    headers = {"Authorization": f"Bearer {api_token}"}
+    response = request("profile", f"{API_ROOT}/api/users/{user_id}", headers)
+    body = response.json()
+    if "data" not in body:
+        raise ValueError(f"No profile for user {user_id}: {body}")
+    return body["data"]
+
+
+def get_age(user_id, api_token):
+    """Get the age of a user.
 
-    data = response.json()
-    dob = data["data"].get(
-        "dob"
-    )  # access 'dob' from the 'data' dictionary within 'data'
+    This makes a request every time; rankings use the cached profiles instead."""
+    dob = get_profile(user_id, api_token).get("dob")
     dob = datetime.strptime(str(dob), "%Y-%m-%d")
     now = datetime.now()
     age = now.year - dob.year
@@ -0,0 +1,495 @@
+"""
+This module provides a local stand-in for the Concept2 Log API, serving synthetic
+results and stroke data so the downloader can be load and latency tested offline.
+
+Point the downloader and authorization modules at it with the VALKYRIE_API_ROOT
+environment variable, or run the built-in load test:
+
+    python fake_api.py --port 8000 --latency 50 --error-rate 0.01 --rate-limit 20
+    python fake_api.py --port 8000 --token-requests 500
+    python fake_api.py --load-test --users 100
+
+Endpoints:
+- GET /api/users/{id}: The profile of a user.
+- GET /api/users/{id}/results?from=YYYY-MM-DD&to=YYYY-MM-DD&page=N: A page of results.
+- GET /api/users/{id}/results/{result_id}/strokes: The stroke data of a result.
+- POST /oauth/access_token: A new access and refresh token.
+
+With token_requests, every access token expires after that many requests and
+is answered with a 401, as a real token expires during a long sync.
+
+Functions:
+- make_result(user_id: int, number: int, days: int, end: datetime) -> dict: Generate a result.
+- make_results(user_id: int, days: int, end: datetime) -> list: Generate the results of a user.
+- make_strokes(result: dict) -> list: Generate the stroke data of a result.
+- serve(port: int, **options) -> ThreadingHTTPServer: Start the server in a thread.
+- load_test(users: int, **options) -> dict: Time the downloader against the server.
+"""
+
+import argparse
+import concurrent.futures
+import random
+import re
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from json import dumps
+from urllib.parse import parse_qs, urlparse
+
+import storage
+from concurrency import AdaptiveLimiter
+from workouts import BIKE_DISTANCE_FACTOR, DISTANCE, WORKOUTS
+
+RESULTS_PER_USER = 10
+PER_PAGE = 50
+DAYS = 21
+STROKE_TENTHS = 25
+TOKEN = "fake-access-token"
+RESULT_ID_FACTOR = 1000
+
+PROFILE_PATH = re.compile(r"^/api/users/(\d+)$")
+RESULTS_PATH = re.compile(r"^/api/users/(\d+)/results$")
+STROKES_PATH = re.compile(r"^/api/users/(\d+)/results/(\d+)/strokes$")
+
+
+def make_result(
+    user_id: int, number: int, days: int = DAYS, end: datetime = None
+) -> dict:
+    """Generate a result of a user, always the same for the same arguments.
+
+    Args:
+        user_id (int): The ID of the user.
+        number (int): The number of the result for the user.
+        days (int): The number of days the results are spread over.
+        end (datetime, optional): The time the results are spread back from.
+            Defaults to the start of today, so results only change once a day.
+
+    Returns:
+        dict: The result in the format of the Concept2 API.
+    """
+    rng = random.Random(user_id * RESULT_ID_FACTOR + number)
+    name = rng.choice(list(WORKOUTS))
+    spec = WORKOUTS[name]
+    erg = "bike" if rng.random() < 0.1 else "rower"
+    pace = rng.uniform(950, 1300)  # tenths of a second per 500m
+    if name == "peak_power":
+        spec = {**spec, "value": rng.choice([100, 150, 200])}
+    if spec["measure"] == DISTANCE:
+        distance = spec["value"]
+        total_time = round(distance / 500 * pace)
+    else:
+        total_time = spec["value"]
+        distance = round(total_time / pace * 500)
+    intervals = []
+    if spec["kind"].startswith("intervals"):
+        count = spec["intervals"]
+        intervals = [
+            {
+                "type": "distance" if spec["measure"] == DISTANCE else "time",
+                "distance": distance // count,
+                "time": total_time // count,
+                "rest_time": 1200,
+                "stroke_rate": rng.randint(20, 32),
+            }
+            for _ in range(count)
+        ]
+        distance, total_time = (
+            sum(i["distance"] for i in intervals),
+            sum(i["time"] for i in intervals),
+        )
+    factor = BIKE_DISTANCE_FACTOR if erg == "bike" else 1
+    if end is None:
+        end = datetime.combine(datetime.today(), datetime.min.time())
+    date = end - timedelta(days=rng.uniform(0, days))
+    result = {
+        "id": user_id * RESULT_ID_FACTOR + number,
+        "user_id": user_id,
+        "date": date.strftime("%Y-%m-%d %H:%M:%S"),
+        "timezone": "America/Vancouver",
+        "distance": distance * factor,
+        "type": erg,
+        "time": total_time,
+        "time_formatted": "",
+        "workout_type": (spec["workout_types"] or ("FixedDistanceSplits",))[0],
+        "verified": True,
+        "ranked": False,
+        "stroke_rate": rng.randint(20, 36),
+        "stroke_data": True,
+    }
+    if intervals:
+        for interval in intervals:
+            interval["distance"] *= factor
+        result["workout"] = {"intervals": intervals}
+    return result
+
+
+def make_results(user_id: int, days: int = DAYS, end: datetime = None) -> list:
+    """Generate the results of a user, newest first.
+
+    Args:
+        user_id (int): The ID of the user.
+        days (int): The number of days the results are spread over.
+        end (datetime, optional): The time the results are spread back from.
+            Defaults to the start of today.
+
+    Returns:
+        list: The results in the format of the Concept2 API.
+    """
+    results = [make_result(user_id, n, days, end) for n in range(RESULTS_PER_USER)]
+    return sorted(results, key=lambda x: x["date"], reverse=True)
+
+
+def make_strokes(result: dict) -> list:
+    """Generate the stroke data of a result.
+
+    Time (t) is in tenths of a second, distance (d) in decimeters and pace (p) in
+    tenths per 500m, or per 1000m on a bike. Time and distance restart at zero at
+    the start of every interval, as in the Concept2 API.
+
+    Args:
+        result (dict): The result to generate stroke data for.
+
+    Returns:
+        list: The strokes in the format of the Concept2 API.
+    """
+    rng = random.Random(result["id"])
+    pieces = result.get("workout", {}).get("intervals") or [result]
+    # Bike paces are per 1000m, in decimeters here
+    pace_length = 10000 if result["type"] == "bike" else 5000
+    strokes = []
+    for piece in pieces:
+        t, total_t, total_d = 0, piece["time"], piece["distance"] * 10
+        while t < total_t:
+            t = min(t + STROKE_TENTHS + rng.randint(-3, 3), total_t)
+            pace = round(total_t / (total_d / pace_length) * rng.uniform(0.95, 1.05))
+            strokes.append(
+                {
+                    "t": t,
+                    "d": round(total_d * t / total_t),
+                    "p": pace,
+                    "spm": rng.randint(18, 36),
+                    "hr": rng.randint(120, 195),
+                }
+            )
+    return strokes
+
+
+def make_profile(user_id: int) -> dict:
+    """Generate the profile of a user."""
+    rng = random.Random(user_id)
+    dob = datetime(rng.randint(1995, 2006), rng.randint(1, 12), rng.randint(1, 28))
+    return {
+        "id": user_id,
+        "username": f"user{user_id}",
+        "first_name": "Fake",
+        "last_name": f"User{user_id}",
+        "gender": rng.choice(["M", "F"]),
+        "dob": dob.strftime("%Y-%m-%d"),
+        "weight_class": rng.choice(["H", "L"]),
+        "country": "CAN",
+    }
+
+
+class RateLimiter:
+    """A token bucket allowing a number of requests per second."""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.tokens = rate
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Take a token from the bucket if one is left."""
+        if not self.rate:
+            return True
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+class TokenIssuer:
+    """The access tokens of the fake API, each expiring after a number of requests."""
+
+    def __init__(self, lifetime):
+        self.lifetime = lifetime
+        self.remaining = {TOKEN: lifetime}
+        self.issued = 0
+        self.lock = threading.Lock()
+
+    def use(self, token) -> bool:
+        """Count a request made with a token, returning False once it expired."""
+        if not self.lifetime:
+            return True
+        with self.lock:
+            left = self.remaining.get(token, 0)
+            if left <= 0:
+                return False
+            self.remaining[token] = left - 1
+            return True
+
+    def issue(self) -> str:
+        """Issue a new access token, the same one if tokens never expire."""
+        if not self.lifetime:
+            return TOKEN
+        with self.lock:
+            self.issued += 1
+            token = f"{TOKEN}-{self.issued}"
+            self.remaining[token] = self.lifetime
+            return token
+
+
+class FakeAPIHandler(BaseHTTPRequestHandler):
+    """Handle the requests to the fake API with the options of its server."""
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        if self.server.options["verbose"]:
+            super().log_message(format, *args)
+
+    def send_json(self, status, body, headers=None):
+        """Send a JSON response."""
+        payload = dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def misbehave(self) -> bool:
+        """Apply the latency, rate limit and error rate; True if a response was sent."""
+        options = self.server.options
+        time.sleep(max(0, random.gauss(options["latency"], options["jitter"])) / 1000)
+        if not self.server.limiter.allow():
+            self.send_json(429, {"message": "Too Many Attempts."}, {"Retry-After": "1"})
+            return True
+        if random.random() < options["error_rate"]:
+            self.send_json(500, {"message": "Server Error"})
+            return True
+        return False
+
+    def authorized(self) -> bool:
+        """Check the bearer token; a 401 response is sent if it is missing or expired."""
+        value = self.headers.get("Authorization", "")
+        if value.startswith("Bearer ") and self.server.tokens.use(value[7:]):
+            return True
+        self.send_json(401, {"error": "unauthenticated", "message": "Unauthenticated."})
+        return False
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """Serve the profile, results and strokes endpoints."""
+        if self.misbehave() or not self.authorized():
+            return
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        days = self.server.options["days"]
+
+        if match := PROFILE_PATH.match(url.path):
+            self.send_json(200, {"data": make_profile(int(match[1]))})
+
+        elif match := RESULTS_PATH.match(url.path):
+            results = make_results(int(match[1]), days)
+            if "from" in query:
+                results = [r for r in results if r["date"][:10] >= query["from"][0]]
+            if "to" in query:
+                results = [r for r in results if r["date"][:10] <= query["to"][0]]
+            page = int(query.get("page", ["1"])[0])
+            per_page = self.server.options["per_page"]
+            total_pages = max(1, -(-len(results) // per_page))
+            data = results[(page - 1) * per_page : page * per_page]
+            links = {}
+            if page < total_pages:
+                query["page"] = [str(page + 1)]
+                params = "&".join(f"{k}={v[0]}" for k, v in query.items())
+                links["next"] = f"{self.server.root}{url.path}?{params}"
+            pagination = {
+                "total": len(results),
+                "count": len(data),
+                "per_page": per_page,
+                "current_page": page,
+                "total_pages": total_pages,
+                "links": links,
+            }
+            self.send_json(200, {"data": data, "meta": {"pagination": pagination}})
+
+        elif match := STROKES_PATH.match(url.path):
+            user_id, result_id = int(match[1]), int(match[2])
+            number = result_id - user_id * RESULT_ID_FACTOR
+            if not 0 <= number < RESULTS_PER_USER:
+                self.send_json(404, {"message": "Result not found."})
+                return
+            result = make_result(user_id, number, days)
+            self.send_json(200, {"data": make_strokes(result)})
+
+        else:
+            self.send_json(404, {"message": "Not found."})
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        """Serve the token endpoint."""
+        if self.misbehave():
+            return
+        if urlparse(self.path).path != "/oauth/access_token":
+            self.send_json(404, {"message": "Not found."})
+            return
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.send_json(
+            200,
+            {
+                "access_token": self.server.tokens.issue(),
+                "refresh_token": "fake-refresh-token",
+                "token_type": "Bearer",
+                "expires_in": 604800,
+            },
+        )
+
+
+class FakeAPIServer(ThreadingHTTPServer):
+    """A threading server with a listen backlog deep enough for bursts of clients.
+
+    The default backlog of 5 drops connections under load, and the client's
+    retransmit adds a second to those requests.
+    """
+
+    daemon_threads = True
+    request_queue_size = 128
+
+
+def serve(
+    port=0,
+    latency=0,
+    jitter=0,
+    error_rate=0.0,
+    rate_limit=0,
+    days=DAYS,
+    verbose=False,
+    token_requests=0,
+):
+    """Start the fake API in a background thread.
+
+    Args:
+        port (int): The port to listen on, 0 for any free port.
+        latency (float): The mean latency of every response, in milliseconds.
+        jitter (float): The standard deviation of the latency, in milliseconds.
+        error_rate (float): The fraction of requests answered with a 500.
+        rate_limit (int): The requests per second allowed before a 429, 0 for no limit.
+        days (int): The number of days the synthetic results are spread over.
+        verbose (bool): Flag indicating whether to log every request.
+        token_requests (int): The requests an access token is good for, 0 for
+            tokens that never expire.
+
+    Returns:
+        ThreadingHTTPServer: The running server; its root attribute is the API root.
+    """
+    server = FakeAPIServer(("127.0.0.1", port), FakeAPIHandler)
+    server.options = {
+        "latency": latency,
+        "jitter": jitter,
+        "error_rate": error_rate,
+        "days": days,
+        "per_page": PER_PAGE,
+        "verbose": verbose,
+    }
+    server.limiter = RateLimiter(rate_limit)
+    server.tokens = TokenIssuer(token_requests)
+    server.root = f"http://127.0.0.1:{server.server_address[1]}"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def load_test(users=100, **options) -> dict:
+    """Download results and stroke data for synthetic users with the real downloader.
+
+    The files are written to a temporary storage root, leaving the working
+    directory and the storage in use as they were.
+
+    Args:
+        users (int): The number of users to download.
+        **options: The options passed to serve.
+
+    Returns:
+        dict: The number of requests, the wall time, the throughput and the
+        concurrency chosen for each endpoint.
+    """
+    import downloader as dl  # pylint: disable=import-outside-toplevel
+
+    server = serve(**options)
+    root, dl.API_ROOT = dl.API_ROOT, server.root
+    user_ids = list(range(1, users + 1))
+    headers = {"Authorization": f"Bearer {TOKEN}"}
+    try:
+        with tempfile.TemporaryDirectory() as tmp, storage.using(
+            storage.FileStorage(tmp)
+        ):
+            start = time.perf_counter()
+            # Each run learns the limits of its own server
+            dl.LIMITERS.update((kind, AdaptiveLimiter()) for kind in dl.LIMITERS)
+            with concurrent.futures.ThreadPoolExecutor(dl.MAX_WORKERS) as executor:
+                pages = list(
+                    executor.map(
+                        lambda user: dl.get_all_pages(
+                            f"{server.root}/api/users/{user}/results", headers
+                        ),
+                        user_ids,
+                    )
+                )
+                pieces = [result for page in pages for result in page.get("data", [])]
+                list(
+                    executor.map(
+                        lambda r: dl.get_stroke_data(r["user_id"], r["id"], TOKEN),
+                        pieces,
+                    )
+                )
+            elapsed = time.perf_counter() - start
+    finally:
+        dl.API_ROOT = root
+        server.shutdown()
+
+    requests = len(user_ids) + len(pieces)
+    return {
+        "requests": requests,
+        "seconds": round(elapsed, 3),
+        "requests_per_second": round(requests / elapsed, 1),
+        "concurrency": dl.stats(),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a fake Concept2 Log API.")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0, help="mean latency in ms")
+    parser.add_argument("--jitter", type=float, default=0, help="latency std in ms")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit", type=int, default=0, help="requests/second")
+    parser.add_argument("--days", type=int, default=DAYS)
+    parser.add_argument("--token-requests", type=int, default=0)
+    parser.add_argument("--verbose", action="store_true")
+    parser.add_argument("--load-test", action="store_true")
+    parser.add_argument("--users", type=int, default=100)
+    args = parser.parse_args()
+
+    settings = {
+        "latency": args.latency,
+        "jitter": args.jitter,
+        "error_rate": args.error_rate,
+        "rate_limit": args.rate_limit,
+        "days": args.days,
+        "verbose": args.verbose,
+        "token_requests": args.token_requests,
+    }
+    if args.load_test:
+        print(load_test(args.users, **settings))
+    else:
+        fake = serve(args.port, **settings)
+        print(f"Serving the fake Concept2 API at {fake.root}")
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            fake.shutdown()
@@ -0,0 +1,354 @@
+"""
+This module reports the training intensity of the team: the time every athlete
+spent in each heart rate zone and the heart rate drift of their pieces, per week.
+
+Each stroke's time is the time from the previous stroke to it, and its zone comes
+from its heart rate and the athlete's zone thresholds. The strokes of a batch of
+pieces are concatenated into one array, so the zones and the drift of every piece
+are summed at once with np.bincount instead of a loop over strokes.
+
+Drift is the aerobic decoupling of a piece: how much its speed per heartbeat
+fell from the first half to the second, in percent. It is only computed for
+pieces with at least MIN_DRIFT_SECONDS of heart rate data.
+
+Zone thresholds are kept per athlete in the user database, as the upper heart
+rate of zones 1 to 4 or as a maximum heart rate they are derived from with
+ZONE_FRACTIONS. Athletes without either use DEFAULT_MAX_HR. Pieces are stored
+once analysed, so the weekly report only reads the new stroke files. Setting an
+athlete's zones drops their stored pieces, so the next update analyses their
+history again with the new zones:
+
+    python hr_zones.py set 1524007 --max-hr 196
+    python hr_zones.py set 1524007 --thresholds 135 152 168 181
+    python hr_zones.py update
+    python hr_zones.py report --weeks 8
+
+Functions:
+- create_tables() -> None: Create the heart rate tables in the database.
+- set_zones(user_id: int, max_hr: int, thresholds: list) -> None: Set the zones of an athlete.
+- zone_thresholds(user_ids: Iterable) -> dict: The zone thresholds of athletes.
+- read_strokes(result_id: int) -> np.ndarray: The time, pace and heart rate of a piece.
+- analyse(pieces: list, thresholds: np.ndarray) -> tuple: The zones and drift of pieces.
+- week_of(date: str) -> str: The Monday of the week of a date.
+- update_pieces(results: Iterable) -> int: Analyse new pieces.
+- weekly(since: str) -> list: The time in each zone and drift per athlete and week.
+- save_report(rows: list, path: str) -> None: Save the weekly report to Excel.
+"""
+
+import argparse
+import os
+from datetime import datetime, timedelta
+from typing import Iterable
+
+import numpy as np
+from openpyxl import Workbook
+
+import cache
+import converter as cv
+import database_request as dr
+import storage
+from storage import DATABASE, connect
+from stroke_reader import iter_stroke_records
+
+STROKES = "strokes"
+ZONES = 5
+DEFAULT_MAX_HR = 190
+# The upper heart rate of zones 1 to 4 as fractions of the maximum heart rate
+ZONE_FRACTIONS = (0.6, 0.7, 0.8, 0.9)
+MIN_DRIFT_SECONDS = 600
+TENTHS_PER_SECOND = 10
+# Pieces are read and analysed this many at a time
+BATCH = 200
+DATE_FORMAT = "%Y-%m-%d"
+ZONE_COLUMNS = [f"zone_{n}" for n in range(1, ZONES + 1)]
+
+
+def create_tables() -> None:
+    """Create the heart rate tables in the database."""
+    conn = connect(DATABASE)
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS hr_zones (
+            user_id TEXT PRIMARY KEY,
+            max_hr INTEGER,
+            zone_1 INTEGER,
+            zone_2 INTEGER,
+            zone_3 INTEGER,
+            zone_4 INTEGER
+        );
+        CREATE TABLE IF NOT EXISTS hr_pieces (
+            result_id INTEGER PRIMARY KEY,
+            user_id TEXT,
+            week TEXT,
+            zone_1 REAL,
+            zone_2 REAL,
+            zone_3 REAL,
+            zone_4 REAL,
+            zone_5 REAL,
+            drift REAL
+        );
+    """)
+    conn.commit()
+    conn.close()
+
+
+def set_zones(user_id: int, max_hr: int = None, thresholds: list = None) -> None:
+    """Set the zone thresholds of an athlete, dropping their analysed pieces so
+    the next update_pieces bins them with the new zones.
+
+    Args:
+        user_id (int): The ID of the user.
+        max_hr (int, optional): The maximum heart rate, used for any zone
+            without a threshold.
+        thresholds (list, optional): The upper heart rate of zones 1 to 4.
+
+    Raises:
+        ValueError: If there are not 4 thresholds or they are not increasing.
+    """
+    if thresholds is not None:
+        thresholds = [int(t) for t in thresholds]
+        if len(thresholds) != ZONES - 1 or sorted(set(thresholds)) != thresholds:
+            raise ValueError(f"Expected {ZONES - 1} increasing thresholds")
+    create_tables()
+    conn = connect(DATABASE)
+    with conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO hr_zones VALUES (?, ?, ?, ?, ?, ?)",
+            (str(user_id), max_hr, *(thresholds or [None] * (ZONES - 1))),
+        )
+        conn.execute("DELETE FROM hr_pieces WHERE user_id = ?", (str(user_id),))
+    conn.close()
+
+
+def zone_thresholds(user_ids: Iterable) -> dict:
+    """Get the zone thresholds of athletes.
+
+    Args:
+        user_ids (Iterable): The IDs of the users.
+
+    Returns:
+        dict: The upper heart rate of zones 1 to 4 keyed by user ID.
+    """
+    create_tables()
+    conn = connect(DATABASE)
+    saved = {
+        int(user_id): row
+        for user_id, *row in conn.execute("SELECT * FROM hr_zones").fetchall()
+    }
+    conn.close()
+    default = np.array(ZONE_FRACTIONS) * DEFAULT_MAX_HR
+    thresholds = {}
+    for user_id in user_ids:
+        if int(user_id) not in saved:
+            thresholds[user_id] = default
+            continue
+        max_hr, *bounds = saved[int(user_id)]
+        derived = np.array(ZONE_FRACTIONS) * (max_hr or DEFAULT_MAX_HR)
+        thresholds[user_id] = np.array(
+            [d if b is None else b for b, d in zip(bounds, derived)], dtype=float
+        )
+    return thresholds
+
+
+def read_strokes(result_id: int) -> np.ndarray:
+    """Read the time, pace and heart rate of every stroke of a piece.
+
+    Returns:
+        np.ndarray: The (t, p, hr) rows, with 0 for a stroke without heart rate.
+    """
+    with cache.open_text(cache.locate(STROKES, result_id)) as f:
+        rows = [(s["t"], s["p"], s.get("hr") or 0) for s in iter_stroke_records(f)]
+    return np.array(rows, dtype=float).reshape(-1, 3)
+
+
+def analyse(pieces: list, thresholds: np.ndarray) -> tuple:
+    """Compute the time in each zone and the drift of a batch of pieces.
+
+    Args:
+        pieces (list): The (t, p, hr) stroke arrays of the pieces.
+        thresholds (np.ndarray): The upper heart rate of zones 1 to 4 for each
+            piece, one row per piece.
+
+    Returns:
+        tuple: The seconds in each zone, one row per piece, and the drift of
+        each piece in percent, NaN if it has too little heart rate data.
+    """
+    count = len(pieces)
+    if count == 0:
+        return np.zeros((0, ZONES)), np.zeros(0)
+    lengths = np.array([len(strokes) for strokes in pieces])
+    strokes = np.concatenate(pieces) if lengths.sum() else np.zeros((0, 3))
+    piece = np.repeat(np.arange(count), lengths)
+    t, pace, hr = strokes[:, 0], strokes[:, 1], strokes[:, 2]
+
+    # Each stroke lasts from the previous one, or from the start of its interval
+    dt = np.diff(t, prepend=0.0)
+    restart = (dt < 0) | np.r_[True, piece[1:] != piece[:-1]][: len(t)]
+    dt = np.where(restart, t, dt) / TENTHS_PER_SECOND
+    dt[(hr <= 0) | (pace <= 0)] = 0
+
+    zone = (hr[:, None] > thresholds[piece]).sum(axis=1)
+    seconds = np.bincount(
+        piece * ZONES + zone, weights=dt, minlength=count * ZONES
+    ).reshape(count, ZONES)
+
+    # Split each piece in two halves of heart rate time, by each stroke's midpoint
+    total = seconds.sum(axis=1)
+    elapsed = np.cumsum(dt)
+    starts = np.concatenate(([0.0], np.cumsum(total)[:-1]))
+    second = (elapsed - starts[piece] - dt / 2 > total[piece] / 2).astype(int)
+    groups = piece * 2 + second
+    with np.errstate(divide="ignore", invalid="ignore"):
+        speed = np.where(pace > 0, 1 / pace, 0.0)
+        beats = np.bincount(groups, weights=dt * hr, minlength=count * 2)
+        meters = np.bincount(groups, weights=dt * speed, minlength=count * 2)
+        efficiency = (meters / beats).reshape(count, 2)
+        drift = (efficiency[:, 0] - efficiency[:, 1]) / efficiency[:, 0] * 100
+    drift[total < MIN_DRIFT_SECONDS] = np.nan
+    return seconds, drift
+
+
+def week_of(date: str) -> str:
+    """Get the Monday ('YYYY-MM-DD') of the week of a date."""
+    day = datetime.strptime(date[:10], DATE_FORMAT)
+    return (day - timedelta(days=day.weekday())).strftime(DATE_FORMAT)
+
+
+def update_pieces(results: Iterable) -> int:
+    """Analyse the pieces not analysed yet whose stroke data is saved.
+
+    Args:
+        results (Iterable): The results to include.
+
+    Returns:
+        int: The number of pieces added.
+    """
+    create_tables()
+    conn = connect(DATABASE)
+    done = {row[0] for row in conn.execute("SELECT result_id FROM hr_pieces")}
+    pending = {}
+    for result in results:
+        if result["id"] not in done and cache.exists(STROKES, result["id"]):
+            pending[result["id"]] = result
+    pending = list(pending.values())
+    thresholds = zone_thresholds({r["user_id"] for r in pending})
+
+    for start in range(0, len(pending), BATCH):
+        batch = pending[start : start + BATCH]
+        seconds, drift = analyse(
+            [read_strokes(r["id"]) for r in batch],
+            np.array([thresholds[r["user_id"]] for r in batch]).reshape(-1, ZONES - 1),
+        )
+        with conn:
+            conn.executemany(
+                "INSERT INTO hr_pieces VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        r["id"],
+                        str(r["user_id"]),
+                        week_of(r["date"]),
+                        *map(float, zones),
+                        None if np.isnan(d) else float(d),
+                    )
+                    for r, zones, d in zip(batch, seconds, drift)
+                ],
+            )
+    conn.close()
+    return len(pending)
+
+
+def weekly(since: str = None) -> list:
+    """Get the time in each zone and the drift of every athlete, per week.
+
+    Args:
+        since (str, optional): Only report the weeks from this date on.
+
+    Returns:
+        list: The rows, newest week first, as dictionaries with the user ID,
+        week, pieces, seconds in each zone, the total and the mean drift.
+    """
+    create_tables()
+    conn = connect(DATABASE)
+    zones = ", ".join(f"SUM({column})" for column in ZONE_COLUMNS)
+    cursor = conn.execute(
+        f"SELECT user_id, week, COUNT(*), {zones}, AVG(drift) FROM hr_pieces "
+        "WHERE week >= ? GROUP BY user_id, week ORDER BY week DESC, user_id",
+        (week_of(since) if since else "",),
+    )
+    rows = []
+    for user_id, week, pieces, *values in cursor:
+        seconds, drift = values[:ZONES], values[ZONES]
+        rows.append(
+            {
+                "user_id": int(user_id),
+                "week": week,
+                "pieces": pieces,
+                **dict(zip(ZONE_COLUMNS, seconds)),
+                "total": sum(seconds),
+                "drift": drift,
+            }
+        )
+    conn.close()
+    return rows
+
+
+def save_report(rows: list, path: str) -> None:
+    """Save the weekly report to an Excel file, with the time in each zone as
+    h:mm:ss and its share of the week's heart rate time.
+
+    Args:
+        rows (list): The rows, as returned by weekly.
+        path (str): The Excel file to write.
+    """
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "Weekly intensity"
+    ws.append(
+        ["Week", "Name", "Pieces"]
+        + [f"Zone {n}" for n in range(1, ZONES + 1)]
+        + [f"Zone {n} %" for n in range(1, ZONES + 1)]
+        + ["Total", "Drift %"]
+    )
+    for row in rows:
+        seconds = [row[column] for column in ZONE_COLUMNS]
+        ws.append(
+            [row["week"], cv.format_name(dr.get_name(row["user_id"])), row["pieces"]]
+            + [cv.time_to_real(s * TENTHS_PER_SECOND) for s in seconds]
+            + [round(100 * s / row["total"], 1) if row["total"] else 0 for s in seconds]
+            + [
+                cv.time_to_real(row["total"] * TENTHS_PER_SECOND),
+                None if row["drift"] is None else round(row["drift"], 1),
+            ]
+        )
+    with storage.atomic(path, "wb") as f:
+        wb.save(f)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Heart rate zones per week.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("update")
+    report = commands.add_parser("report")
+    report.add_argument("--weeks", type=int, default=4)
+    zones_parser = commands.add_parser("set")
+    zones_parser.add_argument("user_id", type=int)
+    zones_parser.add_argument("--max-hr", type=int)
+    zones_parser.add_argument("--thresholds", type=int, nargs=ZONES - 1)
+    args = parser.parse_args()
+
+    if args.command == "set":
+        set_zones(args.user_id, args.max_hr, args.thresholds)
+    else:
+        # The synced results and the backfilled history (see backfill.py)
+        saved = (
+            r
+            for directory in ("json", "history")
+            for key in cache.keys(directory)
+            for r in cache.read_json(directory, key).get("data", [])
+        )
+        print(f"Analysed {update_pieces(saved)} pieces")
+        if args.command == "report":
+            first = datetime.today() - timedelta(weeks=args.weeks)
+            today = datetime.today().strftime(DATE_FORMAT)
+            output = os.path.join("results", f"{today}_hr_zones.xlsx")
+            save_report(weekly(first.strftime(DATE_FORMAT)), output)
+            print(f"Saved {output}")
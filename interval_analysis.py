@@ -0,0 +1,214 @@
+"""
+This module analyses the stroke data of interval workouts, one row per interval:
+time, distance, average split and watts, time weighted stroke rate, peak watts
+and fade (how much slower the second half of the interval was than the first).
+
+The stroke stream of a workout is split at the interval boundaries, where the
+Concept2 time and distance counters restart after the rest, and every statistic
+is computed over all strokes of the workout at once with NumPy:
+
+    python interval_analysis.py 4x1k 3x6k --days 21
+
+Functions:
+- load_strokes(result_id) -> np.ndarray: Read the strokes of a result into an array.
+- segment(strokes: np.ndarray, result: dict) -> np.ndarray: Number the interval of each stroke.
+- analyse_strokes(strokes: np.ndarray, result: dict) -> list: The statistics per interval.
+- analyse_workout(workout_name: str, since: str, api_token: str) -> list: Analyse the roster.
+"""
+
+import argparse
+import concurrent.futures
+import os
+from datetime import datetime, timedelta
+
+import numpy as np
+
+import cache
+import converter as cv
+import database_request as dr
+import downloader as dl
+import workout_finder as wf
+from stroke_reader import stream_strokes
+from workouts import BIKE_DISTANCE_FACTOR, WORKOUTS, classify
+
+T, D, P, SPM = range(4)
+TENTHS_PER_SECOND = 10
+DECIMETERS_PER_METER = 10
+BANNER = [
+    "Name",
+    "Date",
+    "Interval",
+    "Time",
+    "Distance",
+    "Split",
+    "Watts",
+    "Peak Watts",
+    "SPM",
+    "Fade",
+]
+
+
+def load_strokes(result_id) -> np.ndarray:
+    """Read the strokes of a result into an array of (t, d, p, spm) rows."""
+    strokes = stream_strokes(cache.locate(wf.STROKES, result_id))
+    return np.array(list(strokes), dtype=float).reshape(-1, 4)
+
+
+def segment(strokes: np.ndarray, result: dict) -> np.ndarray:
+    """Number the interval each stroke belongs to.
+
+    A new interval starts where the time or distance counter goes back down.
+    If the counters never restart, the cumulative boundaries of the intervals in
+    the result summary are used instead, and time and distance are made relative
+    to the start of each interval.
+
+    Args:
+        strokes (np.ndarray): The (t, d, p, spm) rows of the workout.
+        result (dict): The result the strokes belong to.
+
+    Returns:
+        np.ndarray: The interval number of each stroke, starting at 0.
+    """
+    restarts = (np.diff(strokes[:, T]) < 0) | (np.diff(strokes[:, D]) < 0)
+    if restarts.any():
+        return np.concatenate(([0], np.cumsum(restarts)))
+
+    intervals = result.get("workout", {}).get("intervals", [])
+    if not intervals:
+        return np.zeros(len(strokes), dtype=int)
+    ends = np.cumsum([i["time"] for i in intervals])[:-1]
+    ids = np.searchsorted(ends, strokes[:, T], side="left")
+    starts = np.concatenate(([0], ends))
+    first = np.searchsorted(ids, np.arange(len(intervals)))
+    offset_d = np.where(first > 0, strokes[np.maximum(first - 1, 0), D], 0)
+    strokes[:, T] -= starts[ids]
+    strokes[:, D] -= offset_d[ids]
+    return ids
+
+
+def analyse_strokes(strokes: np.ndarray, result: dict) -> list:
+    """Compute the statistics of every interval of a workout.
+
+    Args:
+        strokes (np.ndarray): The (t, d, p, spm) rows of the workout.
+        result (dict): The result the strokes belong to.
+
+    Returns:
+        list: A dictionary per interval with its time (s), distance (m), split and
+        peak split (s/500m), watts, peak watts, stroke rate and fade (s/500m).
+    """
+    if not len(strokes):
+        return []
+    strokes = strokes.copy()
+    if result.get("type") == "bike":
+        strokes[:, D] /= BIKE_DISTANCE_FACTOR
+    ids = segment(strokes, result)
+    starts = np.flatnonzero(np.concatenate(([True], ids[1:] != ids[:-1])))
+    ends = np.concatenate((starts[1:], [len(strokes)])) - 1
+
+    t = strokes[:, T] / TENTHS_PER_SECOND
+    d = strokes[:, D] / DECIMETERS_PER_METER
+    # Time since the previous stroke, restarting with each interval
+    dt = np.diff(t, prepend=0.0)
+    dt[starts] = t[starts]
+
+    time = t[ends]
+    distance = d[ends]
+    split = time / distance * 500
+    rate = np.add.reduceat(strokes[:, SPM] * dt, starts) / np.maximum(time, 1e-9)
+    peak = np.minimum.reduceat(strokes[:, P], starts) / TENTHS_PER_SECOND
+
+    # Time at half distance, interpolated within each interval. Offsetting every
+    # interval by more than the longest one keeps the search key sorted.
+    offset = ids * (distance.max() + 1)
+    after = np.searchsorted(d + offset, distance / 2 + offset[starts])
+    before = np.maximum(after - 1, starts)
+    d0 = np.where(after > starts, d[before], 0.0)
+    t0 = np.where(after > starts, t[before], 0.0)
+    span = np.maximum(d[after] - d0, 1e-9)
+    half = t0 + (t[after] - t0) * (distance / 2 - d0) / span
+    watts = cv.split_seconds_to_watts(split)
+    peak_watts = cv.split_seconds_to_watts(peak)
+    first_half = half / (distance / 2) * 500
+    second_half = (time - half) / (distance / 2) * 500
+
+    return [
+        {
+            "interval": n + 1,
+            "time": float(time[n]),
+            "distance": float(distance[n]),
+            "split": float(split[n]),
+            "watts": float(watts[n]),
+            "peak_split": float(peak[n]),
+            "peak_watts": float(peak_watts[n]),
+            "spm": float(rate[n]),
+            "fade": float(second_half[n] - first_half[n]),
+        }
+        for n in range(len(starts))
+    ]
+
+
+def analyse_workout(
+    workout_name: str, since: str = None, api_token: str = None
+) -> list:
+    """Analyse the intervals of every result of an interval workout in the roster.
+
+    Stroke files are read from the local cache; missing ones are downloaded when an
+    API token is given and skipped otherwise.
+
+    Args:
+        workout_name (str): The name of the interval workout in the registry.
+        since (str, optional): Only analyse results from this date ('YYYY-MM-DD') on.
+        api_token (str, optional): The API token for downloading missing strokes.
+
+    Returns:
+        list: The (result, intervals) pairs, where intervals is from analyse_strokes.
+    """
+    results = [r for r in wf.iter_results(since) if classify(r) == workout_name]
+
+    def analyse(result):
+        if api_token is not None:
+            dl.get_stroke_data(result["user_id"], result["id"], api_token)
+        if not cache.exists(wf.STROKES, result["id"]):
+            return result, []
+        return result, analyse_strokes(load_strokes(result["id"]), result)
+
+    with concurrent.futures.ThreadPoolExecutor() as executor:
+        return [pair for pair in executor.map(analyse, results) if pair[1]]
+
+
+def save_analysis(analysis: list, workout_name: str) -> None:
+    """Save the interval analysis of a workout to an Excel file."""
+    rows = []
+    for result, intervals in analysis:
+        name = cv.format_name(dr.get_name(result["user_id"]))
+        for interval in intervals:
+            rows.append(
+                [
+                    name,
+                    result["date"][: wf.DATE_CONSTANT],
+                    interval["interval"],
+                    cv.time_to_real(interval["time"] * TENTHS_PER_SECOND),
+                    round(interval["distance"]),
+                    cv.time_to_real(interval["split"] * TENTHS_PER_SECOND),
+                    round(interval["watts"]),
+                    round(interval["peak_watts"]),
+                    round(interval["spm"], 1),
+                    round(interval["fade"], 1),
+                ]
+            )
+    today = datetime.today().strftime("%Y-%m-%d")
+    wf.output_to_xlsx(
+        rows, os.path.join("results", f"{today}_{workout_name}_intervals.xlsx"), BANNER
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Analyse interval workouts.")
+    parser.add_argument("workouts", nargs="+", choices=list(WORKOUTS))
+    parser.add_argument("--days", type=int, default=21)
+    args = parser.parse_args()
+
+    start_date = (datetime.today() - timedelta(days=args.days)).strftime("%Y-%m-%d")
+    for workout in args.workouts:
+        save_analysis(analyse_workout(workout, start_date), workout)
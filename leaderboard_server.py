@@ -0,0 +1,262 @@
+"""
+This module serves the latest ranking of every workout as JSON and HTML over a
+local HTTP server, so coaches and the erg room screen can poll the leaderboards
+without regenerating spreadsheets:
+
+    python leaderboard_server.py --port 8080
+    python leaderboard_server.py --host 0.0.0.0    # for the erg room screen
+
+The server has no authentication, so it only listens on this machine unless a
+host is given.
+
+Rankings are read from the JSON files the ranking functions save in results/ and
+kept in memory until the file changes. Responses carry an ETag and a matching
+If-None-Match is answered with 304 Not Modified.
+
+Each saved partition holds its own best top_k (see leaderboards.py). The bikes,
+lightweight and novice filters pick the partition they match, e.g. bikes=0 and
+lightweight=1 serve lightweight/rower/all, so they never empty a board that has
+matching results below the overall top_k. The dates filter the entries of that
+partition.
+
+Endpoints:
+- GET /leaderboards: The workouts with a ranking.
+- GET /leaderboards/{workout}.json: The leaderboard of a workout as JSON.
+- GET /leaderboards/{workout}: The leaderboard of a workout as an HTML table.
+
+Filters (query parameters):
+- bikes=0: Leave out bike results.
+- lightweight=1, novice=1: Only include lightweight or novice athletes.
+- from=YYYY-MM-DD, to=YYYY-MM-DD: Only include results within the dates.
+- partition=category/erg/band: Serve a partition leaderboard, e.g.
+  lightweight/rower/U23, instead of the overall one. The partitions of a
+  workout are listed in its JSON leaderboard.
+
+Functions:
+- load_ranking(workout_name: str) -> dict: Get the cached ranking of a workout.
+- select_partition(partition: str, query: dict) -> str: The partition matching a query.
+- filter_entries(entries: list, query: dict) -> list: Apply the query filters.
+- render_html(leaderboard: dict) -> str: Render a leaderboard as an HTML table.
+- serve(port: int, host: str) -> ThreadingHTTPServer: Start the server in a thread.
+"""
+
+import argparse
+import hashlib
+import html
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from json import dumps, load
+from urllib.parse import parse_qs, urlparse
+
+import storage
+from leaderboards import ALL, OVERALL, TOP_K
+from profiles import LIGHTWEIGHT, NOVICE, OPEN
+from workouts import BANNERS, WORKOUTS
+
+RESULTS = "results"
+# Only this machine by default; the erg room screen needs --host 0.0.0.0
+HOST = "127.0.0.1"
+PORT = 8080
+
+rankings = {}
+cache_lock = threading.Lock()
+
+
+def load_ranking(workout_name: str) -> dict:
+    """Get the latest ranking of a workout, reading the file only when it changed.
+
+    Args:
+        workout_name (str): The name of the workout in the registry.
+
+    Returns:
+        dict: The ranking, or None if the workout was never ranked.
+    """
+    path = os.path.join(RESULTS, f"{workout_name}.json")
+    if not storage.exists(path):
+        return None
+    mtime = storage.mtime(path)
+    with cache_lock:
+        if workout_name in rankings and rankings[workout_name][0] == mtime:
+            return rankings[workout_name][1]
+    with storage.open_file(path, "r", encoding="utf-8") as f:
+        ranking = load(f)
+    with cache_lock:
+        rankings[workout_name] = (mtime, ranking)
+    return ranking
+
+
+def select_partition(partition: str, query: dict) -> str:
+    """Get the partition serving a query: the one requested, or the overall one,
+    narrowed to the category and erg the filters ask for.
+
+    Args:
+        partition (str): The partition requested, or None for the overall one.
+        query (dict): The parsed query parameters.
+
+    Returns:
+        str: The partition name, e.g. "lightweight/rower/U23".
+    """
+    category, erg, band = (partition or OVERALL).split("/")
+    if category == OPEN:
+        if query.get("novice", ["0"])[0] == "1":
+            category = NOVICE
+        elif query.get("lightweight", ["0"])[0] == "1":
+            category = LIGHTWEIGHT
+    if erg == ALL and query.get("bikes", ["1"])[0] == "0":
+        erg = "rower"
+    return f"{category}/{erg}/{band}"
+
+
+def filter_entries(entries: list, query: dict) -> list:
+    """Apply the bikes, lightweight, novice and date filters of a query.
+
+    Args:
+        entries (list): The ranked entries of a workout.
+        query (dict): The parsed query parameters.
+
+    Returns:
+        list: The entries that pass every filter, in ranked order.
+    """
+    bikes = query.get("bikes", ["1"])[0] != "0"
+    lightweight = query.get("lightweight", ["0"])[0] == "1"
+    novice = query.get("novice", ["0"])[0] == "1"
+    start = query.get("from", [""])[0]
+    end = query.get("to", ["9999-12-31"])[0]
+
+    # Entries carry the flags of the athlete on the day, as the partitions do
+    selected = []
+    for entry in entries:
+        if not bikes and entry["type"] == "bike":
+            continue
+        if lightweight and not entry["lightweight"]:
+            continue
+        if novice and not entry["novice"]:
+            continue
+        if not start <= entry["date"] <= end:
+            continue
+        selected.append(entry)
+    return selected
+
+
+def render_html(leaderboard: dict) -> str:
+    """Render a leaderboard as an HTML table."""
+    header = "".join(f"<th>{html.escape(str(c))}</th>" for c in leaderboard["banner"])
+    rows = "".join(
+        "<tr>"
+        + "".join(f"<td>{html.escape(str(cell))}</td>" for cell in entry["row"])
+        + "</tr>"
+        for entry in leaderboard["entries"]
+    )
+    title = html.escape(WORKOUTS[leaderboard["workout"]]["label"])
+    return (
+        f"<!DOCTYPE html><html><head><meta charset='utf-8'><title>{title}</title>"
+        f"</head><body><h1>{title}</h1><p>Ranked {leaderboard['ranked']}, "
+        f"{html.escape(leaderboard.get('partition', OVERALL))}</p>"
+        f"<table><thead><tr>{header}</tr></thead><tbody>{rows}</tbody></table>"
+        "</body></html>"
+    )
+
+
+class LeaderboardHandler(BaseHTTPRequestHandler):
+    """Serve the leaderboards."""
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        pass
+
+    def send_body(self, status, body, content_type):
+        """Send a body with an ETag, or 304 if the client already has it."""
+        payload = body.encode("utf-8")
+        etag = f'"{hashlib.sha1(payload).hexdigest()}"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("ETag", etag)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """Serve the list of leaderboards or a single leaderboard."""
+        url = urlparse(self.path)
+        parts = url.path.strip("/").split("/")
+        if parts in (["leaderboards"], [""]):
+            ranked = [name for name in WORKOUTS if load_ranking(name) is not None]
+            self.send_body(200, dumps({"leaderboards": ranked}), "application/json")
+            return
+
+        if len(parts) != 2 or parts[0] != "leaderboards":
+            self.send_body(404, dumps({"message": "Not found."}), "application/json")
+            return
+        name, as_json = parts[1], parts[1].endswith(".json")
+        name = name[: -len(".json")] if as_json else name
+        ranking = load_ranking(name) if name in WORKOUTS else None
+        if ranking is None:
+            self.send_body(404, dumps({"message": "Not ranked."}), "application/json")
+            return
+
+        query = parse_qs(url.query)
+        partition = query.get("partition", [None])[0]
+        partitions = ranking.get("partitions", {})
+        if partition is not None and partition not in partitions:
+            self.send_body(
+                404, dumps({"message": "No such partition."}), "application/json"
+            )
+            return
+        selected = select_partition(partition, query)
+        if selected == OVERALL:
+            entries = ranking["entries"]
+        else:
+            entries = partitions.get(selected, [])
+        top_k = ranking.get("top_k", TOP_K)
+        leaderboard = {
+            "workout": name,
+            "ranked": ranking["ranked"],
+            "partition": selected,
+            "partitions": sorted(partitions),
+            "banner": BANNERS[name],
+            "entries": filter_entries(entries, query)[:top_k],
+        }
+        if as_json:
+            self.send_body(200, dumps(leaderboard), "application/json")
+        else:
+            self.send_body(200, render_html(leaderboard), "text/html; charset=utf-8")
+
+
+def serve(port: int = PORT, host: str = HOST) -> ThreadingHTTPServer:
+    """Start the leaderboard server in a background thread.
+
+    Args:
+        port (int): The port to listen on, 0 for any free port.
+        host (str): The address to listen on. The default only accepts this
+            machine, since the server has no authentication; 0.0.0.0 lets the
+            erg room screen connect.
+
+    Returns:
+        ThreadingHTTPServer: The running server.
+    """
+    server = ThreadingHTTPServer((host, port), LeaderboardHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the Valkyrie leaderboards.")
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument(
+        "--host", default=HOST, help="0.0.0.0 to serve the erg room screen"
+    )
+    args = parser.parse_args()
+
+    leaderboards = serve(args.port, args.host)
+    print(f"Serving the leaderboards on port {leaderboards.server_address[1]}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        leaderboards.shutdown()
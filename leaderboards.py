@@ -0,0 +1,171 @@
+"""
+This module keeps the leaderboards of a workout for every roster partition in a
+single pass over the results.
+
+A result is added to each partition its athlete belongs to:
+
+- category: open (everyone), lightweight, novice
+- erg: all, rower, bike
+- age band: all, or the band of the athlete's age on the day (see profiles.py)
+
+Partitions are named "category/erg/band", e.g. "open/all/all" for the overall
+leaderboard or "lightweight/rower/U23". Each partition keeps only its best
+top_k entries in a bounded heap, so memory grows with top_k times the number of
+partitions rather than with the number of results, the overall leaderboard
+included. The team aggregates of every partition can be kept alongside, in a
+team_stats.TeamStats, and every row can be collected apart from the heaps in a
+sheet list, for a spreadsheet listing every result.
+
+Classes:
+- TopK: The best k items by a key, in a bounded heap.
+- Leaderboards: The TopK leaderboard of every partition of a workout.
+"""
+
+import heapq
+import itertools
+from typing import Callable
+
+import database_request as dr
+import profiles
+
+TOP_K = 100
+ALL = "all"
+OVERALL = f"{profiles.OPEN}/{ALL}/{ALL}"
+
+
+class _Entry:
+    """A heap entry ordered so the worst entry kept is at the root."""
+
+    __slots__ = ("key", "order", "item", "reverse")
+
+    def __init__(self, key, order: int, item, reverse: bool):
+        self.key = key
+        self.order = order
+        self.item = item
+        self.reverse = reverse
+
+    def __lt__(self, other) -> bool:
+        """True if self ranks below other; ties rank in the order added."""
+        if self.key == other.key:
+            return self.order > other.order
+        return self.key < other.key if self.reverse else self.key > other.key
+
+
+class TopK:
+    """The best k items by a key, in a bounded heap."""
+
+    def __init__(self, k: int, key: Callable, reverse: bool = False):
+        """
+        Args:
+            k (int): The number of items kept.
+            key (callable): Returns the sort key of an item.
+            reverse (bool): Flag indicating the highest keys are best.
+        """
+        self.k = k
+        self.key = key
+        self.reverse = reverse
+        self._heap = []
+        self._order = itertools.count()
+
+    def push(self, item) -> None:
+        """Add an item, dropping the worst item kept if there are more than k."""
+        entry = _Entry(self.key(item), next(self._order), item, self.reverse)
+        if len(self._heap) < self.k:
+            heapq.heappush(self._heap, entry)
+        elif self._heap[0] < entry:
+            heapq.heapreplace(self._heap, entry)
+
+    def ranked(self) -> list:
+        """Get the items kept, best first."""
+        return [entry.item for entry in sorted(self._heap, reverse=True)]
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+
+class Leaderboards:
+    """The top_k leaderboard of every partition of a workout."""
+
+    def __init__(
+        self,
+        key: Callable,
+        reverse: bool = False,
+        top_k: int = TOP_K,
+        roster: dict = None,
+        cached: dict = None,
+        stats=None,
+        sheet: list = None,
+    ):
+        """
+        Args:
+            key (callable): Returns the sort key of a ranking row.
+            reverse (bool): Flag indicating the highest keys are best.
+            top_k (int): The number of entries kept per partition.
+            roster (dict, optional): The roster flags. Defaults to the users table.
+            cached (dict, optional): The cached profiles. Defaults to the profiles table.
+            stats (TeamStats, optional): Also aggregates every row added per partition.
+            sheet (list, optional): Also collects every row added, in the order
+                added and outside the heaps, e.g. for a full spreadsheet.
+        """
+        self.key = key
+        self.reverse = reverse
+        self.top_k = top_k
+        self.roster = dr.get_roster() if roster is None else roster
+        self.profiles = profiles.get_profiles() if cached is None else cached
+        self.boards = {}
+        self.stats = stats
+        self.sheet = sheet
+
+    def add(self, result: dict, row: list) -> None:
+        """Add a ranked row to the leaderboard of every partition of its athlete.
+
+        Args:
+            result (dict): The result as returned by the Concept2 API.
+            row (list): The ranking row of the result.
+        """
+        info = profiles.enrich(result, self.roster, self.profiles)
+        names = partitions(result, info)
+        if self.stats is not None:
+            self.stats.add(row, names)
+        if self.sheet is not None:
+            self.sheet.append(row)
+        for partition in names:
+            board = self.boards.get(partition)
+            if board is None:
+                board = self.boards[partition] = TopK(
+                    self.top_k, lambda item: self.key(item[1]), self.reverse
+                )
+            board.push((result, row, info))
+
+    def ranked(self, partition: str = OVERALL) -> list:
+        """Get the (result, row, info) entries of a partition, best first."""
+        board = self.boards.get(partition)
+        return board.ranked() if board is not None else []
+
+    def sheet_rows(self) -> list:
+        """Get every row of the sheet, best first; ties rank in the order added."""
+        return sorted(self.sheet or [], key=self.key, reverse=self.reverse)
+
+    def partitions(self) -> list:
+        """Get the names of the partitions with at least one entry, sorted."""
+        return sorted(self.boards)
+
+
+def partitions(result: dict, info: dict) -> list:
+    """Get the partitions a result belongs to.
+
+    Args:
+        result (dict): The result as returned by the Concept2 API.
+        info (dict): The athlete metadata, as returned by profiles.enrich.
+
+    Returns:
+        list: The partition names.
+    """
+    categories = [profiles.OPEN]
+    if info["lightweight"]:
+        categories.append(profiles.LIGHTWEIGHT)
+    if info["novice"]:
+        categories.append(profiles.NOVICE)
+    ergs = [ALL, result["type"]]
+    bands = [ALL] + ([info["age_band"]] if info["age_band"] else [])
+    return [f"{c}/{e}/{b}" for c, e, b in itertools.product(categories, ergs, bands)]
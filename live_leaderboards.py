@@ -0,0 +1,228 @@
+"""
+This module keeps an all-time leaderboard of every workout and erg that is
+updated in place as results are synced, instead of rebuilt from every file.
+
+Each leaderboard holds the best result of every athlete in a SortedList keyed on
+a numeric score (lower is better): the time of distance pieces, the negated
+distance of time pieces and the fastest stroke pace of peak power pieces. Ties
+go to the earlier result. A new result replaces its athlete's entry only if it
+beats it, in O(log n), and an athlete's rank is a bisection away.
+
+The leaderboards are saved to LIVE_FILE after every update:
+
+    python live_leaderboards.py rebuild
+    python live_leaderboards.py show 2k rower
+    python live_leaderboards.py rank 2k rower 1524007
+
+Classes:
+- LiveLeaderboard: The best result of every athlete for one workout and erg.
+- LiveLeaderboards: The leaderboards of every workout and erg, saved to disk.
+
+Functions:
+- workout_of(result: dict) -> str: The workout a result counts for.
+- score(result: dict, workout_name: str) -> float: The score of a result.
+- update(results: Iterable) -> int: Record new results in the saved leaderboards.
+- rebuild(results: Iterable) -> LiveLeaderboards: Rebuild the saved leaderboards.
+"""
+
+import sys
+import threading
+from json import dump, load
+from typing import Iterable
+
+from sortedcontainers import SortedList
+
+import cache
+import storage
+from stroke_reader import stream_strokes
+from workouts import BIKE_DISTANCE_FACTOR, DISTANCE, WORKOUTS, classify
+
+LIVE_FILE = "data/live_leaderboards.json"
+STROKES = "strokes"
+
+
+def workout_of(result: dict) -> str:
+    """Get the workout a result counts for, including peak power pieces.
+
+    Returns:
+        str: The name of the workout, or None if the result is not ranked.
+    """
+    name = classify(result)
+    if name is None and result.get("distance", 0) <= WORKOUTS["peak_power"]["value"]:
+        return "peak_power"
+    return name
+
+
+def score(result: dict, workout_name: str) -> float:
+    """Get the score of a result for a workout; lower is better.
+
+    Args:
+        result (dict): The result as returned by the Concept2 API.
+        workout_name (str): The name of the workout in the registry.
+
+    Returns:
+        float: The score, or None if it cannot be computed from local data.
+    """
+    spec = WORKOUTS[workout_name]
+    if spec["kind"] == "peak_power":
+        if not cache.exists(STROKES, result["id"]):
+            return None
+        paces = [
+            p for _, _, p, _ in stream_strokes(cache.locate(STROKES, result["id"]))
+        ]
+        paces = [p for p in paces if p > 0]
+        return min(paces) if paces else None
+    if spec["measure"] == DISTANCE:
+        return result["time"]
+    factor = BIKE_DISTANCE_FACTOR if result["type"] == "bike" else 1
+    return -result["distance"] / factor
+
+
+class LiveLeaderboard:
+    """The best result of every athlete for one workout and erg."""
+
+    def __init__(self, entries: Iterable = ()):
+        """
+        Args:
+            entries (Iterable): The (score, date, result_id, user_id) entries to start
+                with, at most one per athlete.
+        """
+        self._sorted = SortedList(tuple(entry) for entry in entries)
+        self._best = {entry[3]: entry for entry in self._sorted}
+
+    def update(self, user_id: int, value: float, date: str, result_id: int) -> bool:
+        """Record a result, keeping it only if it is the athlete's best.
+
+        Returns:
+            bool: True if the leaderboard changed.
+        """
+        entry = (value, date, result_id, user_id)
+        best = self._best.get(user_id)
+        if best is not None:
+            if best <= entry:
+                return False
+            self._sorted.remove(best)
+        self._sorted.add(entry)
+        self._best[user_id] = entry
+        return True
+
+    def rank(self, user_id: int) -> int:
+        """Get the rank of an athlete, 1 for the best, or None if they have no result."""
+        best = self._best.get(user_id)
+        return None if best is None else self._sorted.index(best) + 1
+
+    def best(self, user_id: int) -> tuple:
+        """Get the (score, date, result_id, user_id) entry of an athlete, or None."""
+        return self._best.get(user_id)
+
+    def top(self, count: int = None) -> list:
+        """Get the best entries, best first."""
+        return list(self._sorted[:count])
+
+    def __len__(self) -> int:
+        return len(self._sorted)
+
+
+class LiveLeaderboards:
+    """The leaderboards of every workout and erg, keyed "workout/erg"."""
+
+    def __init__(self, path: str = LIVE_FILE, load_saved: bool = True):
+        """
+        Args:
+            path (str): The file the leaderboards are saved to and loaded from.
+            load_saved (bool): Flag indicating whether to start from the saved file.
+        """
+        self.path = path
+        self.boards = {}
+        self._lock = threading.Lock()
+        if load_saved and storage.exists(path):
+            with storage.open_file(path, "r", encoding="utf-8") as f:
+                saved = load(f)
+            self.boards = {
+                key: LiveLeaderboard(entries) for key, entries in saved.items()
+            }
+
+    def board(self, workout_name: str, erg: str) -> LiveLeaderboard:
+        """Get the leaderboard of a workout and erg, empty if it has no results."""
+        return self.boards.get(f"{workout_name}/{erg}") or LiveLeaderboard()
+
+    def add_results(self, results: Iterable) -> int:
+        """Record results in the leaderboards of their workouts.
+
+        Args:
+            results (Iterable): The results as returned by the Concept2 API.
+
+        Returns:
+            int: The number of results that became an athlete's best.
+        """
+        changed = 0
+        with self._lock:
+            for result in results:
+                name = workout_of(result)
+                if name is None:
+                    continue
+                value = score(result, name)
+                if value is None:
+                    continue
+                key = f"{name}/{result['type']}"
+                board = self.boards.setdefault(key, LiveLeaderboard())
+                changed += board.update(
+                    result["user_id"], value, result["date"], result["id"]
+                )
+        return changed
+
+    def rank(self, workout_name: str, erg: str, user_id: int) -> int:
+        """Get the rank of an athlete in a workout and erg, or None."""
+        with self._lock:
+            return self.board(workout_name, erg).rank(user_id)
+
+    def save(self) -> None:
+        """Write the leaderboards atomically."""
+        with self._lock:
+            saved = {key: board.top() for key, board in self.boards.items()}
+        with storage.atomic(self.path, "w", encoding="utf-8") as f:
+            dump(saved, f)
+
+
+def update(results: Iterable, path: str = LIVE_FILE) -> int:
+    """Record new results in the saved leaderboards.
+
+    Returns:
+        int: The number of results that became an athlete's best.
+    """
+    boards = LiveLeaderboards(path)
+    changed = boards.add_results(results)
+    if changed:
+        boards.save()
+    return changed
+
+
+def rebuild(results: Iterable, path: str = LIVE_FILE) -> LiveLeaderboards:
+    """Replace the saved leaderboards with ones built from scratch."""
+    boards = LiveLeaderboards(path, load_saved=False)
+    boards.add_results(results)
+    boards.save()
+    return boards
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "show"
+    if command == "rebuild":
+        saved = (
+            r
+            for key in cache.keys("json")
+            for r in cache.read_json("json", key).get("data", [])
+        )
+        rebuilt = rebuild(saved)
+        print({key: len(board) for key, board in rebuilt.boards.items()})
+    elif command == "show" and len(sys.argv) == 4:
+        for position, entry in enumerate(
+            LiveLeaderboards().board(sys.argv[2], sys.argv[3]).top(), start=1
+        ):
+            print(position, entry)
+    elif command == "rank" and len(sys.argv) == 5:
+        print(LiveLeaderboards().rank(sys.argv[2], sys.argv[3], int(sys.argv[4])))
+    else:
+        print(
+            "Usage: python live_leaderboards.py rebuild | show WORKOUT ERG | rank WORKOUT ERG USER_ID"
+        )
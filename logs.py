@@ -0,0 +1,192 @@
+"""
+This module routes logging through a queue to a background writer, so threads in
+the downloader and the rankings never wait on the log file.
+
+Records are written to LOG_FILE as JSON lines. Each record carries the id and
+category of the run it belongs to (a sync, or the ranking of a workout) and any
+user_id or result_id passed in extra, so a slow run can be pulled out of the log:
+
+    with logs.run("2k"):
+        logging.info("Downloaded strokes", extra={"result_id": 1524007})
+
+Runs are tracked in a context variable. Thread pools do not inherit it, so
+functions submitted to one are wrapped with in_context.
+
+Classes:
+- JsonFormatter: Formats a record as one line of JSON.
+- RunFilter: Adds the run id and category to each record.
+
+Functions:
+- setup(path: str, level: int) -> QueueListener: Log to a file from a background thread.
+- stop(): Write the queued records and stop the background writer.
+- run(category: str): Context manager logging everything inside as one run.
+- current() -> tuple: Get the id and category of the current run.
+- in_context(fn: Callable) -> Callable: Run a function in the caller's run.
+"""
+
+import atexit
+import contextvars
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from json import dumps
+from typing import Callable
+
+import storage
+
+LOG_FILE = "data/debug.log"
+
+_run = contextvars.ContextVar("run", default=(None, None))
+_listener = None
+_lock = threading.Lock()
+# The attributes every record has, so anything else came from extra
+_STANDARD = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {
+    "message",
+    "asctime",
+    "run_id",
+    "category",
+}
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats a record as one line of JSON."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created).isoformat(
+                timespec="milliseconds"
+            ),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "run_id": getattr(record, "run_id", None),
+            "category": getattr(record, "category", None),
+            "message": record.getMessage(),
+        }
+        entry.update(
+            (key, value)
+            for key, value in vars(record).items()
+            if key not in _STANDARD and not key.startswith("_")
+        )
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return dumps(entry, default=str)
+
+
+class RunFilter(logging.Filter):
+    """Adds the id and category of the current run to each record."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not hasattr(record, "run_id"):
+            record.run_id, record.category = _run.get()
+        return True
+
+
+def setup(
+    path: str = LOG_FILE, level: int = logging.INFO
+) -> logging.handlers.QueueListener:
+    """Send the records of the root logger to a file through a queue.
+
+    The records are formatted as JSON lines by the thread that logs them, so they
+    keep its run, and written by a background thread. Calling it again does
+    nothing.
+
+    Args:
+        path (str): The log file, appended to, in the storage in use.
+        level (int): The level of the root logger.
+
+    Returns:
+        QueueListener: The background writer.
+    """
+    global _listener
+    with _lock:
+        if _listener is not None:
+            return _listener
+        local = storage.local_path(path)
+        if local is None:
+            # The storage is in memory, so the records are dropped
+            writer = logging.NullHandler()
+        else:
+            directory = os.path.dirname(local)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            writer = logging.FileHandler(local, encoding="utf-8")
+            writer.setFormatter(logging.Formatter("%(message)s"))
+        records = queue.SimpleQueue()
+        handler = logging.handlers.QueueHandler(records)
+        handler.addFilter(RunFilter())
+        handler.setFormatter(JsonFormatter())
+        root = logging.getLogger()
+        for old in list(root.handlers):
+            root.removeHandler(old)
+        root.addHandler(handler)
+        root.setLevel(level)
+        _listener = logging.handlers.QueueListener(records, writer)
+        _listener.start()
+        atexit.register(stop)
+        return _listener
+
+
+def stop() -> None:
+    """Write the queued records and stop the background writer."""
+    global _listener
+    with _lock:
+        if _listener is None:
+            return
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+
+@contextmanager
+def run(category: str):
+    """Log everything inside the block as one run with a new id.
+
+    The start, end and duration of the run are logged too.
+
+    Args:
+        category (str): What the run does, e.g. "sync" or the name of a workout.
+
+    Yields:
+        str: The id of the run.
+    """
+    run_id = uuid.uuid4().hex[:12]
+    token = _run.set((run_id, category))
+    started = time.perf_counter()
+    logging.info("Run started")
+    try:
+        yield run_id
+    except BaseException as e:
+        elapsed = time.perf_counter() - started
+        logging.warning(
+            "Run failed after %.1f s: %r", elapsed, e, extra={"elapsed": elapsed}
+        )
+        raise
+    else:
+        elapsed = time.perf_counter() - started
+        logging.info("Run finished in %.1f s", elapsed, extra={"elapsed": elapsed})
+    finally:
+        _run.reset(token)
+
+
+def current() -> tuple:
+    """Get the (run_id, category) of the current run, (None, None) outside one."""
+    return _run.get()
+
+
+def in_context(fn: Callable) -> Callable:
+    """Wrap a function to run in the caller's run, e.g. on a thread pool."""
+    context = contextvars.copy_context()
+
+    def run_in_context(*args, **kwargs):
+        # A context can only be entered by one thread at a time
+        return context.copy().run(fn, *args, **kwargs)
+
+    return run_in_context
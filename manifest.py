@@ -0,0 +1,157 @@
+"""
+This module records the requests planned by a sync and the state of each one, so
+an interrupted sync resumes where it stopped instead of starting from scratch.
+
+The manifest is a JSON file holding the window of the sync and one entry per
+request, keyed like "results/<user_id>" or "strokes/<result_id>":
+
+    {"since": "2024-01-01", "keep_from": "2024-01-01", "started": "...",
+     "requests": {"results/42": {"state": "done", "attempts": 1, "results": [...]},
+                  "strokes/42001": {"state": "pending", "attempts": 0}}}
+
+It is written atomically, at most every SAVE_INTERVAL seconds while requests
+complete and always when the sync stops, and removed once the sync finishes.
+
+Classes:
+- Manifest: The requests of a sync and their states.
+"""
+
+import threading
+import time
+from datetime import datetime
+from json import JSONDecodeError, dump, load
+
+import storage
+
+MANIFEST_FILE = "data/sync_manifest.json"
+SAVE_INTERVAL = 1.0
+PENDING = "pending"
+DONE = "done"
+FAILED = "failed"
+
+
+class Manifest:
+    """The requests of a sync and their states, shared by the download threads."""
+
+    def __init__(self, since: str, keep_from: str, path: str = MANIFEST_FILE):
+        """
+        Args:
+            since (str): The date ('YYYY-MM-DD') results are fetched from.
+            keep_from (str): The date saved results are kept from.
+            path (str): The file the manifest is saved to.
+        """
+        self.path = path
+        self.data = {
+            "since": since,
+            "keep_from": keep_from,
+            "started": datetime.now().isoformat(timespec="seconds"),
+            "requests": {},
+        }
+        self._lock = threading.Lock()
+        self._saved = 0.0
+
+    @classmethod
+    def resume(cls, since: str, keep_from: str, path: str = MANIFEST_FILE):
+        """Load the manifest of an unfinished sync, or start a new one.
+
+        An unfinished sync keeps its own window, so the results it had not fetched
+        yet are fetched from the same date.
+
+        Args:
+            since (str): The date results are fetched from if nothing is resumed.
+            keep_from (str): The date saved results are kept from.
+            path (str): The file the manifest is saved to.
+
+        Returns:
+            Manifest: The resumed or new manifest.
+        """
+        manifest = cls(since, keep_from, path)
+        if storage.exists(path):
+            try:
+                with storage.open_file(path, "r", encoding="utf-8") as f:
+                    saved = load(f)
+                saved["since"] = min(saved["since"], since)
+                saved["keep_from"] = keep_from
+                manifest.data = saved
+            except (JSONDecodeError, KeyError, TypeError):
+                pass
+        return manifest
+
+    @property
+    def since(self) -> str:
+        """The date results are fetched from."""
+        return self.data["since"]
+
+    @property
+    def resumed(self) -> int:
+        """The number of requests already done when the sync started."""
+        return self.count(DONE)
+
+    def plan(self, key: str) -> bool:
+        """Add a request if it is not planned yet.
+
+        Returns:
+            bool: True if the request still has to be made.
+        """
+        with self._lock:
+            entry = self.data["requests"].setdefault(
+                key, {"state": PENDING, "attempts": 0}
+            )
+            return entry["state"] != DONE
+
+    def done(self, key: str, **info) -> None:
+        """Mark a request as done, keeping any info needed to resume after it."""
+        self._update(key, state=DONE, error=None, **info)
+
+    def failed(self, key: str, error: str) -> None:
+        """Mark a request as failed, so the next sync retries it."""
+        self._update(key, state=FAILED, error=error)
+
+    def info(self, key: str) -> dict:
+        """Get the entry of a request."""
+        with self._lock:
+            return dict(self.data["requests"].get(key, {}))
+
+    def keys(self, prefix: str, state: str = None) -> list:
+        """List the requests of a kind, e.g. "results/", optionally in one state."""
+        with self._lock:
+            return [
+                key
+                for key, entry in self.data["requests"].items()
+                if key.startswith(prefix) and state in (None, entry["state"])
+            ]
+
+    def count(self, state: str) -> int:
+        """Count the requests in a state."""
+        with self._lock:
+            return sum(
+                entry["state"] == state for entry in self.data["requests"].values()
+            )
+
+    def save(self, force: bool = True) -> None:
+        """Write the manifest atomically.
+
+        Args:
+            force (bool): Write even if it was written less than SAVE_INTERVAL ago.
+        """
+        with self._lock:
+            if not force and time.monotonic() - self._saved < SAVE_INTERVAL:
+                return
+            with storage.atomic(self.path, "w", encoding="utf-8") as f:
+                dump(self.data, f)
+            self._saved = time.monotonic()
+
+    def finish(self) -> None:
+        """Remove the manifest once every request is done."""
+        with self._lock:
+            if storage.exists(self.path):
+                storage.remove(self.path)
+
+    def _update(self, key: str, **changes) -> None:
+        with self._lock:
+            entry = self.data["requests"].setdefault(
+                key, {"state": PENDING, "attempts": 0}
+            )
+            entry.update(changes)
+            entry["attempts"] += 1
+        self.save(force=False)
@@ -0,0 +1,386 @@
+"""
+This module exports the saved results and stroke data to Parquet datasets for
+analysis in notebooks, instead of parsing every JSON file in json/ and strokes/.
+
+Two datasets are written under EXPORT_ROOT, partitioned by Concept2 season (May 1
+to April 30, named by the year it ends in), e.g. results/season=2025/:
+
+- results: one row per result, with the intervals flattened into columns
+  interval_1_time, interval_1_distance, ... for the first MAX_INTERVALS intervals.
+- strokes: one row per stroke, with the result and user IDs, the interval number
+  and the stroke number.
+
+Each export appends new files for the results and stroke files not exported yet,
+recorded in the user database, so a sync only writes what it fetched. compact
+rewrites each season into one file once the appends pile up. Reading a season
+then takes one file:
+
+    python parquet_export.py export
+    python parquet_export.py compact
+
+    import pyarrow.dataset as ds
+    results = ds.dataset("data/export/results", partitioning="hive").to_table(
+        filter=ds.field("season") >= 2024
+    ).to_pandas()
+
+The sync exports the results it fetches; run export once to add the results
+saved before. pyarrow is optional; without it, or when the storage is in memory
+(see storage.py), the sync skips the export. The root is resolved through the
+storage, so it follows VALKYRIE_ROOT and VALKYRIE_DATA_ROOT.
+
+Functions:
+- available() -> bool: Check if pyarrow is installed and the export can be written.
+- create_table() -> None: Create the table of exported results in the database.
+- season(date: str) -> int: The Concept2 season of a date.
+- result_row(result: dict) -> dict: Flatten a result into a row.
+- stroke_rows(result_id: int, user_id: int, result_season: int) -> list: The strokes of a result as rows.
+- export(results: Iterable, root: str) -> dict: Append new results and strokes.
+- compact(root: str) -> dict: Rewrite each partition into one file.
+- load(dataset: str, root: str, **filters) -> Table: Read a dataset.
+- reset(root: str) -> None: Delete the datasets and the record of what was exported.
+"""
+
+import os
+import shutil
+import sys
+import uuid
+from typing import Iterable
+
+import cache
+import storage
+from stroke_reader import iter_stroke_records
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = ds = pq = None
+
+EXPORT_ROOT = "data/export"
+RESULTS = "results"
+STROKES = "strokes"
+MAX_INTERVALS = 16
+COMPACTED = "compacted.parquet"
+SEASON_START_MONTH = 5
+# Stroke files are read and written this many at a time
+STROKE_BATCH = 200
+
+INTERVAL_FIELDS = {
+    "type": "string",
+    "time": "int64",
+    "distance": "int64",
+    "rest_time": "int64",
+    "rest_distance": "int64",
+    "stroke_rate": "int32",
+    "heart_rate": "int32",
+}
+RESULT_FIELDS = {
+    "id": "int64",
+    "user_id": "int64",
+    "date": "timestamp",
+    "timezone": "string",
+    "type": "string",
+    "workout_type": "string",
+    "distance": "int64",
+    "time": "int64",
+    "stroke_rate": "int32",
+    "stroke_count": "int32",
+    "heart_rate": "int32",
+    "calories_total": "int32",
+    "drag_factor": "int32",
+    "weight_class": "string",
+    "verified": "bool",
+    "ranked": "bool",
+    "stroke_data": "bool",
+    "intervals": "int32",
+    **{
+        f"interval_{n}_{field}": kind
+        for n in range(1, MAX_INTERVALS + 1)
+        for field, kind in INTERVAL_FIELDS.items()
+    },
+}
+STROKE_FIELDS = {
+    "result_id": "int64",
+    "user_id": "int64",
+    "stroke": "int32",
+    "interval": "int32",
+    "t": "int32",
+    "d": "int32",
+    "p": "int32",
+    "spm": "int32",
+    "hr": "int32",
+}
+
+
+def available() -> bool:
+    """Check if pyarrow is installed and the export has a directory on disk."""
+    return pa is not None and storage.local_path(EXPORT_ROOT) is not None
+
+
+def _require(root: str) -> str:
+    """Check that the export can run, returning the directory of the datasets."""
+    if pa is None:
+        raise ImportError("The Parquet export needs pyarrow: pip install pyarrow")
+    local = storage.local_path(root)
+    if local is None:
+        raise ValueError(f"The Parquet export needs a directory on disk: {root}")
+    return local
+
+
+def _schema(fields: dict) -> "pa.Schema":
+    """Build an Arrow schema from column names and type names."""
+    types = {
+        "string": pa.string(),
+        "int32": pa.int32(),
+        "int64": pa.int64(),
+        "bool": pa.bool_(),
+        "timestamp": pa.timestamp("s"),
+    }
+    return pa.schema(
+        [(name, types[kind]) for name, kind in fields.items()]
+        + [("season", pa.int32())]
+    )
+
+
+def create_table() -> None:
+    """Create the table of exported results in the database."""
+    conn = storage.connect(storage.DATABASE)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS exported (
+            result_id INTEGER PRIMARY KEY,
+            user_id TEXT,
+            season INTEGER,
+            strokes INTEGER DEFAULT 0
+        )
+        """)
+    conn.commit()
+    conn.close()
+
+
+def season(date: str) -> int:
+    """Get the Concept2 season of a date, named by the year it ends in.
+
+    Args:
+        date (str): The date, 'YYYY-MM-DD' or with a time.
+
+    Returns:
+        int: The season, e.g. 2025 for May 1 2024 to April 30 2025.
+    """
+    year, month = int(date[:4]), int(date[5:7])
+    return year + 1 if month >= SEASON_START_MONTH else year
+
+
+def _heart_rate(value):
+    """Get the average heart rate of a result or interval, which may be a dict."""
+    if isinstance(value, dict):
+        return value.get("average")
+    return value
+
+
+def result_row(result: dict) -> dict:
+    """Flatten a result into a row of the results dataset.
+
+    Args:
+        result (dict): The result as returned by the Concept2 API.
+
+    Returns:
+        dict: The value of every column, None where the result has none.
+    """
+    row = {name: result.get(name) for name in RESULT_FIELDS}
+    row["date"] = result["date"][:19]
+    row["heart_rate"] = _heart_rate(result.get("heart_rate"))
+    intervals = result.get("workout", {}).get("intervals", [])
+    row["intervals"] = len(intervals)
+    for n, interval in enumerate(intervals[:MAX_INTERVALS], start=1):
+        for field in INTERVAL_FIELDS:
+            row[f"interval_{n}_{field}"] = interval.get(field)
+        row[f"interval_{n}_heart_rate"] = _heart_rate(interval.get("heart_rate"))
+    row["season"] = season(result["date"])
+    return row
+
+
+def _table(rows: list, fields: dict) -> "pa.Table":
+    """Build a table from rows, converting dates to timestamps."""
+    schema = _schema(fields)
+    columns = {name: [row.get(name) for row in rows] for name in schema.names}
+    if "date" in columns:
+        columns["date"] = pa.array(columns["date"], pa.string()).cast(pa.timestamp("s"))
+    return pa.Table.from_pydict(columns, schema=schema)
+
+
+def _append(table: "pa.Table", directory: str) -> None:
+    """Append a table to a dataset as new files, one per season."""
+    if table.num_rows == 0:
+        return
+    ds.write_dataset(
+        table,
+        directory,
+        format="parquet",
+        partitioning=ds.partitioning(
+            pa.schema([("season", pa.int32())]), flavor="hive"
+        ),
+        basename_template=f"part-{uuid.uuid4().hex}-{{i}}.parquet",
+        existing_data_behavior="overwrite_or_ignore",
+    )
+
+
+def stroke_rows(result_id: int, user_id: int, result_season: int) -> list:
+    """Read the strokes of a saved stroke file as rows of the strokes dataset.
+
+    Time and distance restart at every interval, so an interval starts wherever
+    the time goes back.
+    """
+    rows = []
+    interval, previous_t = 1, 0
+    with cache.open_text(cache.locate(STROKES, result_id)) as f:
+        for number, stroke in enumerate(iter_stroke_records(f), start=1):
+            if stroke["t"] < previous_t:
+                interval += 1
+            previous_t = stroke["t"]
+            rows.append(
+                {
+                    "result_id": result_id,
+                    "user_id": user_id,
+                    "stroke": number,
+                    "interval": interval,
+                    "t": stroke["t"],
+                    "d": stroke["d"],
+                    "p": stroke["p"],
+                    "spm": stroke.get("spm"),
+                    "hr": stroke.get("hr"),
+                    "season": result_season,
+                }
+            )
+    return rows
+
+
+def export(results: Iterable, root: str = EXPORT_ROOT) -> dict:
+    """Append the results and stroke files not exported yet to the datasets.
+
+    Stroke files are exported once they are downloaded, so stroke data that was
+    missing at an earlier export is picked up by a later one.
+
+    Args:
+        results (Iterable): The results as returned by the Concept2 API.
+        root (str): The directory of the datasets.
+
+    Returns:
+        dict: The number of results and stroke files exported.
+    """
+    root = _require(root)
+    create_table()
+    conn = storage.connect(storage.DATABASE)
+    exported = {row[0] for row in conn.execute("SELECT result_id FROM exported")}
+    rows = {}
+    for result in results:
+        if result["id"] not in exported:
+            rows[result["id"]] = result_row(result)
+    _append(_table(list(rows.values()), RESULT_FIELDS), os.path.join(root, RESULTS))
+    with conn:
+        conn.executemany(
+            "INSERT INTO exported (result_id, user_id, season) VALUES (?, ?, ?)",
+            [(i, str(row["user_id"]), row["season"]) for i, row in rows.items()],
+        )
+
+    pending = [
+        (int(result_id), int(user_id), result_season)
+        for result_id, user_id, result_season in conn.execute(
+            "SELECT result_id, user_id, season FROM exported WHERE strokes = 0"
+        )
+        if cache.exists(STROKES, result_id)
+    ]
+    for start in range(0, len(pending), STROKE_BATCH):
+        batch = pending[start : start + STROKE_BATCH]
+        strokes = [row for piece in batch for row in stroke_rows(*piece)]
+        _append(_table(strokes, STROKE_FIELDS), os.path.join(root, STROKES))
+        with conn:
+            conn.executemany(
+                "UPDATE exported SET strokes = 1 WHERE result_id = ?",
+                [(piece[0],) for piece in batch],
+            )
+    conn.close()
+    return {RESULTS: len(rows), STROKES: len(pending)}
+
+
+def compact(root: str = EXPORT_ROOT) -> dict:
+    """Rewrite every season partition of both datasets into a single file.
+
+    Args:
+        root (str): The directory of the datasets.
+
+    Returns:
+        dict: The number of files replaced in each dataset.
+    """
+    root = _require(root)
+    replaced = {}
+    for dataset in (RESULTS, STROKES):
+        replaced[dataset] = 0
+        directory = os.path.join(root, dataset)
+        if not os.path.isdir(directory):
+            continue
+        for partition in sorted(os.listdir(directory)):
+            path = os.path.join(directory, partition)
+            parts = [name for name in os.listdir(path) if name.endswith(".parquet")]
+            if len(parts) < 2:
+                continue
+            table = pq.read_table([os.path.join(path, name) for name in parts])
+            # Readers skip files starting with a dot until the rename
+            tmp = os.path.join(path, f".{COMPACTED}")
+            pq.write_table(table, tmp)
+            os.replace(tmp, os.path.join(path, COMPACTED))
+            for name in parts:
+                if name != COMPACTED:
+                    os.remove(os.path.join(path, name))
+            replaced[dataset] += len(parts)
+    return replaced
+
+
+def load(dataset: str, root: str = EXPORT_ROOT, **filters) -> "pa.Table":
+    """Read a dataset, keeping the rows whose columns equal the filters.
+
+    Args:
+        dataset (str): RESULTS or STROKES.
+        root (str): The directory of the datasets.
+        **filters: Column values to keep, e.g. season=2025 or user_id=1524007.
+
+    Returns:
+        pa.Table: The rows.
+    """
+    root = _require(root)
+    data = ds.dataset(
+        os.path.join(root, dataset), format="parquet", partitioning="hive"
+    )
+    condition = None
+    for column, value in filters.items():
+        term = ds.field(column) == value
+        condition = term if condition is None else condition & term
+    return data.to_table(filter=condition)
+
+
+def reset(root: str = EXPORT_ROOT) -> None:
+    """Delete the datasets and the record of what was exported."""
+    root = _require(root)
+    create_table()
+    conn = storage.connect(storage.DATABASE)
+    with conn:
+        conn.execute("DELETE FROM exported")
+    conn.close()
+    shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "export"
+    if command in ("export", "rebuild"):
+        if command == "rebuild":
+            reset()
+        saved = (
+            r
+            for key in cache.keys("json")
+            for r in cache.read_json("json", key).get("data", [])
+        )
+        print(export(saved))
+    elif command == "compact":
+        print(compact())
+    else:
+        print("Usage: python parquet_export.py export | rebuild | compact")
@@ -0,0 +1,258 @@
+"""
+This module syncs the results of every user and streams them to a ranking as
+they arrive, instead of ranking only once the whole sync is done.
+
+The stages run at the same time, joined by bounded queues so a fast stage waits
+for a slow one instead of filling memory:
+
+    fetch (per user) -> fetched queue -> strokes -> ready queue -> ranking
+
+- fetch: a thread pool merges each user's new results into json/ (see
+  downloader.merge_results) and queues their results.
+- strokes: worker threads download the stroke data of the pieces that need it,
+  then pass the results on.
+- ranking: the caller iterates over the pipeline on its own thread, e.g. by
+  passing it to workout_finder.rank as its results.
+
+So the ranking works on the first users' results while later users and strokes
+are still downloading, and the sync takes about as long as the slower of the
+network and the ranking rather than both.
+
+Classes:
+- SyncPipeline: The results of a sync, streamed as their stroke data lands.
+"""
+
+import concurrent.futures
+import itertools
+import queue
+import threading
+from threading import Event
+from typing import Callable
+
+import cache
+import downloader as dl
+import logs
+from manifest import Manifest
+from workouts import needs_strokes
+
+QUEUE_SIZE = 256
+STROKE_WORKERS = dl.MAX_WORKERS
+POLL = 0.1
+_DONE = object()
+
+
+class _Stopped(Exception):
+    """Raised in the stage threads when the pipeline is closed early."""
+
+
+class SyncPipeline:
+    """The results of a sync, streamed to the caller as their stroke data lands."""
+
+    def __init__(
+        self,
+        api_token: str,
+        since: str,
+        keep_from: str,
+        manifest: Manifest = None,
+        stream: bool = True,
+        rank_since: str = None,
+        progress: Callable = None,
+        cancel: Event = None,
+        queue_size: int = QUEUE_SIZE,
+    ):
+        """
+        Args:
+            api_token (str): The API token for authentication.
+            since (str): Fetch the results from this date ('YYYY-MM-DD') on.
+            keep_from (str): Drop saved results from before this date.
+            manifest (Manifest, optional): Skips and records the requests done.
+            stream (bool): Flag indicating whether to stream the saved results to
+                the caller, or only to warm the stroke data of the new ones.
+            rank_since (str, optional): Only stream results from this date on.
+                Defaults to every saved result.
+            progress (callable, optional): Called with ("sync", done, total) after
+                each user and ("strokes", done, queued) after each download.
+            cancel (Event, optional): Stops the sync when set.
+            queue_size (int): The number of results held between two stages.
+        """
+        self.api_token = api_token
+        self.since = since
+        self.keep_from = keep_from
+        self.manifest = manifest
+        self.stream = stream
+        self.rank_since = rank_since
+        self.progress = progress
+        self.cancel = cancel
+        self.new = []
+        # The stroke downloads queued, and those that saved stroke data
+        self.queued = 0
+        self.strokes = 0
+        self.error = None
+        self._fetched = queue.Queue(queue_size)
+        self._ready = queue.Queue(queue_size)
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._downloaded = itertools.count(1)
+        # The stages log as part of the run that created the pipeline
+        self._targets = [logs.in_context(self._fetch_all)] + [
+            logs.in_context(self._download_strokes)
+        ] * STROKE_WORKERS
+        self._threads = []
+
+    def __iter__(self):
+        """Run the pipeline, yielding each result once its stroke data is saved.
+
+        Raises:
+            Exception: The first error of a stage, once the stages have stopped.
+        """
+        self.start()
+        try:
+            while True:
+                result = self._ready.get()
+                if result is _DONE:
+                    break
+                yield result
+        finally:
+            self.close()
+        if self.error is not None:
+            raise self.error
+
+    def run(self) -> list:
+        """Run the pipeline to the end without ranking.
+
+        Returns:
+            list: The new results.
+        """
+        for _ in self:
+            pass
+        return self.new
+
+    def start(self) -> None:
+        """Start the fetch and stroke stages in background threads."""
+        if self._threads:
+            return
+        self._threads = [
+            threading.Thread(target=target, daemon=True) for target in self._targets
+        ]
+        for thread in self._threads:
+            thread.start()
+        threading.Thread(target=self._finish, daemon=True).start()
+
+    def close(self) -> None:
+        """Stop the stages, e.g. when the ranking fails, and wait for them."""
+        self._stop.set()
+        for thread in self._threads:
+            thread.join()
+
+    def _cancelled(self) -> bool:
+        return self.cancel is not None and self.cancel.is_set()
+
+    def _put(self, stage_queue: queue.Queue, item) -> None:
+        """Put an item on a queue, waiting while it is full unless closed."""
+        while True:
+            try:
+                stage_queue.put(item, timeout=POLL)
+                return
+            except queue.Full:
+                if self._stop.is_set():
+                    raise _Stopped() from None
+
+    def _fail(self, error: Exception) -> None:
+        with self._lock:
+            if self.error is None:
+                self.error = error
+        self._stop.set()
+
+    def _fetch_all(self) -> None:
+        """Fetch every user's results and queue them for the stroke stage."""
+        headers = {"Authorization": f"Bearer {self.api_token}"}
+        users = dl.glui()
+        counter = itertools.count(1)
+
+        def fetch(user):
+            if self._cancelled() or self._stop.is_set():
+                return
+            key = f"results/{user}"
+            if self.manifest is None or self.manifest.plan(key):
+                new, saved = dl.merge_results(
+                    user, headers, self.since, self.keep_from, self.manifest
+                )
+            else:
+                # Done by an earlier, interrupted sync
+                new = self.manifest.info(key).get("results", [])
+                saved = new
+                if cache.exists("json", user):
+                    saved = cache.read_json("json", user).get("data", [])
+            new_ids = {result["id"] for result in new}
+            with self._lock:
+                self.new += new
+            for result in saved:
+                self._put(self._fetched, (result, result["id"] in new_ids))
+            if self.progress is not None:
+                self.progress("sync", next(counter), len(users))
+
+        try:
+            with concurrent.futures.ThreadPoolExecutor(dl.MAX_WORKERS) as executor:
+                list(executor.map(logs.in_context(fetch), users))
+        except _Stopped:
+            pass
+        except Exception as e:  # pylint: disable=broad-except
+            self._fail(e)
+        finally:
+            for _ in range(STROKE_WORKERS):
+                self._fetched.put(_DONE)
+
+    def _download_strokes(self) -> None:
+        """Download the stroke data of the queued results that need it."""
+        while True:
+            item = self._fetched.get()
+            if item is _DONE:
+                return
+            if self._stop.is_set() or self._cancelled():
+                continue
+            result, is_new = item
+            ranked = self.stream and (
+                self.rank_since is None or result["date"][:10] >= self.rank_since
+            )
+            try:
+                if needs_strokes(result) and (is_new or ranked):
+                    if self._strokes(result) and self.progress is not None:
+                        self.progress("strokes", next(self._downloaded), self.queued)
+                if ranked:
+                    self._put(self._ready, result)
+            except _Stopped:
+                continue
+            except Exception as e:  # pylint: disable=broad-except
+                self._fail(e)
+
+    def _strokes(self, result: dict) -> bool:
+        """Download the stroke data of a result unless it is on disk.
+
+        Returns:
+            bool: True if the stroke data was not on disk before and is now.
+        """
+        if cache.exists("strokes", result["id"]):
+            return False
+        with self._lock:
+            self.queued += 1
+        key = f"strokes/{result['id']}"
+        if self.manifest is None or self.manifest.plan(key):
+            if not dl.get_stroke_data(result["user_id"], result["id"], self.api_token):
+                # Not saved, so the next sync requests it again
+                if self.manifest is not None:
+                    self.manifest.failed(key, "no stroke data")
+                return False
+            if self.manifest is not None:
+                self.manifest.done(key)
+        with self._lock:
+            self.strokes += 1
+        return True
+
+    def _finish(self) -> None:
+        """Mark the end of the stream once every stage has stopped."""
+        for thread in self._threads:
+            thread.join()
+        try:
+            self._put(self._ready, _DONE)
+        except _Stopped:
+            pass
@@ -0,0 +1,232 @@
+"""
+This module keeps a mean-maximal power curve for every athlete: their best average
+power for each duration from 10 seconds to 60 minutes across all of their pieces.
+
+The curve of a piece is computed from prefix sums of the energy of its strokes,
+interpolated in time, so every duration is an exact window and all windows are
+evaluated at once. Curves are stored per athlete in the user database, together
+with the results already included, so new stroke files only update the curve:
+
+    python power_curve.py update
+    python power_curve.py show
+
+Functions:
+- create_tables() -> None: Create the power curve tables in the database.
+- piece_curve(strokes: np.ndarray) -> np.ndarray: The mean-maximal power of a piece.
+- update_curves(results: Iterable, api_token: str) -> int: Add new pieces to the curves.
+- get_curve(user_id: int) -> dict: The curve of an athlete.
+- team_curves() -> dict: The curves of every athlete.
+"""
+
+import sys
+from typing import Iterable
+
+import numpy as np
+
+import cache
+import converter as cv
+import downloader as dl
+from storage import DATABASE, connect
+from stroke_reader import stream_strokes
+
+STROKES = "strokes"
+TENTHS_PER_SECOND = 10
+# Durations in seconds, from 10s to 60min
+DURATIONS = np.array(
+    [
+        10,
+        15,
+        20,
+        30,
+        45,
+        60,
+        90,
+        120,
+        180,
+        240,
+        300,
+        420,
+        600,
+        900,
+        1200,
+        1800,
+        2400,
+        3600,
+    ]
+)
+
+
+def create_tables() -> None:
+    """Create the power curve tables in the database."""
+    conn = connect(DATABASE)
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS power_curves (
+            user_id TEXT,
+            duration INTEGER,
+            watts REAL,
+            result_id INTEGER,
+            date TEXT,
+            PRIMARY KEY (user_id, duration)
+        );
+        CREATE TABLE IF NOT EXISTS power_curve_results (
+            result_id INTEGER PRIMARY KEY,
+            user_id TEXT
+        );
+    """)
+    conn.commit()
+    conn.close()
+
+
+def piece_curve(strokes: np.ndarray) -> np.ndarray:
+    """Compute the mean-maximal power of a piece for every duration.
+
+    Each stroke's power (watts = 2.80 / (pace / 500)^3) is held from the previous
+    stroke to it. Bike paces are per 1000m but go through the same formula, as on
+    the BikeErg monitor. Interval pieces, whose clocks restart after every rest, are
+    split into intervals so no window spans a rest.
+
+    Args:
+        strokes (np.ndarray): The (t, d, p, spm) rows of the piece.
+
+    Returns:
+        np.ndarray: The best average watts for each of DURATIONS, NaN if too short.
+    """
+    best = np.full(len(DURATIONS), np.nan)
+    if not len(strokes):
+        return best
+    restarts = np.flatnonzero(np.diff(strokes[:, 0]) < 0) + 1
+    for interval in np.split(strokes, restarts):
+        t = np.concatenate(([0.0], interval[:, 0] / TENTHS_PER_SECOND))
+        pace = np.maximum(interval[:, 2] / TENTHS_PER_SECOND, 1.0)
+        watts = cv.split_seconds_to_watts(pace)
+        energy = np.concatenate(([0.0], np.cumsum(watts * np.diff(t))))
+
+        # Energy of every window ending at a stroke, for every duration at once
+        starts = t[None, 1:] - DURATIONS[:, None]
+        window = energy[None, 1:] - np.interp(starts, t, energy)
+        window[starts < 0] = np.nan
+        if np.isnan(window).all():
+            continue
+        with np.errstate(all="ignore"):
+            curve = np.nanmax(window, axis=1, initial=-np.inf) / DURATIONS
+        curve[np.isinf(curve)] = np.nan
+        best = np.fmax(best, curve)
+    return best
+
+
+def update_curves(results: Iterable, api_token: str = None) -> int:
+    """Add the pieces not yet included to the curves of their athletes.
+
+    Stroke data is read from the local cache; missing files are downloaded when an
+    API token is given and the piece is skipped otherwise.
+
+    Args:
+        results (Iterable): The results to include.
+        api_token (str, optional): The API token for downloading missing strokes.
+
+    Returns:
+        int: The number of pieces added.
+    """
+    create_tables()
+    conn = connect(DATABASE)
+    cursor = conn.cursor()
+    cursor.execute("SELECT result_id FROM power_curve_results")
+    done = {row[0] for row in cursor.fetchall()}
+
+    added = 0
+    for result in results:
+        if result["id"] in done:
+            continue
+        if api_token is not None:
+            dl.get_stroke_data(result["user_id"], result["id"], api_token)
+        if not cache.exists(STROKES, result["id"]):
+            continue
+        path = cache.locate(STROKES, result["id"])
+        strokes = np.array(list(stream_strokes(path)), dtype=float).reshape(-1, 4)
+        curve = piece_curve(strokes)
+        rows = [
+            (
+                str(result["user_id"]),
+                int(d),
+                float(w),
+                result["id"],
+                result["date"][:10],
+            )
+            for d, w in zip(DURATIONS, curve)
+            if not np.isnan(w)
+        ]
+        cursor.executemany(
+            """
+            INSERT INTO power_curves (user_id, duration, watts, result_id, date)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (user_id, duration) DO UPDATE SET
+                watts = excluded.watts,
+                result_id = excluded.result_id,
+                date = excluded.date
+            WHERE excluded.watts > power_curves.watts
+            """,
+            rows,
+        )
+        cursor.execute(
+            "INSERT INTO power_curve_results (result_id, user_id) VALUES (?, ?)",
+            (result["id"], str(result["user_id"])),
+        )
+        done.add(result["id"])
+        added += 1
+
+    conn.commit()
+    conn.close()
+    return added
+
+
+def get_curve(user_id: int) -> dict:
+    """Get the curve of an athlete.
+
+    Args:
+        user_id (int): The ID of the user.
+
+    Returns:
+        dict: The watts, result ID and date of the best effort keyed by duration.
+    """
+    create_tables()
+    conn = connect(DATABASE)
+    cursor = conn.cursor()
+    cursor.execute(
+        "SELECT duration, watts, result_id, date FROM power_curves "
+        "WHERE user_id = ? ORDER BY duration",
+        (str(user_id),),
+    )
+    curve = {d: {"watts": w, "result_id": r, "date": day} for d, w, r, day in cursor}
+    conn.close()
+    return curve
+
+
+def team_curves() -> dict:
+    """Get the curves of every athlete.
+
+    Returns:
+        dict: The watts keyed by duration, keyed by user ID.
+    """
+    create_tables()
+    conn = connect(DATABASE)
+    cursor = conn.cursor()
+    cursor.execute("SELECT user_id, duration, watts FROM power_curves")
+    curves = {}
+    for user_id, duration, watts in cursor:
+        curves.setdefault(int(user_id), {})[duration] = watts
+    conn.close()
+    return curves
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "show"
+    if command == "update":
+        saved = (
+            r
+            for key in cache.keys("json")
+            for r in cache.read_json("json", key).get("data", [])
+        )
+        print(f"Added {update_curves(saved)} pieces")
+    else:
+        for athlete, athlete_curve in sorted(team_curves().items()):
+            print(athlete, {d: round(w) for d, w in sorted(athlete_curve.items())})
@@ -0,0 +1,247 @@
+"""
+This module caches the profile metadata of every athlete in the user database, so
+rankings can be split by age and category without calling the API.
+
+Profiles (date of birth, gender and weight class) are fetched concurrently for
+the athletes whose cached profile is missing or older than PROFILE_TTL, and
+written in one transaction:
+
+    python profiles.py          # refresh the stale profiles
+    python profiles.py --all    # refresh every profile
+
+Functions:
+- create_table() -> None: Create the profiles table in the database.
+- stale_users(user_ids: list, ttl: float) -> list: The users needing a fetch.
+- fetch_profiles(user_ids: list, api_token: str, ...) -> int: Refresh stale profiles.
+- get_profiles() -> dict: The cached profiles.
+- age_on(dob: str, date: str) -> int: The age of an athlete on a date.
+- age_band(age: int) -> str: The age band of an age.
+- enrich(result: dict, roster: dict, profiles: dict) -> dict: Ranking metadata.
+"""
+
+import argparse
+import concurrent.futures
+import itertools
+import logging
+from datetime import datetime, timedelta
+from threading import Event
+from typing import Callable
+
+from requests.exceptions import RequestException
+
+import database_request as dr
+import downloader as dl
+import logs
+from storage import DATABASE, connect
+
+PROFILE_TTL = 7 * 24 * 60 * 60
+DATE_FORMAT = "%Y-%m-%d"
+# Upper age limits (exclusive) of the age bands, the last one is open ended
+AGE_BANDS = ((19, "U19"), (23, "U23"), (30, "23-29"), (40, "30-39"), (50, "40-49"))
+MASTERS_BAND = "50+"
+OPEN = "open"
+LIGHTWEIGHT = "lightweight"
+NOVICE = "novice"
+
+
+def create_table() -> None:
+    """Create the profiles table in the database."""
+    conn = connect(DATABASE)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS profiles (
+            user_id TEXT PRIMARY KEY,
+            dob TEXT,
+            gender TEXT,
+            weight_class TEXT,
+            fetched TEXT
+        )
+    """)
+    conn.commit()
+    conn.close()
+
+
+def stale_users(user_ids: list, ttl: float = PROFILE_TTL) -> list:
+    """Find the users whose profile is missing or older than the TTL.
+
+    Args:
+        user_ids (list): The users to check.
+        ttl (float): The age in seconds after which a profile is fetched again.
+
+    Returns:
+        list: The user IDs needing a fetch, in the order given.
+    """
+    create_table()
+    cutoff = (datetime.now() - timedelta(seconds=ttl)).isoformat(timespec="seconds")
+    conn = connect(DATABASE)
+    cursor = conn.cursor()
+    cursor.execute("SELECT user_id FROM profiles WHERE fetched > ?", (cutoff,))
+    fresh = {int(row[0]) for row in cursor.fetchall()}
+    conn.close()
+    return [user_id for user_id in user_ids if int(user_id) not in fresh]
+
+
+def fetch_profiles(
+    user_ids: list,
+    api_token: str,
+    ttl: float = PROFILE_TTL,
+    progress: Callable = None,
+    cancel: Event = None,
+) -> int:
+    """Fetch the stale profiles concurrently and store them in one transaction.
+
+    Args:
+        user_ids (list): The users whose profiles should be fresh.
+        api_token (str): The API token for authentication.
+        ttl (float): The age in seconds after which a profile is fetched again.
+        progress (callable, optional): Called with ("profiles", done, total).
+        cancel (Event, optional): Skips the fetches left when set.
+
+    Returns:
+        int: The number of profiles fetched.
+    """
+    stale = stale_users(user_ids, ttl)
+    counter = itertools.count(1)
+
+    def fetch(user_id):
+        if cancel is not None and cancel.is_set():
+            return None
+        try:
+            profile = dl.get_profile(user_id, api_token)
+        except (RequestException, ValueError) as e:
+            logging.warning(
+                "Profile of user %s could not be fetched: %s",
+                user_id,
+                e,
+                extra={"user_id": user_id},
+            )
+            profile = None
+        if progress is not None:
+            progress("profiles", next(counter), len(stale))
+        if profile is None:
+            return None
+        return (
+            str(user_id),
+            profile.get("dob"),
+            profile.get("gender"),
+            profile.get("weight_class"),
+            datetime.now().isoformat(timespec="seconds"),
+        )
+
+    with concurrent.futures.ThreadPoolExecutor(dl.MAX_WORKERS) as executor:
+        rows = [
+            row
+            for row in executor.map(logs.in_context(fetch), stale)
+            if row is not None
+        ]
+
+    conn = connect(DATABASE)
+    with conn:
+        conn.executemany(
+            """
+            INSERT INTO profiles (user_id, dob, gender, weight_class, fetched)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (user_id) DO UPDATE SET
+                dob = excluded.dob,
+                gender = excluded.gender,
+                weight_class = excluded.weight_class,
+                fetched = excluded.fetched
+            """,
+            rows,
+        )
+    conn.close()
+    return len(rows)
+
+
+def get_profiles() -> dict:
+    """Get the cached profiles.
+
+    Returns:
+        dict: The dob, gender, weight class and fetch time keyed by user ID.
+    """
+    create_table()
+    conn = connect(DATABASE)
+    cursor = conn.cursor()
+    cursor.execute("SELECT user_id, dob, gender, weight_class, fetched FROM profiles")
+    profiles = {
+        int(user_id): {
+            "dob": dob,
+            "gender": gender,
+            "weight_class": weight_class,
+            "fetched": fetched,
+        }
+        for user_id, dob, gender, weight_class, fetched in cursor.fetchall()
+    }
+    conn.close()
+    return profiles
+
+
+def age_on(dob: str, date: str = None) -> int:
+    """Get the age of an athlete on a date.
+
+    Args:
+        dob (str): The date of birth ('YYYY-MM-DD').
+        date (str, optional): The date ('YYYY-MM-DD...'). Defaults to today.
+
+    Returns:
+        int: The age in whole years, or None if the date of birth is unknown.
+    """
+    if not dob:
+        return None
+    born = datetime.strptime(dob[:10], DATE_FORMAT)
+    day = datetime.strptime(date[:10], DATE_FORMAT) if date else datetime.now()
+    age = day.year - born.year
+    if (day.month, day.day) < (born.month, born.day):
+        age -= 1
+    return age
+
+
+def age_band(age: int) -> str:
+    """Get the age band of an age, or None if the age is unknown."""
+    if age is None:
+        return None
+    for limit, band in AGE_BANDS:
+        if age < limit:
+            return band
+    return MASTERS_BAND
+
+
+def enrich(result: dict, roster: dict, profiles: dict) -> dict:
+    """Get the age and category of the athlete of a result from local data.
+
+    Roster flags come from the users table; an athlete is also lightweight if
+    their Concept2 profile says so.
+
+    Args:
+        result (dict): The result as returned by the Concept2 API.
+        roster (dict): The roster, as returned by database_request.get_roster.
+        profiles (dict): The cached profiles, as returned by get_profiles.
+
+    Returns:
+        dict: The age on the day of the result, age band, gender, lightweight and
+        novice flags and category (novice, lightweight or open).
+    """
+    flags = roster.get(result["user_id"], {})
+    profile = profiles.get(result["user_id"], {})
+    age = age_on(profile.get("dob"), result["date"])
+    lightweight = bool(flags.get("lightweight")) or profile.get("weight_class") == "L"
+    novice = bool(flags.get("novice"))
+    return {
+        "age": age,
+        "age_band": age_band(age),
+        "gender": profile.get("gender"),
+        "lightweight": lightweight,
+        "novice": novice,
+        "category": NOVICE if novice else LIGHTWEIGHT if lightweight else OPEN,
+    }
+
+
+if __name__ == "__main__":
+    import authorization as auth
+
+    parser = argparse.ArgumentParser(description="Refresh the cached profiles.")
+    parser.add_argument("--all", action="store_true", help="ignore the TTL")
+    args = parser.parse_args()
+    fetched = fetch_profiles(
+        dr.get_list_user_ids(), auth.auth(), 0 if args.all else PROFILE_TTL
+    )
+    print(f"Fetched {fetched} profiles")
@@ -0,0 +1,236 @@
+"""
+This module replays several pieces of the same workout as one race, so coaches
+can compare how the athletes paced it.
+
+The strokes of every piece are resampled onto a common distance grid with
+np.interp, giving each athlete's time at every grid distance (the vectorized
+form of workout_finder.find_approx). From the grid:
+
+- time gaps: how many seconds each athlete is behind the leader at each distance.
+- distance gaps: how many meters each athlete is behind the leader when the
+  leader passes each distance, i.e. the gaps on the water.
+- splits and split deltas: each athlete's split (s/500m) over every split_length
+  meters and its difference from the winner's split.
+
+The replay is saved to an Excel file with a chart of the gaps and the split
+deltas:
+
+    python race_replay.py 1524007 1524113 1530250 --step 10 --split 500
+
+Functions:
+- piece_track(strokes: np.ndarray, result: dict) -> tuple: The distance and time of a piece.
+- replay(results: list, step: float, split_length: float) -> dict: Replay pieces as a race.
+- race(tracks: list, step: float, split_length: float) -> dict: Race the tracks of pieces.
+- find_results(result_ids: list) -> list: Look up saved results by ID.
+- save_replay(replayed: dict, path: str) -> None: Save a replay and its charts to Excel.
+"""
+
+import argparse
+import os
+from datetime import datetime
+
+import numpy as np
+from openpyxl import Workbook
+from openpyxl.chart import LineChart, Reference
+from openpyxl.utils import get_column_letter
+
+import converter as cv
+import database_request as dr
+import storage
+import workout_finder as wf
+from interval_analysis import D, T, load_strokes, segment
+from workouts import BIKE_DISTANCE_FACTOR
+
+GRID_STEP = 10
+SPLIT_LENGTH = 500
+TENTHS_PER_SECOND = 10
+DECIMETERS_PER_METER = 10
+
+
+def piece_track(strokes: np.ndarray, result: dict) -> tuple:
+    """Get the distance and time covered at every stroke of a piece.
+
+    Intervals are joined end to end, leaving out the rests, and bike distance is
+    converted to rower meters.
+
+    Args:
+        strokes (np.ndarray): The (t, d, p, spm) rows of the piece.
+        result (dict): The result the strokes belong to.
+
+    Returns:
+        tuple: The distances in meters, never decreasing, and the times in
+        seconds, both starting at 0.
+    """
+    strokes = strokes.copy()
+    ids = segment(strokes, result)
+    t, d = strokes[:, T], strokes[:, D]
+    if ids[-1] > 0:
+        # Add the end of every earlier interval to the counters of the later ones
+        ends = np.flatnonzero(np.diff(ids))
+        t = t + np.concatenate(([0], np.cumsum(t[ends])))[ids]
+        d = d + np.concatenate(([0], np.cumsum(d[ends])))[ids]
+    if result.get("type") == "bike":
+        d = d / BIKE_DISTANCE_FACTOR
+    distance = np.maximum.accumulate(np.concatenate(([0.0], d / DECIMETERS_PER_METER)))
+    time = np.concatenate(([0.0], t / TENTHS_PER_SECOND))
+    return distance, time
+
+
+def replay(
+    results: list, step: float = GRID_STEP, split_length: float = SPLIT_LENGTH
+) -> dict:
+    """Replay several pieces as one race on a common distance grid.
+
+    The grid runs from 0 to the shortest of the pieces, so every athlete is on
+    it from start to finish.
+
+    Args:
+        results (list): The results to replay; their stroke data must be saved.
+        step (float): The spacing of the distance grid in meters.
+        split_length (float): The length of each split in meters.
+
+    Returns:
+        dict: The replay, with NumPy arrays of one row per result:
+            results: The results, in the order given.
+            grid: The distances of the grid in meters.
+            times: The time of each athlete at each grid distance in seconds.
+            time_gaps: The seconds behind the leader at each grid distance.
+            distance_gaps: The meters behind the leader when the leader passes
+                each grid distance.
+            split_ends: The distance at the end of each split in meters.
+            splits: The split of each athlete over each split (s/500m).
+            split_deltas: The difference from the winner's split (s/500m).
+            winner: The index of the fastest result over the grid.
+    """
+    tracks = [piece_track(load_strokes(r["id"]), r) for r in results]
+    return {"results": list(results), **race(tracks, step, split_length)}
+
+
+def race(
+    tracks: list, step: float = GRID_STEP, split_length: float = SPLIT_LENGTH
+) -> dict:
+    """Race the (distance, time) tracks of several pieces on a common grid.
+
+    Returns:
+        dict: The replay as returned by replay, without the results.
+    """
+    finish = min(distance[-1] for distance, _ in tracks)
+    grid = np.append(np.arange(0, finish, step, dtype=float), finish)
+    times = np.vstack([np.interp(grid, d, t) for d, t in tracks])
+
+    # The leader at each distance is whoever got there first
+    leader_time = times.min(axis=0)
+    time_gaps = times - leader_time
+    positions = np.vstack([np.interp(leader_time, t, d) for d, t in tracks])
+    distance_gaps = grid - np.minimum(positions, grid)
+
+    split_ends = np.append(np.arange(split_length, finish, split_length), finish)
+    at_ends = np.vstack([np.interp(np.append(0, split_ends), d, t) for d, t in tracks])
+    splits = np.diff(at_ends, axis=1) / np.diff(np.append(0, split_ends)) * 500
+    winner = int(np.argmin(times[:, -1]))
+
+    return {
+        "grid": grid,
+        "times": times,
+        "time_gaps": time_gaps,
+        "distance_gaps": distance_gaps,
+        "split_ends": split_ends,
+        "splits": splits,
+        "split_deltas": splits - splits[winner],
+        "winner": winner,
+    }
+
+
+def find_results(result_ids: list) -> list:
+    """Look up saved results by ID, in the order given.
+
+    Raises:
+        KeyError: If a result is not saved.
+    """
+    wanted = {int(result_id) for result_id in result_ids}
+    found = {r["id"]: r for r in wf.iter_results() if r["id"] in wanted}
+    missing = wanted - set(found)
+    if missing:
+        raise KeyError(f"Results not saved: {sorted(missing)}")
+    return [found[int(result_id)] for result_id in result_ids]
+
+
+def save_replay(replayed: dict, path: str) -> None:
+    """Save a replay to an Excel file with line charts of the gaps and splits.
+
+    Args:
+        replayed (dict): The replay, as returned by replay.
+        path (str): The Excel file to write.
+    """
+    names = [
+        f"{cv.format_name(dr.get_name(r['user_id']))} {r['date'][:wf.DATE_CONSTANT]}"
+        for r in replayed["results"]
+    ]
+    wb = Workbook()
+    sheets = [
+        (
+            "Time gaps",
+            "Distance (m)",
+            replayed["grid"],
+            replayed["time_gaps"],
+            "Seconds behind",
+        ),
+        (
+            "Distance gaps",
+            "Distance (m)",
+            replayed["grid"],
+            replayed["distance_gaps"],
+            "Meters behind",
+        ),
+        (
+            "Split deltas",
+            "Split end (m)",
+            replayed["split_ends"],
+            replayed["split_deltas"],
+            "Split - winner's split (s/500m)",
+        ),
+    ]
+    for index, (title, x_title, x, values, y_title) in enumerate(sheets):
+        ws = wb.active if index == 0 else wb.create_sheet()
+        ws.title = title
+        ws.append([x_title] + names)
+        for column, row in zip(x, values.T):
+            ws.append([round(float(column), 1)] + [round(float(v), 2) for v in row])
+        chart = LineChart()
+        chart.title = title
+        chart.x_axis.title = x_title
+        chart.y_axis.title = y_title
+        chart.add_data(
+            Reference(
+                ws, min_col=2, max_col=len(names) + 1, min_row=1, max_row=len(x) + 1
+            ),
+            titles_from_data=True,
+        )
+        chart.set_categories(Reference(ws, min_col=1, min_row=2, max_row=len(x) + 1))
+        chart.width, chart.height = 30, 15
+        ws.add_chart(chart, f"{get_column_letter(len(names) + 3)}2")
+
+    ws = wb.create_sheet("Splits")
+    ws.append(["Split end (m)"] + names)
+    for end, row in zip(replayed["split_ends"], replayed["splits"].T):
+        ws.append(
+            [round(float(end))]
+            + [cv.time_to_real(float(v) * TENTHS_PER_SECOND) for v in row]
+        )
+
+    with storage.atomic(path, "wb") as f:
+        wb.save(f)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay pieces as one race.")
+    parser.add_argument("result_ids", nargs="+", type=int)
+    parser.add_argument("--step", type=float, default=GRID_STEP)
+    parser.add_argument("--split", type=float, default=SPLIT_LENGTH)
+    args = parser.parse_args()
+
+    replayed = replay(find_results(args.result_ids), args.step, args.split)
+    today = datetime.today().strftime("%Y-%m-%d")
+    output = os.path.join("results", f"{today}_replay.xlsx")
+    save_replay(replayed, output)
+    print(f"Saved {output}")
@@ -0,0 +1,164 @@
+"""
+This module contains the typed row a result is ranked with.
+
+A RankingRow keeps the numeric values of a result: the time in tenths of a
+second, the distance in meters, the split in tenths of a second per 500m, the
+watts and the stroke rate, with the splits of the piece. Rows are sorted and
+filtered on these values and only formatted for display when a ranking is saved,
+using the column schema of the workout kind in workouts.COLUMNS.
+
+Classes:
+- RankingRow: The typed ranking row of a result.
+"""
+
+import converter as cv
+from workouts import BIKE_DISTANCE_FACTOR, COLUMNS, RANK_BY
+
+BIKE = "bike"
+TENTHS_PER_SECOND = 10
+TENTHS_PER_MINUTE = 600
+DATE_CONSTANT = 10
+
+# How each field is displayed; the others are displayed as they are
+FORMATS = {
+    "time": cv.time_to_real,
+    "split": cv.time_to_real,
+    "watts": round,
+    "distance": round,
+}
+
+
+class RankingRow:
+    """The typed ranking row of a result, with a slot per field."""
+
+    __slots__ = (
+        "name",
+        "erg",
+        "date",
+        "time",
+        "distance",
+        "split",
+        "watts",
+        "spm",
+        "splits",
+    )
+
+    def __init__(
+        self,
+        name: str,
+        erg: str,
+        date: str,
+        time: int,
+        distance: float,
+        split: float,
+        watts: float,
+        spm: int,
+        splits: tuple = (),
+    ):
+        """
+        Args:
+            name (str): The name of the athlete, as 'Last, First'.
+            erg (str): "bike" for bike results, or "".
+            date (str): The date of the result ('YYYY-MM-DD').
+            time (int): The time in tenths of a second.
+            distance (float): The distance in meters, as rowed or biked.
+            split (float): The average split in tenths of a second per 500m.
+            watts (float): The average watts.
+            spm (int): The average stroke rate.
+            splits (tuple): The split of each part of the piece, in tenths of a
+                second per 500m.
+        """
+        self.name = name
+        self.erg = erg
+        self.date = date
+        self.time = time
+        self.distance = distance
+        self.split = split
+        self.watts = watts
+        self.spm = spm
+        self.splits = tuple(splits)
+
+    @classmethod
+    def from_result(cls, result: dict, name: str, splits: tuple = ()) -> "RankingRow":
+        """Create the row of a Concept2 result.
+
+        The split and watts of bike results are taken over the halved distance,
+        so bikes and ergs are comparable.
+
+        Args:
+            result (dict): The result as returned by the Concept2 API.
+            name (str): The name of the athlete, as 'Last, First'.
+            splits (tuple): The split of each part of the piece.
+
+        Returns:
+            RankingRow: The row of the result.
+        """
+        distance = result["distance"]
+        if result["type"] == BIKE:
+            distance /= BIKE_DISTANCE_FACTOR
+        split = cv.split_tenths(result["time"], distance)
+        if "stroke_rate" in result:
+            spm = result["stroke_rate"]
+        else:
+            spm = result["stroke_count"] // (result["time"] / TENTHS_PER_MINUTE)
+        return cls(
+            name,
+            BIKE if result["type"] == BIKE else "",
+            result["date"][:DATE_CONSTANT],
+            result["time"],
+            result["distance"],
+            split,
+            cv.split_seconds_to_watts(split / TENTHS_PER_SECOND),
+            int(spm),
+            splits,
+        )
+
+    def key(self, kind: str) -> tuple:
+        """
+        The sort key of the row in a ranking of a workout kind: bikes first, then
+        best first by the field the kind is ranked by.
+
+        Ties go to the earlier result, then by name, so the ranking does not
+        depend on the order the results are read or synced in.
+
+        Args:
+            kind (str): The kind of the workout, a key of workouts.RANK_BY.
+
+        Returns:
+            tuple: The sort key, lowest first.
+        """
+        field, higher_is_better = RANK_BY[kind]
+        value = getattr(self, field)
+        return (
+            self.erg != BIKE,
+            -value if higher_is_better else value,
+            self.date,
+            self.name,
+        )
+
+    def cells(self, kind: str) -> list:
+        """
+        Format the row for display, in the columns of a workout kind.
+
+        Args:
+            kind (str): The kind of the workout, a key of workouts.COLUMNS.
+
+        Returns:
+            list: The cells of the columns, then of the splits.
+        """
+        cells = []
+        for _, field in COLUMNS[kind]:
+            value = getattr(self, field)
+            cells.append(FORMATS[field](value) if field in FORMATS else value)
+        return cells + [cv.time_to_real(split) for split in self.splits]
+
+    def as_dict(self) -> dict:
+        """Get the typed values of the row, e.g. for a JSON export."""
+        values = {field: getattr(self, field) for field in self.__slots__}
+        values["splits"] = list(self.splits)
+        return values
+
+    def __repr__(self) -> str:
+        return (
+            f"RankingRow({', '.join(f'{k}={v!r}' for k, v in self.as_dict().items())})"
+        )
@@ -0,0 +1,267 @@
+"""
+This module imports and exports the roster in the users table in bulk, from and
+to CSV or JSON files.
+
+Rows are validated before anything is written. A valid file is then upserted
+with a single executemany in one transaction: new athletes are inserted, and the
+name, lightweight and novice flags of existing ones are updated while their PBs
+are kept. A file with any invalid row is rejected as a whole.
+
+    python roster.py import roster.csv
+    python roster.py export roster.json
+    python roster.py bench --rows 50000
+
+CSV files have a header row with at least user_id and name; JSON files hold a
+list of objects with the same keys. lightweight and novice are optional and
+accept true/false, yes/no, y/n, 1/0 or an empty value.
+
+Functions:
+- create_table(database: str) -> None: Create the users table in the database.
+- read_rows(path: str) -> list: Read the rows of a roster file.
+- validate(rows: list) -> list: Convert rows to users, raising on invalid rows.
+- import_roster(path: str, database: str) -> int: Upsert a roster file.
+- export_roster(path: str, database: str) -> int: Write the roster to a file.
+- benchmark(rows: int) -> dict: Time importing and exporting a synthetic roster.
+"""
+
+import argparse
+import csv
+import json
+import os
+import random
+import tempfile
+import time
+
+from storage import DATABASE, connect
+
+FIELDS = ("user_id", "name", "lightweight", "novice")
+TRUE = {"true", "yes", "y", "1"}
+FALSE = {"false", "no", "n", "0", ""}
+MAX_REPORTED = 10
+
+UPSERT = """
+    INSERT INTO users (user_id, name, lightweight, novice) VALUES (?, ?, ?, ?)
+    ON CONFLICT (user_id) DO UPDATE SET
+        name = excluded.name,
+        lightweight = excluded.lightweight,
+        novice = excluded.novice
+"""
+
+
+def create_table(database: str = DATABASE) -> None:
+    """Create the users table in the database."""
+    con = connect(database)
+    marker = con.cursor()
+    marker.execute("""
+        CREATE TABLE IF NOT EXISTS users (
+            user_id TEXT PRIMARY KEY,
+            name TEXT,
+            lightweight BOOLEAN,
+            novice BOOLEAN,
+            One_Minute TEXT,
+            One_KM TEXT,
+            Two_KM TEXT,
+            Six_KM TEXT,
+            Hour TEXT,
+            Fourx1K TEXT,
+            Threex6k TEXT,
+            Threex12Min TEXT,
+            Threex30Min TEXT,
+            Peak_Power INTEGER
+        )
+    """)
+    con.commit()
+    con.close()
+
+
+def read_rows(path: str) -> list:
+    """Read the rows of a CSV or JSON roster file.
+
+    Args:
+        path (str): The file to read; the format is chosen by its extension.
+
+    Returns:
+        list: The rows as dictionaries.
+
+    Raises:
+        ValueError: If the file is not a CSV or JSON roster.
+    """
+    if path.lower().endswith(".json"):
+        with open(path, "r", encoding="utf-8") as f:
+            rows = json.load(f)
+        if not isinstance(rows, list) or not all(isinstance(r, dict) for r in rows):
+            raise ValueError(f"{path} does not hold a list of athletes")
+        return rows
+    if path.lower().endswith(".csv"):
+        with open(path, "r", encoding="utf-8-sig", newline="") as f:
+            reader = csv.DictReader(f)
+            missing = {"user_id", "name"} - set(reader.fieldnames or ())
+            if missing:
+                raise ValueError(f"{path} has no {', '.join(sorted(missing))} column")
+            return list(reader)
+    raise ValueError(f"{path} is not a .csv or .json file")
+
+
+def _flag(value) -> bool:
+    """Parse a lightweight or novice flag."""
+    if isinstance(value, bool):
+        return value
+    text = "" if value is None else str(value).strip().lower()
+    if text in TRUE:
+        return True
+    if text in FALSE:
+        return False
+    raise ValueError(f"{value!r} is not a yes/no value")
+
+
+def validate(rows: list) -> list:
+    """Convert roster rows to users table rows.
+
+    Args:
+        rows (list): The rows as dictionaries, as returned by read_rows.
+
+    Returns:
+        list: The (user_id, name, lightweight, novice) tuples, in file order.
+
+    Raises:
+        ValueError: Listing the first invalid rows, if there are any.
+    """
+    users, errors, seen = [], [], {}
+    for number, row in enumerate(rows, start=1):
+        user_id = str(row.get("user_id") or "").strip()
+        name = str(row.get("name") or "").strip()
+        try:
+            if not user_id.isdigit():
+                raise ValueError(f"user_id {user_id!r} is not a Concept2 user ID")
+            if not name:
+                raise ValueError("name is empty")
+            if user_id in seen:
+                raise ValueError(f"user_id {user_id} is also in row {seen[user_id]}")
+            lightweight = _flag(row.get("lightweight"))
+            novice = _flag(row.get("novice"))
+        except ValueError as e:
+            errors.append(f"row {number}: {e}")
+            continue
+        seen[user_id] = number
+        users.append((user_id, name, lightweight, novice))
+    if errors:
+        more = len(errors) - MAX_REPORTED
+        report = errors[:MAX_REPORTED] + ([f"and {more} more"] if more > 0 else [])
+        raise ValueError("Invalid roster:\n" + "\n".join(report))
+    return users
+
+
+def import_roster(path: str, database: str = DATABASE) -> int:
+    """Validate a roster file and upsert it into the users table in one transaction.
+
+    Args:
+        path (str): The CSV or JSON roster file.
+        database (str): The user database.
+
+    Returns:
+        int: The number of athletes imported.
+
+    Raises:
+        ValueError: If the file or any of its rows is invalid; nothing is written.
+    """
+    users = validate(read_rows(path))
+    create_table(database)
+    con = connect(database)
+    try:
+        with con:
+            con.executemany(UPSERT, users)
+    finally:
+        con.close()
+    return len(users)
+
+
+def export_roster(path: str, database: str = DATABASE) -> int:
+    """Write the users table to a CSV or JSON roster file.
+
+    Args:
+        path (str): The file to write; the format is chosen by its extension.
+        database (str): The user database.
+
+    Returns:
+        int: The number of athletes exported.
+
+    Raises:
+        ValueError: If the path is not a .csv or .json file.
+    """
+    if not path.lower().endswith((".csv", ".json")):
+        raise ValueError(f"{path} is not a .csv or .json file")
+    create_table(database)
+    con = connect(database)
+    cursor = con.cursor()
+    cursor.execute(
+        "SELECT user_id, name, lightweight, novice FROM users ORDER BY name, user_id"
+    )
+    rows = [
+        {"user_id": user_id, "name": name, "lightweight": bool(lw), "novice": bool(nov)}
+        for user_id, name, lw, nov in cursor.fetchall()
+    ]
+    con.close()
+    if path.lower().endswith(".json"):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(rows, f, indent=4)
+    else:
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=FIELDS)
+            writer.writeheader()
+            writer.writerows(rows)
+    return len(rows)
+
+
+def benchmark(rows: int = 50000) -> dict:
+    """Time importing and exporting a synthetic roster in a temporary database.
+
+    Args:
+        rows (int): The number of athletes in the roster.
+
+    Returns:
+        dict: The seconds and rows per second of the import and the export.
+    """
+    rng = random.Random(rows)
+    with tempfile.TemporaryDirectory() as tmp:
+        database = os.path.join(tmp, "users.db")
+        source = os.path.join(tmp, "roster.csv")
+        with open(source, "w", encoding="utf-8", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(FIELDS)
+            for n in range(rows):
+                flags = (rng.choice("yn"), rng.choice("yn"))
+                writer.writerow((1000000 + n, f"Athlete {n}", *flags))
+
+        start = time.perf_counter()
+        import_roster(source, database)
+        imported = time.perf_counter() - start
+        start = time.perf_counter()
+        export_roster(os.path.join(tmp, "export.csv"), database)
+        exported = time.perf_counter() - start
+    return {
+        "rows": rows,
+        "import_seconds": round(imported, 3),
+        "import_rows_per_second": round(rows / imported),
+        "export_seconds": round(exported, 3),
+        "export_rows_per_second": round(rows / exported),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import or export the roster.")
+    parser.add_argument("command", choices=["import", "export", "bench"])
+    parser.add_argument("path", nargs="?", help="the .csv or .json roster file")
+    parser.add_argument("--rows", type=int, default=50000)
+    args = parser.parse_args()
+
+    if args.command == "bench":
+        print(benchmark(args.rows))
+    elif not args.path:
+        parser.error(f"{args.command} needs a roster file")
+    elif args.command == "import":
+        try:
+            print(f"Imported {import_roster(args.path)} athletes")
+        except ValueError as e:
+            print(e)
+    else:
+        print(f"Exported {export_roster(args.path)} athletes")
@@ -0,0 +1,371 @@
+"""
+This module decides where the caches, the user database and the outputs are
+stored, so they can live in any directory, or in memory for tests and benchmarks.
+
+Paths keep the form they always had, starting with an area: json/, strokes/,
+history/, data/ or results/, e.g. "json/1524007.json.gz" or "data/user_database.db". The
+storage in use maps them:
+
+- FileStorage: files under a root directory, the working directory by default,
+  and any area under a root of its own.
+- MemoryStorage: files in a dictionary and the user database in a shared
+  in-memory SQLite database, so nothing touches the disk.
+
+Paths outside the areas, such as absolute paths, are always files on disk.
+
+The roots can be set with VALKYRIE_ROOT and VALKYRIE_<AREA>_ROOT, e.g.
+
+    VALKYRIE_ROOT=/mnt/tmpfs/valkyrie python sync.py --once
+
+or in code, which is how tests run a ranking in memory:
+
+    with storage.using(storage.MemoryStorage()):
+        workout_finder.rank(token, "2k")
+
+Classes:
+- FileStorage: Files under configurable root directories.
+- MemoryStorage: Files and the user database in memory.
+
+Functions:
+- atomic_path(path: str) -> Iterator[str]: Write a file on disk under a temporary name first.
+- get() -> FileStorage: The storage in use.
+- configure(backend: FileStorage) -> FileStorage: Change the storage in use.
+- using(backend: FileStorage): Context manager using a storage within a block.
+- open_file(path: str, mode: str, encoding: str) -> IO: Open a file.
+- atomic(path: str, mode: str, encoding: str) -> Iterator[IO]: Write a file atomically.
+- exists(path: str) -> bool: Check if a file exists.
+- listdir(directory: str) -> list: List the files in a directory.
+- remove(path: str) -> None: Delete a file.
+- mtime(path: str) -> float: The modification time of a file.
+- size(path: str) -> int: The size of a file in bytes.
+- connect(database: str) -> Connection: Connect to a SQLite database.
+- local_path(path: str) -> str: The path on disk of a file, if it has one.
+"""
+
+import io
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import IO, Iterator
+
+AREAS = ("json", "strokes", "history", "data", "results")
+DATABASE = "data/user_database.db"
+TMP_SUFFIX = ".tmp"
+
+
+@contextmanager
+def atomic_path(path: str) -> Iterator[str]:
+    """Yield a temporary path to write a file to, renamed over path once written.
+
+    The file is flushed to disk before the rename, and removed if writing fails,
+    so path always holds either the old or the complete new file.
+    """
+    directory, name = os.path.split(path)
+    fd, tmp = tempfile.mkstemp(
+        prefix=f"{name}.", suffix=TMP_SUFFIX, dir=directory or "."
+    )
+    os.close(fd)
+    try:
+        yield tmp
+        with open(tmp, "rb") as f:
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def _split(path: str) -> tuple:
+    """Split a path into its area and the rest, or (None, path) outside the areas."""
+    if os.path.isabs(path):
+        return None, path
+    parts = os.path.normpath(path).split(os.sep)
+    if parts[0] not in AREAS:
+        return None, path
+    return parts[0], "/".join(parts[1:])
+
+
+def _writes(mode: str) -> bool:
+    return any(flag in mode for flag in "wax+")
+
+
+class FileStorage:
+    """Files under a root directory, each area optionally under a root of its own."""
+
+    def __init__(self, root: str = ".", **roots):
+        """
+        Args:
+            root (str): The directory holding the areas.
+            **roots: The directory of an area, e.g. strokes="/mnt/tmpfs/strokes".
+
+        Raises:
+            ValueError: If a root is given for an unknown area.
+        """
+        unknown = set(roots) - set(AREAS)
+        if unknown:
+            raise ValueError(f"Unknown storage areas: {sorted(unknown)}")
+        self.root = root
+        self.roots = {
+            area: roots.get(area) or os.path.join(root, area) for area in AREAS
+        }
+
+    def local_path(self, path: str) -> str:
+        """Get the path on disk of a file, or None if it is not on disk."""
+        area, rest = _split(path)
+        if area is None:
+            return path
+        return os.path.join(self.roots[area], rest) if rest else self.roots[area]
+
+    def open_file(self, path: str, mode: str = "r", encoding: str = None) -> IO:
+        """Open a file like open, creating its directory when writing."""
+        local = self.local_path(path)
+        if _writes(mode):
+            os.makedirs(os.path.dirname(local) or ".", exist_ok=True)
+        return open(local, mode, encoding=encoding)
+
+    @contextmanager
+    def atomic(self, path: str, mode: str = "w", encoding: str = None):
+        """Open a file for writing that replaces path only once fully written."""
+        local = self.local_path(path)
+        os.makedirs(os.path.dirname(local) or ".", exist_ok=True)
+        with atomic_path(local) as tmp:
+            with open(tmp, mode, encoding=encoding) as f:
+                yield f
+
+    def exists(self, path: str) -> bool:
+        return os.path.exists(self.local_path(path))
+
+    def listdir(self, directory: str) -> list:
+        """List the names in a directory, sorted, or nothing if it does not exist."""
+        local = self.local_path(directory)
+        return sorted(os.listdir(local)) if os.path.isdir(local) else []
+
+    def remove(self, path: str) -> None:
+        os.remove(self.local_path(path))
+
+    def mtime(self, path: str) -> float:
+        return os.path.getmtime(self.local_path(path))
+
+    def size(self, path: str) -> int:
+        return os.path.getsize(self.local_path(path))
+
+    def connect(self, database: str = DATABASE) -> sqlite3.Connection:
+        """Connect to a SQLite database, creating its directory."""
+        local = self.local_path(database)
+        os.makedirs(os.path.dirname(local) or ".", exist_ok=True)
+        return sqlite3.connect(local)
+
+
+class _MemoryFile(io.BytesIO):
+    """A file being written to memory, saved when closed unless discarded."""
+
+    def __init__(self, storage: "MemoryStorage", key: str, initial: bytes = b""):
+        super().__init__(initial)
+        self.seek(0, io.SEEK_END)
+        self.storage = storage
+        self.key = key
+        self.discard = False
+
+    def close(self) -> None:
+        if not self.closed and not self.discard:
+            self.storage._save(self.key, self.getvalue())
+        super().close()
+
+
+class MemoryStorage(FileStorage):
+    """The areas in memory; paths outside them are still files on disk."""
+
+    def __init__(self):
+        super().__init__(root=".")
+        self._files = {}
+        self._mtimes = {}
+        self._lock = threading.Lock()
+        self._databases = {}
+        self._name = uuid.uuid4().hex
+
+    def _save(self, key: str, data: bytes) -> None:
+        with self._lock:
+            self._files[key] = data
+            self._mtimes[key] = time.time()
+
+    def local_path(self, path: str) -> str:
+        area, _ = _split(path)
+        return path if area is None else None
+
+    def open_file(self, path: str, mode: str = "r", encoding: str = None) -> IO:
+        area, rest = _split(path)
+        if area is None:
+            return super().open_file(path, mode, encoding)
+        key = f"{area}/{rest}"
+        if _writes(mode):
+            initial = self._files.get(key, b"") if "a" in mode else b""
+            raw = _MemoryFile(self, key, initial)
+        else:
+            with self._lock:
+                if key not in self._files:
+                    raise FileNotFoundError(f"No such file in memory: {key}")
+                raw = io.BytesIO(self._files[key])
+        if "b" in mode:
+            return raw
+        return io.TextIOWrapper(raw, encoding=encoding or "utf-8", newline="")
+
+    @contextmanager
+    def atomic(self, path: str, mode: str = "w", encoding: str = None):
+        area, _ = _split(path)
+        if area is None:
+            with super().atomic(path, mode, encoding) as f:
+                yield f
+            return
+        f = self.open_file(path, mode, encoding)
+        raw = f if isinstance(f, _MemoryFile) else f.buffer
+        try:
+            yield f
+        except BaseException:
+            raw.discard = True
+            raise
+        finally:
+            f.close()
+
+    def exists(self, path: str) -> bool:
+        area, rest = _split(path)
+        if area is None:
+            return super().exists(path)
+        key = f"{area}/{rest}" if rest else area
+        with self._lock:
+            return key in self._files or any(
+                name.startswith(f"{key}/") for name in self._files
+            )
+
+    def listdir(self, directory: str) -> list:
+        area, rest = _split(directory)
+        if area is None:
+            return super().listdir(directory)
+        prefix = f"{area}/{rest}/" if rest else f"{area}/"
+        with self._lock:
+            names = {
+                name[len(prefix) :].split("/")[0]
+                for name in self._files
+                if name.startswith(prefix)
+            }
+        return sorted(names)
+
+    def remove(self, path: str) -> None:
+        area, rest = _split(path)
+        if area is None:
+            return super().remove(path)
+        with self._lock:
+            if self._files.pop(f"{area}/{rest}", None) is None:
+                raise FileNotFoundError(f"No such file in memory: {area}/{rest}")
+        return None
+
+    def mtime(self, path: str) -> float:
+        area, rest = _split(path)
+        if area is None:
+            return super().mtime(path)
+        return self._mtimes[f"{area}/{rest}"]
+
+    def size(self, path: str) -> int:
+        area, rest = _split(path)
+        if area is None:
+            return super().size(path)
+        return len(self._files[f"{area}/{rest}"])
+
+    def connect(self, database: str = DATABASE) -> sqlite3.Connection:
+        """Connect to an in-memory database shared by every connection to it."""
+        area, rest = _split(database)
+        if area is None:
+            return super().connect(database)
+        uri = f"file:{self._name}-{area}-{rest}?mode=memory&cache=shared"
+        with self._lock:
+            if uri not in self._databases:
+                # The database lives as long as one connection to it is open
+                self._databases[uri] = sqlite3.connect(
+                    uri, uri=True, check_same_thread=False
+                )
+        return sqlite3.connect(uri, uri=True)
+
+
+_storage = FileStorage(
+    os.environ.get("VALKYRIE_ROOT", "."),
+    **{
+        area: os.environ[f"VALKYRIE_{area.upper()}_ROOT"]
+        for area in AREAS
+        if f"VALKYRIE_{area.upper()}_ROOT" in os.environ
+    },
+)
+
+
+def get() -> FileStorage:
+    """Get the storage in use."""
+    return _storage
+
+
+def configure(backend: FileStorage) -> FileStorage:
+    """Change the storage in use.
+
+    Returns:
+        FileStorage: The storage used before.
+    """
+    global _storage
+    previous, _storage = _storage, backend
+    return previous
+
+
+@contextmanager
+def using(backend: FileStorage):
+    """Use a storage within a block, e.g. MemoryStorage in a test."""
+    previous = configure(backend)
+    try:
+        yield backend
+    finally:
+        configure(previous)
+
+
+def open_file(path: str, mode: str = "r", encoding: str = None) -> IO:
+    """Open a file of the storage in use like open."""
+    return _storage.open_file(path, mode, encoding)
+
+
+def atomic(path: str, mode: str = "w", encoding: str = None):
+    """Open a file for writing that replaces path only once fully written."""
+    return _storage.atomic(path, mode, encoding)
+
+
+def exists(path: str) -> bool:
+    """Check if a file or directory exists in the storage in use."""
+    return _storage.exists(path)
+
+
+def listdir(directory: str) -> list:
+    """List the names in a directory, sorted, or nothing if it does not exist."""
+    return _storage.listdir(directory)
+
+
+def remove(path: str) -> None:
+    """Delete a file."""
+    _storage.remove(path)
+
+
+def mtime(path: str) -> float:
+    """Get the modification time of a file."""
+    return _storage.mtime(path)
+
+
+def size(path: str) -> int:
+    """Get the size of a file in bytes."""
+    return _storage.size(path)
+
+
+def connect(database: str = DATABASE) -> sqlite3.Connection:
+    """Connect to a SQLite database of the storage in use."""
+    return _storage.connect(database)
+
+
+def local_path(path: str) -> str:
+    """Get the path on disk of a file, or None if the storage keeps it in memory."""
+    return _storage.local_path(path)
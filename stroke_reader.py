@@ -0,0 +1,104 @@
+"""
+This module provides a streaming reader for Concept2 stroke data files.
+
+A stroke file is a JSON object whose "data" array holds one object per stroke.
+The reader decodes the strokes one at a time from fixed size chunks of the file,
+so memory use does not grow with the length of the piece and reading stops as
+soon as the caller stops iterating.
+
+Functions:
+- iter_stroke_records(f: TextIO, chunk_size: int) -> Iterator[dict]
+- iter_strokes(f: TextIO, chunk_size: int) -> Iterator[tuple]
+- stream_strokes(path: str) -> Iterator[tuple]
+"""
+
+from json import JSONDecoder, JSONDecodeError
+from typing import Iterator, TextIO
+
+from cache import open_text
+
+CHUNK_SIZE = 1 << 16
+WHITESPACE = " \t\r\n,"
+DECODER = JSONDecoder()
+
+
+def iter_stroke_records(f: TextIO, chunk_size: int = CHUNK_SIZE) -> Iterator[dict]:
+    """
+    Lazily decode the strokes in the "data" array of a stroke file.
+
+    Args:
+        f (TextIO): The open stroke file.
+        chunk_size (int): The number of characters read at a time.
+
+    Yields:
+        dict: Each stroke, in order. Nothing is yielded for a file without data.
+
+    Raises:
+        JSONDecodeError: If a stroke is malformed or the file is truncated.
+    """
+    buffer = ""
+    while True:
+        start = buffer.find('"data"')
+        bracket = buffer.find("[", start) if start != -1 else -1
+        if bracket != -1:
+            pos = bracket + 1
+            break
+        chunk = f.read(chunk_size)
+        if not chunk:
+            return
+        # Keep enough of the tail for a key split across two chunks
+        buffer = (buffer[start:] if start != -1 else buffer[-5:]) + chunk
+
+    while True:
+        while pos < len(buffer) and buffer[pos] in WHITESPACE:
+            pos += 1
+        if pos == len(buffer):
+            buffer, pos = f.read(chunk_size), 0
+            if not buffer:
+                raise JSONDecodeError("Unterminated stroke data", "", 0)
+            continue
+        if buffer[pos] == "]":
+            return
+        try:
+            stroke, pos = DECODER.raw_decode(buffer, pos)
+        except JSONDecodeError:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                raise
+            buffer, pos = buffer[pos:] + chunk, 0
+            continue
+        yield stroke
+        if pos > chunk_size:
+            buffer, pos = buffer[pos:], 0
+
+
+def iter_strokes(f: TextIO, chunk_size: int = CHUNK_SIZE) -> Iterator[tuple]:
+    """
+    Lazily read the strokes of a stroke file as tuples.
+
+    Args:
+        f (TextIO): The open stroke file.
+        chunk_size (int): The number of characters read at a time.
+
+    Yields:
+        tuple: The time (tenths), distance (decimeters), pace (tenths per 500m)
+        and stroke rate of each stroke.
+    """
+    for stroke in iter_stroke_records(f, chunk_size):
+        yield stroke["t"], stroke["d"], stroke["p"], stroke.get("spm", 0)
+
+
+def stream_strokes(path: str) -> Iterator[tuple]:
+    """
+    Open a compressed or legacy stroke file and lazily read its strokes as tuples.
+
+    The file is closed when the strokes run out or the iterator is closed.
+
+    Args:
+        path (str): The path of the stroke file.
+
+    Yields:
+        tuple: The time, distance, pace and stroke rate of each stroke.
+    """
+    with open_text(path) as f:
+        yield from iter_strokes(f)
@@ -0,0 +1,329 @@
+"""
+This module keeps the local results and stroke caches warm in the background,
+so a ranking can be run straight from the files in json/ and strokes/.
+
+Each sync records its requests in a manifest (see manifest.py), so a sync that is
+cancelled, loses the network or is closed resumes where it stopped next time.
+
+It can be used from the GUI through SyncService or run as a standalone process:
+
+    python sync.py --interval 600 --days 21
+
+Functions:
+- read_status() -> dict: Read the status of the last sync.
+- write_status(**changes) -> dict: Update the status of the sync.
+- export_parquet(results: list) -> int: Append the new results to the Parquet export.
+- sync_once(api_token: str, days: int, ...) -> dict: Fetch the new results and strokes.
+"""
+
+import argparse
+import logging
+import threading
+from datetime import datetime, timedelta
+from json import dump, load
+from threading import Event
+from typing import Callable
+
+from requests.exceptions import RequestException
+
+import cache
+import downloader as dl
+import hr_zones
+import live_leaderboards
+import logs
+import parquet_export
+import power_curve
+import profiles
+import storage
+from manifest import FAILED, Manifest
+from pipeline import SyncPipeline
+
+STATUS_FILE = "data/sync_status.json"
+SYNC_INTERVAL = 600
+MAX_DAYS = 21
+DATE_FORMAT = "%Y-%m-%d"
+
+status_lock = threading.Lock()
+
+
+def export_parquet(results: list) -> int:
+    """Append the new results and their stroke data to the Parquet export.
+
+    Returns:
+        int: The number of results exported, 0 without pyarrow.
+    """
+    if not parquet_export.available():
+        return 0
+    return parquet_export.export(results)["results"]
+
+
+# The steps run on the new results of a sync that fetched them all, in order.
+# Each is named by what it counts and returns the count, e.g. the new bests.
+POST_SYNC_STEPS = [
+    ("power curve pieces", power_curve.update_curves),
+    ("heart rate pieces", hr_zones.update_pieces),
+    ("bests", live_leaderboards.update),
+    ("exported results", export_parquet),
+]
+
+
+def read_status() -> dict:
+    """Read the status of the last sync.
+
+    Returns:
+        dict: The status, last sync time and counts of the last sync.
+    """
+    if not storage.exists(STATUS_FILE):
+        return {"status": "never synced", "last_sync": None}
+    with storage.open_file(STATUS_FILE, "r", encoding="utf-8") as f:
+        return load(f)
+
+
+def write_status(**changes) -> dict:
+    """Update the status of the sync.
+
+    Args:
+        **changes: The status fields to update.
+
+    Returns:
+        dict: The status merged with the changes, as saved.
+    """
+    with status_lock:
+        status = read_status()
+        status.update(changes)
+        with storage.atomic(STATUS_FILE, "w", encoding="utf-8") as f:
+            dump(status, f, indent=4)
+    return status
+
+
+def sync_once(
+    api_token: str,
+    days: int,
+    progress: Callable = None,
+    cancel: Event = None,
+    rank: Callable = None,
+    rank_since: str = None,
+    steps: list = None,
+) -> dict:
+    """Fetch the results since the last sync and the stroke data they need.
+
+    The stroke data of each user's new results is downloaded as soon as their
+    results arrive (see pipeline.py). With rank, the saved results are streamed
+    to it during the sync, each once its stroke data is on disk, so a ranking
+    runs alongside the downloads instead of after them.
+
+    Profiles older than their TTL are refreshed first. Then each of the steps is
+    run on the new results, by default those of POST_SYNC_STEPS: the power
+    curves, heart rate zones and live leaderboards are updated with the new
+    pieces and, with pyarrow installed, they are appended to the Parquet export.
+    Results older than the window of days are dropped from json/. A cancelled or
+    failed sync keeps its manifest, so the next one resumes from the same date and
+    skips the requests already done. The last sync time is the start of the
+    sync, so results logged while it ran are fetched next time, and it is not
+    moved if any request failed.
+
+    Args:
+        api_token (str): The API token for authentication.
+        days (int): The number of days of results to keep warm.
+        progress (callable, optional): Called with the stage, done and total.
+        cancel (Event, optional): Stops the sync when set.
+        rank (callable, optional): Called on this thread with an iterable of the
+            saved results, e.g. to run workout_finder.rank on them.
+        rank_since (str, optional): Only stream results from this date on.
+        steps (list, optional): The (name, step) pairs to run on the new results.
+            Defaults to POST_SYNC_STEPS.
+
+    Returns:
+        dict: The updated status, with the count of each step and the concurrency
+        and throughput of each endpoint during the sync.
+    """
+    steps = POST_SYNC_STEPS if steps is None else steps
+    window_start = (datetime.today() - timedelta(days=days)).strftime(DATE_FORMAT)
+    last_sync = read_status().get("last_sync")
+    since = max(window_start, last_sync[:10]) if last_sync else window_start
+
+    for directory in cache.CACHES:
+        cache.remove_partial(directory)
+    manifest = Manifest.resume(since, window_start)
+    if manifest.resumed:
+        logging.info("Resuming a sync with %d requests done", manifest.resumed)
+    manifest.save()
+    dl.stats(reset=True)
+
+    write_status(status="syncing", run_id=logs.current()[0])
+    # Profiles first, so the ranking partitions athletes by their fresh profiles
+    pipeline = None
+    try:
+        fetched = profiles.fetch_profiles(
+            dl.glui(), api_token, progress=progress, cancel=cancel
+        )
+        pipeline = SyncPipeline(
+            api_token,
+            manifest.since,
+            window_start,
+            manifest,
+            stream=rank is not None,
+            rank_since=rank_since,
+            progress=progress,
+            cancel=cancel,
+        )
+        if rank is not None:
+            rank(pipeline)
+        else:
+            pipeline.run()
+        results, strokes = pipeline.new, pipeline.strokes
+        counts = {name: step(results) for name, step in steps}
+    except (RequestException, OSError, ValueError) as e:
+        logging.error("Sync failed: %s", e)
+        manifest.save()
+        status = write_status(status="error", error=str(e), concurrency=dl.stats())
+        if rank is None:
+            return status
+        raise
+    except BaseException as e:
+        # The ranking was cancelled or failed; the next sync resumes
+        manifest.save()
+        cancelled = cancel is not None and cancel.is_set()
+        write_status(
+            status="cancelled" if cancelled else "error",
+            error=None if cancelled else str(e),
+            concurrency=dl.stats(),
+        )
+        raise
+    finally:
+        if pipeline is not None:
+            pipeline.close()
+
+    if cancel is not None and cancel.is_set():
+        manifest.save()
+        return write_status(status="cancelled", concurrency=dl.stats())
+    failed = manifest.count(FAILED)
+    if failed:
+        # Kept, so the next sync retries the failed requests from the same date
+        manifest.save()
+        logging.warning("Sync finished with %d failed requests", failed)
+        return write_status(
+            status="partial",
+            error=f"{failed} requests failed",
+            concurrency=dl.stats(),
+        )
+
+    manifest.finish()
+    logging.info(
+        "Synced %d results, %d stroke files and %d profiles; new %s",
+        len(results),
+        strokes,
+        fetched,
+        ", ".join(f"{name}: {count}" for name, count in counts.items()) or "none",
+    )
+    return write_status(
+        status="ok",
+        error=None,
+        last_sync=manifest.data["started"],
+        results=len(results),
+        strokes=strokes,
+        steps=counts,
+        concurrency=dl.stats(),
+    )
+
+
+class SyncService:
+    """Run sync_once on a schedule in a background thread."""
+
+    def __init__(self, token_provider, interval=SYNC_INTERVAL, days=MAX_DAYS):
+        """
+        Args:
+            token_provider (callable): Returns a fresh API token when called.
+            interval (int): The number of seconds between syncs.
+            days (int): The number of days of results to keep warm.
+        """
+        self.token_provider = token_provider
+        self.interval = interval
+        self.days = days
+        self.api_token = None
+        self._token_lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def token(self) -> str:
+        """Get the API token, authenticating on first use."""
+        with self._token_lock:
+            if self.api_token is None:
+                self.api_token = self.token_provider()
+            return self.api_token
+
+    def sync(
+        self,
+        progress: Callable = None,
+        cancel: Event = None,
+        rank: Callable = None,
+        rank_since: str = None,
+    ) -> dict:
+        """Sync now on the calling thread, waiting for any running sync.
+
+        Args:
+            progress (callable, optional): Called with the stage, done and total.
+            cancel (Event, optional): Stops the sync when set.
+            rank (callable, optional): Ranks the results as they are synced.
+            rank_since (str, optional): Only rank results from this date on.
+        """
+        with self._sync_lock, logs.run("sync"):
+            return sync_once(
+                self.token(), self.days, progress, cancel, rank, rank_since
+            )
+
+    def sync_now(self) -> None:
+        """Wake the background thread to sync without waiting for the schedule."""
+        self._wake.set()
+
+    def status(self) -> dict:
+        """Get the status of the last sync."""
+        return read_status()
+
+    def start(self) -> None:
+        """Start syncing in a background thread."""
+        self._thread = threading.Thread(target=self.run, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the background thread, cancelling its current sync."""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def run(self) -> None:
+        """Sync on the schedule on the calling thread until stopped.
+
+        A sync that fails with an unexpected error is logged and recorded in the
+        status, and the next one runs on schedule. Stopping cancels the sync."""
+        while not self._stop.is_set():
+            try:
+                self.sync(cancel=self._stop)
+            except Exception as e:  # pylint: disable=broad-except
+                logging.exception("Sync failed")
+                write_status(status="error", error=str(e))
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+
+if __name__ == "__main__":
+    import authorization as auth
+
+    logs.setup()
+    parser = argparse.ArgumentParser(description="Keep the Valkyrie caches warm.")
+    parser.add_argument("--interval", type=int, default=SYNC_INTERVAL)
+    parser.add_argument("--days", type=int, default=MAX_DAYS)
+    parser.add_argument("--once", action="store_true", help="sync once and exit")
+    args = parser.parse_args()
+
+    service = SyncService(auth.auth, args.interval, args.days)
+    if args.once:
+        print(service.sync())
+    else:
+        try:
+            service.run()
+        except KeyboardInterrupt:
+            print(read_status())
@@ -0,0 +1,466 @@
+"""
+This module keeps team aggregates of a workout, e.g. the mean, median and
+percentile splits of the team per category, erg and age band, without holding
+the results in memory.
+
+Each statistic is a pair of streaming aggregators that can be merged:
+
+- Moments: the count, mean, standard deviation, minimum and maximum, updated
+  with Welford's algorithm and merged with Chan's.
+- QuantileSketch: a KLL sketch, which keeps a bounded number of values in
+  compactors of doubling weight, so any quantile is within about 1% of its rank
+  whatever the number of values added.
+
+TeamStats keeps them for the ranked fields of every leaderboard partition (see
+leaderboards.py). The ranking scan fills one through its Leaderboards, and
+workout_finder saves its summary next to the leaderboard. For a season, the
+results are aggregated per week into shards under TEAM_STATS, which are merged
+for any range of weeks:
+
+    python team_stats.py update
+    python team_stats.py report 2k --start 2024-09-01 --end 2025-05-31
+
+Classes:
+- Moments: The running count, mean, variance, minimum and maximum of values.
+- QuantileSketch: A mergeable KLL quantile sketch.
+- TeamStats: The moments and quantiles of the fields of a workout per partition.
+
+Functions:
+- fields_of(kind: str) -> tuple: The fields aggregated for a workout kind.
+- update_weeks(results: Iterable) -> int: Aggregate results into week shards.
+- season(workout_name: str, start: str, end: str) -> TeamStats: Merge week shards.
+- save_report(stats: TeamStats, path: str) -> None: Save a summary to Excel.
+"""
+
+import argparse
+import math
+import os
+import random
+from datetime import datetime
+from json import dump, load
+from typing import Iterable
+
+from openpyxl import Workbook
+
+import cache
+import converter as cv
+import database_request as dr
+import profiles
+import storage
+from hr_zones import week_of
+from leaderboards import partitions
+from ranking_rows import RankingRow
+from workouts import RANK_BY, WORKOUTS, classify
+
+TEAM_STATS = "data/team_stats"
+DEFAULT_K = 200
+# Each compactor holds this fraction of the one above it, down to MIN_CAPACITY
+CAPACITY_RATIO = 2 / 3
+MIN_CAPACITY = 2
+QUANTILES = (0.1, 0.25, 0.5, 0.75, 0.9)
+SUMMARY_FIELDS = ("split", "watts", "spm")
+# The fields displayed as times
+TIME_FIELDS = ("time", "split")
+DATE_FORMAT = "%Y-%m-%d"
+
+
+class Moments:
+    """The running count, mean, variance, minimum and maximum of values."""
+
+    __slots__ = ("count", "mean", "m2", "minimum", "maximum")
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        # The sum of the squared differences from the mean
+        self.m2 = 0.0
+        self.minimum = math.inf
+        self.maximum = -math.inf
+
+    def add(self, value: float) -> None:
+        """Add a value."""
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        self.minimum = min(self.minimum, value)
+        self.maximum = max(self.maximum, value)
+
+    def merge(self, other: "Moments") -> None:
+        """Add the values of another Moments."""
+        if not other.count:
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.count = count
+        self.minimum = min(self.minimum, other.minimum)
+        self.maximum = max(self.maximum, other.maximum)
+
+    @property
+    def std(self) -> float:
+        """The sample standard deviation, or 0 for fewer than two values."""
+        return math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "mean": self.mean,
+            "m2": self.m2,
+            "min": self.minimum,
+            "max": self.maximum,
+        }
+
+    @classmethod
+    def from_dict(cls, saved: dict) -> "Moments":
+        moments = cls()
+        moments.count = saved["count"]
+        moments.mean = saved["mean"]
+        moments.m2 = saved["m2"]
+        moments.minimum = saved["min"]
+        moments.maximum = saved["max"]
+        return moments
+
+
+class QuantileSketch:
+    """A mergeable KLL quantile sketch.
+
+    Values are added to the lowest compactor. When the sketch is full, the
+    lowest compactor over its capacity is sorted and every other value is
+    promoted to the compactor above, where each value counts twice as much.
+    Higher compactors are larger, so the oldest values are the most compacted.
+    """
+
+    def __init__(self, k: int = DEFAULT_K, seed: int = None):
+        """
+        Args:
+            k (int): The capacity of the top compactor; the error falls as k grows.
+            seed (int, optional): Seeds the choice of the values promoted.
+        """
+        self.k = k
+        self.count = 0
+        self.compactors = [[]]
+        self._random = random.Random(seed)
+
+    def _capacity(self, level: int) -> int:
+        depth = len(self.compactors) - level - 1
+        return max(MIN_CAPACITY, math.ceil(self.k * CAPACITY_RATIO**depth))
+
+    def _size(self) -> int:
+        return sum(len(compactor) for compactor in self.compactors)
+
+    def _max_size(self) -> int:
+        return sum(self._capacity(level) for level in range(len(self.compactors)))
+
+    def _compress(self) -> None:
+        while self._size() >= self._max_size():
+            for level, items in enumerate(self.compactors):
+                if len(items) >= self._capacity(level):
+                    if level + 1 == len(self.compactors):
+                        self.compactors.append([])
+                    items.sort()
+                    # An odd value out stays at its level
+                    kept = len(items) % 2
+                    offset = kept + self._random.randint(0, 1)
+                    self.compactors[level + 1].extend(items[offset::2])
+                    self.compactors[level] = items[:kept]
+                    break
+
+    def add(self, value: float) -> None:
+        """Add a value."""
+        self.compactors[0].append(float(value))
+        self.count += 1
+        self._compress()
+
+    def merge(self, other: "QuantileSketch") -> None:
+        """Add the values of another sketch."""
+        while len(self.compactors) < len(other.compactors):
+            self.compactors.append([])
+        for level, items in enumerate(other.compactors):
+            self.compactors[level].extend(items)
+        self.count += other.count
+        self._compress()
+
+    def quantiles(self, qs: Iterable) -> list:
+        """
+        Estimate quantiles of the values added.
+
+        Args:
+            qs (Iterable): The quantiles, between 0 and 1.
+
+        Returns:
+            list: The estimated value of each quantile, or None if the sketch is
+            empty.
+        """
+        weighted = sorted(
+            (value, 1 << level)
+            for level, items in enumerate(self.compactors)
+            for value in items
+        )
+        total = sum(weight for _, weight in weighted)
+        estimates = []
+        for q in qs:
+            if not weighted:
+                estimates.append(None)
+                continue
+            target, seen = q * total, 0
+            for value, weight in weighted:
+                seen += weight
+                if seen >= target:
+                    break
+            estimates.append(value)
+        return estimates
+
+    def quantile(self, q: float) -> float:
+        """Estimate a quantile, between 0 and 1, of the values added."""
+        return self.quantiles([q])[0]
+
+    def __len__(self) -> int:
+        """The number of values kept."""
+        return self._size()
+
+    def to_dict(self) -> dict:
+        return {"k": self.k, "count": self.count, "compactors": self.compactors}
+
+    @classmethod
+    def from_dict(cls, saved: dict) -> "QuantileSketch":
+        sketch = cls(saved["k"])
+        sketch.count = saved["count"]
+        sketch.compactors = [list(items) for items in saved["compactors"]]
+        return sketch
+
+
+def fields_of(kind: str) -> tuple:
+    """Get the fields aggregated for a workout kind: the field it is ranked by,
+    then the split, watts and stroke rate."""
+    field, _ = RANK_BY[kind]
+    return (field,) + tuple(f for f in SUMMARY_FIELDS if f != field)
+
+
+class TeamStats:
+    """The moments and quantiles of the fields of a workout per partition."""
+
+    def __init__(self, kind: str, k: int = DEFAULT_K):
+        """
+        Args:
+            kind (str): The kind of the workout, which sets the fields aggregated.
+            k (int): The size of the quantile sketches.
+        """
+        self.kind = kind
+        self.k = k
+        self.fields = fields_of(kind)
+        # partition -> field -> (Moments, QuantileSketch)
+        self.groups = {}
+
+    def _group(self, partition: str) -> dict:
+        group = self.groups.get(partition)
+        if group is None:
+            group = self.groups[partition] = {
+                field: (Moments(), QuantileSketch(self.k)) for field in self.fields
+            }
+        return group
+
+    def add(self, row: RankingRow, names: list) -> None:
+        """Add the fields of a ranking row to the partitions of its athlete.
+
+        Args:
+            row (RankingRow): The ranking row of the result.
+            names (list): The partitions, as returned by leaderboards.partitions.
+        """
+        values = [(field, getattr(row, field)) for field in self.fields]
+        for partition in names:
+            group = self._group(partition)
+            for field, value in values:
+                moments, sketch = group[field]
+                moments.add(value)
+                sketch.add(value)
+
+    def merge(self, other: "TeamStats") -> None:
+        """Add the values of another TeamStats of the same kind, e.g. of another week."""
+        for partition, other_group in other.groups.items():
+            group = self._group(partition)
+            for field, (moments, sketch) in other_group.items():
+                group[field][0].merge(moments)
+                group[field][1].merge(sketch)
+
+    def count(self, partition: str) -> int:
+        """The number of results added to a partition."""
+        group = self.groups.get(partition)
+        return group[self.fields[0]][0].count if group else 0
+
+    def summary(self) -> dict:
+        """
+        Summarise every partition.
+
+        Returns:
+            dict: partition -> field -> the count, mean, std, min and max and the
+            QUANTILES of the field, e.g. summary()["open/rower/all"]["split"]["p50"].
+        """
+        summary = {}
+        for partition, group in sorted(self.groups.items()):
+            summary[partition] = {}
+            for field, (moments, sketch) in group.items():
+                quantiles = sketch.quantiles(QUANTILES)
+                summary[partition][field] = {
+                    "count": moments.count,
+                    "mean": moments.mean,
+                    "std": moments.std,
+                    "min": moments.minimum,
+                    "max": moments.maximum,
+                    **{f"p{round(q * 100)}": v for q, v in zip(QUANTILES, quantiles)},
+                }
+        return summary
+
+    def to_dict(self) -> dict:
+        return {
+            "kind": self.kind,
+            "k": self.k,
+            "groups": {
+                partition: {
+                    field: {"moments": m.to_dict(), "sketch": s.to_dict()}
+                    for field, (m, s) in group.items()
+                }
+                for partition, group in self.groups.items()
+            },
+        }
+
+    @classmethod
+    def from_dict(cls, saved: dict) -> "TeamStats":
+        stats = cls(saved["kind"], saved["k"])
+        stats.groups = {
+            partition: {
+                field: (
+                    Moments.from_dict(value["moments"]),
+                    QuantileSketch.from_dict(value["sketch"]),
+                )
+                for field, value in group.items()
+            }
+            for partition, group in saved["groups"].items()
+        }
+        return stats
+
+
+def _shard_path(workout_name: str, week: str) -> str:
+    return f"{TEAM_STATS}/{workout_name}/{week}.json"
+
+
+def update_weeks(results: Iterable) -> int:
+    """Aggregate results into a shard per workout and week, replacing the saved ones.
+
+    Every result of the weeks the results cover must be included, e.g. the
+    synced results and the backfilled history, as the shards are rebuilt.
+    Only the aggregates are kept while the results are read.
+
+    Args:
+        results (Iterable): The results, as returned by the Concept2 API.
+
+    Returns:
+        int: The number of shards written.
+    """
+    roster = dr.get_roster()
+    cached = profiles.get_profiles()
+    weeks = {}
+    for result in results:
+        workout_name = classify(result)
+        if workout_name is None:
+            continue
+        key = (workout_name, week_of(result["date"]))
+        stats = weeks.get(key)
+        if stats is None:
+            stats = weeks[key] = TeamStats(WORKOUTS[workout_name]["kind"])
+        info = profiles.enrich(result, roster, cached)
+        stats.add(RankingRow.from_result(result, ""), partitions(result, info))
+
+    for (workout_name, week), stats in weeks.items():
+        with storage.atomic(
+            _shard_path(workout_name, week), "w", encoding="utf-8"
+        ) as f:
+            dump(stats.to_dict(), f)
+    return len(weeks)
+
+
+def season(workout_name: str, start: str = None, end: str = None) -> TeamStats:
+    """Merge the week shards of a workout, one shard at a time.
+
+    Args:
+        workout_name (str): The name of the workout in the registry.
+        start (str, optional): The first date ('YYYY-MM-DD') of the range.
+        end (str, optional): The last date of the range.
+
+    Returns:
+        TeamStats: The aggregates of the weeks of the range.
+    """
+    stats = TeamStats(WORKOUTS[workout_name]["kind"])
+    first = week_of(start) if start else None
+    for name in storage.listdir(f"{TEAM_STATS}/{workout_name}"):
+        week = name[: -len(".json")]
+        if (first and week < first) or (end and week > end):
+            continue
+        with storage.open_file(
+            _shard_path(workout_name, week), "r", encoding="utf-8"
+        ) as f:
+            stats.merge(TeamStats.from_dict(load(f)))
+    return stats
+
+
+def _display(field: str, value: float):
+    if value is None:
+        return None
+    return cv.time_to_real(value) if field in TIME_FIELDS else round(value, 1)
+
+
+def save_report(stats: TeamStats, path: str) -> None:
+    """Save the summary of every partition to an Excel file, with times and
+    splits as m:ss.f.
+
+    Args:
+        stats (TeamStats): The aggregates to report.
+        path (str): The Excel file to write.
+    """
+    quantiles = [f"p{round(q * 100)}" for q in QUANTILES]
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "Team statistics"
+    ws.append(
+        ["Partition", "Field", "Count", "Mean", "Std", "Min"] + quantiles + ["Max"]
+    )
+    for partition, fields in stats.summary().items():
+        for field, summary in fields.items():
+            ws.append(
+                [partition, field, summary["count"]]
+                + [
+                    _display(field, summary[column])
+                    for column in ["mean", "std", "min"] + quantiles + ["max"]
+                ]
+            )
+    with storage.atomic(path, "wb") as f:
+        wb.save(f)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Team statistics per workout.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("update")
+    report = commands.add_parser("report")
+    report.add_argument("workout", choices=sorted(WORKOUTS))
+    report.add_argument("--start")
+    report.add_argument("--end")
+    args = parser.parse_args()
+
+    if args.command == "update":
+        # The synced results and the backfilled history (see backfill.py), each once
+        seen = set()
+        saved = (
+            r
+            for directory in ("json", "history")
+            for key in cache.keys(directory)
+            for r in cache.read_json(directory, key).get("data", [])
+            if r["id"] not in seen and not seen.add(r["id"])
+        )
+        print(f"Saved {update_weeks(saved)} week shards")
+    else:
+        today = datetime.today().strftime(DATE_FORMAT)
+        output = os.path.join("results", f"{today}_{args.workout}_team.xlsx")
+        save_report(season(args.workout, args.start, args.end), output)
+        print(f"Saved {output}")
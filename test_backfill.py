@@ -0,0 +1,81 @@
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+
+import backfill
+import cache
+import downloader as dl
+import fake_api
+import live_leaderboards
+import roster
+import storage
+from manifest import Manifest
+from workouts import needs_strokes
+
+
+class TestBackfill(unittest.TestCase):
+    def setUp(self):
+        self.previous = storage.configure(storage.MemoryStorage())
+        roster.create_table()
+        conn = storage.connect()
+        with conn:
+            conn.executemany(
+                "INSERT INTO users (user_id, name) VALUES (?, ?)",
+                [(user, f"Athlete {user}") for user in range(1, 6)],
+            )
+        conn.close()
+        self.server = fake_api.serve(days=400)
+        self.api_root, dl.API_ROOT = dl.API_ROOT, self.server.root
+
+    def tearDown(self):
+        self.server.shutdown()
+        dl.API_ROOT = self.api_root
+        storage.configure(self.previous)
+
+    def test_shards(self):
+        ranges = backfill.shards("2024-01-01", "2024-03-05", 30)
+        self.assertEqual(ranges[0], ("2024-01-01", "2024-01-30"))
+        self.assertEqual(ranges[-1], ("2024-03-01", "2024-03-05"))
+        days = sum((datetime.fromisoformat(b) - datetime.fromisoformat(a)).days + 1 for a, b in ranges)
+        self.assertEqual(days, 65)
+
+    def test_backfill(self):
+        end = datetime.today().strftime("%Y-%m-%d")
+        start = (datetime.today() - timedelta(days=400)).strftime("%Y-%m-%d")
+        reports = []
+        stats = backfill.backfill(fake_api.TOKEN, start, end, 30, progress=lambda *args: reports.append(args))
+
+        expected = [r for user in range(1, 6) for r in fake_api.make_results(user, 400)]
+        saved = backfill.history(range(1, 6))
+        self.assertEqual(sorted(r["id"] for r in saved), sorted(r["id"] for r in expected))
+        self.assertEqual(stats["results"], len(expected))
+        self.assertEqual(stats["failed"], 0)
+        self.assertTrue(all(cache.exists("strokes", r["id"]) for r in expected if needs_strokes(r)))
+        self.assertIn(("shards", stats["shards"], stats["shards"]), reports)
+        self.assertTrue(live_leaderboards.LiveLeaderboards().boards)
+        # The manifest is removed once every shard is done
+        self.assertFalse(storage.exists(backfill.BACKFILL_MANIFEST))
+
+        # A second run only adds what is new
+        self.assertEqual(backfill.backfill(fake_api.TOKEN, start, end, 30)["results"], 0)
+
+    def test_other_shard_days(self):
+        end = datetime.today().strftime("%Y-%m-%d")
+        start = (datetime.today() - timedelta(days=120)).strftime("%Y-%m-%d")
+        # A run with 30 day shards that stopped before removing its manifest
+        with mock.patch.object(Manifest, "finish"):
+            backfill.backfill(fake_api.TOKEN, start, end, 30, strokes=False)
+        storage.remove(cache.locate(backfill.HISTORY, 1))
+
+        backfill.backfill(fake_api.TOKEN, start, end, 60, strokes=False)
+        saved = {r["id"] for r in backfill.history([1])}
+        expected = {r["id"] for r in fake_api.make_results(1, 400) if r["date"][:10] >= start}
+        self.assertEqual(saved, expected)
+
+    def test_eta(self):
+        self.assertIsNone(backfill.eta(0, 10, 5.0))
+        self.assertAlmostEqual(backfill.eta(4, 10, 2.0), 3.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
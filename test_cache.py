@@ -0,0 +1,106 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+import cache
+import fake_api
+import storage
+
+
+class TestCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.previous = storage.configure(storage.FileStorage(self.tmp.name))
+        os.makedirs(os.path.join(self.tmp.name, "json"))
+        self.data = {"data": fake_api.make_results(1, 30)}
+
+    def tearDown(self):
+        storage.configure(self.previous)
+        self.tmp.cleanup()
+
+    def path(self, *parts):
+        return os.path.join(self.tmp.name, *parts)
+
+    def write_legacy(self, key):
+        with open(self.path("json", f"{key}.json"), "w", encoding="utf-8") as f:
+            json.dump(self.data, f, indent=4)
+
+    def test_round_trip(self):
+        cache.write_json("json", 1, self.data)
+        self.assertEqual(cache.read_json("json", 1), self.data)
+        with open(self.path("json", "1.json.gz"), "rb") as f:
+            self.assertEqual(f.read(2), b"\x1f\x8b")
+        self.assertTrue(cache.exists("json", 1))
+        self.assertFalse(cache.exists("json", 2))
+        self.assertEqual(cache.keys("json"), ["1"])
+        with self.assertRaises(FileNotFoundError):
+            cache.read_json("json", 2)
+
+    def test_legacy(self):
+        self.write_legacy(7)
+        self.assertTrue(cache.exists("json", 7))
+        self.assertEqual(cache.locate("json", 7), os.path.join("json", "7.json"))
+        self.assertEqual(cache.read_json("json", 7), self.data)
+        self.assertEqual(cache.keys("json"), ["7"])
+
+        # Writing a key replaces its legacy file
+        cache.write_json("json", 7, {"data": []})
+        self.assertFalse(os.path.exists(self.path("json", "7.json")))
+        self.assertEqual(cache.read_json("json", 7), {"data": []})
+
+    def test_migrate(self):
+        self.write_legacy(7)
+        self.write_legacy(8)
+        cache.write_json("json", 9, self.data)
+        stats = cache.migrate("json")
+        self.assertEqual(stats["files"], 2)
+        self.assertLess(stats["bytes_after"], stats["bytes_before"])
+        self.assertEqual(sorted(os.listdir(self.path("json"))), ["7.json.gz", "8.json.gz", "9.json.gz"])
+        self.assertEqual(cache.read_json("json", 8), self.data)
+        self.assertEqual(cache.migrate("json")["files"], 0)
+
+        bench = cache.benchmark("json")
+        self.assertEqual(bench["files"], 3)
+        self.assertLess(bench["compressed_bytes"], bench["plain_bytes"])
+
+    def test_benchmark_in_memory(self):
+        with storage.using(storage.MemoryStorage()):
+            cache.write_json("strokes", 1, self.data)
+            bench = cache.benchmark("strokes")
+            self.assertEqual(bench["files"], 1)
+            self.assertEqual(bench["compressed_bytes"], storage.size(cache.cache_path("strokes", 1)))
+            self.assertLess(bench["compressed_bytes"], bench["plain_bytes"])
+            # The scratch files are gone
+            self.assertEqual(storage.listdir("strokes"), ["1.json.gz"])
+
+    def test_cli(self):
+        self.write_legacy(7)
+        env = {**os.environ, "VALKYRIE_ROOT": self.tmp.name}
+        script = os.path.join(os.path.dirname(os.path.abspath(cache.__file__)), "cache.py")
+        run = subprocess.run(
+            [sys.executable, script, "migrate"], env=env, capture_output=True, text=True, check=True
+        )
+        self.assertIn("'files': 1", run.stdout)
+        self.assertEqual(cache.read_json("json", 7), self.data)
+        self.assertFalse(os.path.exists(self.path("json", "7.json")))
+
+    def test_remove_partial(self):
+        cache.write_json("json", 1, self.data)
+        stale = self.path("json", f"2.json.gz{storage.TMP_SUFFIX}")
+        fresh = self.path("json", f"3.json.gz{storage.TMP_SUFFIX}")
+        for path in (stale, fresh):
+            with open(path, "wb") as f:
+                f.write(b"partial")
+        old = time.time() - 2 * cache.PARTIAL_AGE
+        os.utime(stale, (old, old))
+        self.assertEqual(cache.remove_partial("json"), 1)
+        self.assertEqual(sorted(os.listdir(self.path("json"))), ["1.json.gz", os.path.basename(fresh)])
+        self.assertEqual(cache.keys("json"), ["1"])
+
+
+if __name__ == '__main__':
+    unittest.main()
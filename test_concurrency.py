@@ -0,0 +1,33 @@
+import unittest
+
+from concurrency import AdaptiveLimiter
+
+
+class TestAdaptiveLimiter(unittest.TestCase):
+    def test_additive_increase(self):
+        limiter = AdaptiveLimiter(initial=4)
+        for _ in range(4):
+            limiter.release(limiter.acquire(), 200)
+        self.assertAlmostEqual(limiter.limit, 5, delta=0.1)
+
+    def test_multiplicative_decrease(self):
+        limiter = AdaptiveLimiter(initial=8)
+        burst = [limiter.acquire() for _ in range(8)]
+
+        # A burst of 429s started before the first cut only counts once
+        for started in burst:
+            limiter.release(started, 429)
+        self.assertEqual(limiter.limit, 4)
+        self.assertEqual(limiter.stats()["throttled"], 8)
+
+        limiter.release(limiter.acquire(), 503)
+        self.assertEqual(limiter.limit, 2)
+
+    def test_minimum(self):
+        limiter = AdaptiveLimiter(initial=1)
+        limiter.release(limiter.acquire(), 0)
+        self.assertEqual(limiter.limit, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
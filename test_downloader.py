@@ -0,0 +1,104 @@
+import concurrent.futures
+import unittest
+from unittest import mock
+
+from requests import Response, post
+from requests.exceptions import HTTPError
+
+import cache
+import downloader as dl
+import fake_api
+import storage
+
+
+class TestTokenRefresh(unittest.TestCase):
+    def setUp(self):
+        self.previous = storage.configure(storage.MemoryStorage())
+        self.server = fake_api.serve(token_requests=20)
+        self.api_root, dl.API_ROOT = dl.API_ROOT, self.server.root
+        dl.replaced_tokens.clear()
+        dl.failed_refreshes.clear()
+        self.refreshes = 0
+
+    def tearDown(self):
+        self.server.shutdown()
+        dl.API_ROOT = self.api_root
+        dl.replaced_tokens.clear()
+        dl.failed_refreshes.clear()
+        storage.configure(self.previous)
+
+    def refresh(self):
+        self.refreshes += 1
+        return post(f"{self.server.root}/oauth/access_token", timeout=10).json()["access_token"]
+
+    def test_shared_refresh(self):
+        pieces = [r for user in range(1, 11) for r in fake_api.make_results(user)]
+        with mock.patch.object(dl, "refresh_access_token", self.refresh):
+            with concurrent.futures.ThreadPoolExecutor(16) as executor:
+                list(executor.map(lambda r: dl.get_stroke_data(r["user_id"], r["id"], fake_api.TOKEN), pieces))
+
+        # Every stroke file holds strokes, not the body of a 401
+        self.assertEqual(len(cache.keys("strokes")), len(pieces))
+        self.assertTrue(all("data" in cache.read_json("strokes", r["id"]) for r in pieces))
+        # Threads waiting on the same expired token share one refresh
+        self.assertLessEqual(self.refreshes, len(pieces) // 20 + 1)
+
+    def test_failed_refresh(self):
+        with mock.patch.object(dl, "refresh_access_token", lambda: None):
+            for _ in range(20):
+                dl.get_profile(1, fake_api.TOKEN)
+            with self.assertRaises(HTTPError):
+                dl.get_stroke_data(1, 1000, fake_api.TOKEN)
+        self.assertFalse(cache.exists("strokes", 1000))
+
+    def test_refresh_after_failure(self):
+        attempts = []
+        with mock.patch.object(dl, "refresh_access_token", lambda: attempts.append(1)):
+            for _ in range(20):
+                dl.get_profile(1, fake_api.TOKEN)
+            for _ in range(5):
+                with self.assertRaises(HTTPError):
+                    dl.get_profile(1, fake_api.TOKEN)
+        # Failed refreshes are not retried at once
+        self.assertEqual(len(attempts), 1)
+
+        # The expired token is kept, so it is refreshed once the refresh works again
+        with mock.patch.object(dl, "REFRESH_RETRY", 0), mock.patch.object(dl, "refresh_access_token", self.refresh):
+            self.assertTrue(dl.get_stroke_data(1, 1000, fake_api.TOKEN))
+        self.assertEqual(self.refreshes, 1)
+        self.assertIn("data", cache.read_json("strokes", 1000))
+
+
+def response(status, body):
+    res = Response()
+    res.status_code = status
+    res._content = body
+    return res
+
+
+class TestErrorBodies(unittest.TestCase):
+    def setUp(self):
+        self.previous = storage.configure(storage.MemoryStorage())
+
+    def tearDown(self):
+        storage.configure(self.previous)
+
+    def test_unavailable(self):
+        for res in (
+            response(503, b'{"message": "Service Unavailable"}'),
+            response(404, b'{"message": "Not Found"}'),
+            response(502, b"<html>Bad Gateway</html>"),
+        ):
+            with mock.patch.object(dl, "send", lambda *args: res):
+                self.assertFalse(dl.get_stroke_data(1, 1000, fake_api.TOKEN))
+            # Not cached, so the next request fetches it again
+            self.assertFalse(cache.exists("strokes", 1000))
+
+        strokes = response(200, b'{"data": [{"t": 25, "d": 100, "p": 1000, "spm": 30}]}')
+        with mock.patch.object(dl, "send", lambda *args: strokes):
+            self.assertTrue(dl.get_stroke_data(1, 1000, fake_api.TOKEN))
+        self.assertEqual(cache.read_json("strokes", 1000)["data"][0]["t"], 25)
+
+
+if __name__ == '__main__':
+    unittest.main()
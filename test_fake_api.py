@@ -0,0 +1,55 @@
+import os
+import unittest
+from datetime import datetime
+
+from requests import get, post
+
+import fake_api
+import storage
+
+
+class TestFakeAPI(unittest.TestCase):
+    def test_make_results(self):
+        end = datetime(2024, 3, 1)
+        results = fake_api.make_results(1, 30, end)
+        self.assertEqual(results, fake_api.make_results(1, 30, end))
+        self.assertEqual(len(results), fake_api.RESULTS_PER_USER)
+        self.assertEqual([r["date"] for r in results], sorted((r["date"] for r in results), reverse=True))
+        self.assertTrue(all("2024-01-31" <= r["date"] <= "2024-03-01" for r in results))
+        self.assertEqual(fake_api.make_result(1, 3, 30, end)["id"], 1003)
+
+        strokes = fake_api.make_strokes(results[0])
+        self.assertEqual(strokes, fake_api.make_strokes(results[0]))
+        last = results[0].get("workout", {}).get("intervals", [results[0]])[-1]
+        self.assertEqual(strokes[-1]["t"], last["time"])
+
+    def test_server(self):
+        server = fake_api.serve(token_requests=3)
+        headers = {"Authorization": f"Bearer {fake_api.TOKEN}"}
+        try:
+            res = get(f"{server.root}/api/users/2/results", headers=headers, timeout=10)
+            self.assertEqual(res.json()["data"], fake_api.make_results(2))
+            self.assertEqual(get(f"{server.root}/api/users/2", headers=headers, timeout=10).json()["data"], fake_api.make_profile(2))
+            missing = get(f"{server.root}/api/users/2/results/2999/strokes", headers=headers, timeout=10)
+            self.assertEqual(missing.status_code, 404)
+
+            # The token expires after 3 requests, until a new one is issued
+            self.assertEqual(get(f"{server.root}/api/users/2", headers=headers, timeout=10).status_code, 401)
+            token = post(f"{server.root}/oauth/access_token", timeout=10).json()["access_token"]
+            fresh = {"Authorization": f"Bearer {token}"}
+            self.assertEqual(get(f"{server.root}/api/users/2", headers=fresh, timeout=10).status_code, 200)
+        finally:
+            server.shutdown()
+
+    def test_load_test(self):
+        cwd, previous = os.getcwd(), storage.get()
+        stats = fake_api.load_test(3)
+        self.assertEqual(stats["requests"], 3 + 3 * fake_api.RESULTS_PER_USER)
+        self.assertGreater(stats["requests_per_second"], 0)
+        # The files went to a temporary root
+        self.assertEqual(os.getcwd(), cwd)
+        self.assertIs(storage.get(), previous)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import unittest
+
+import numpy as np
+
+import cache
+import fake_api
+import hr_zones
+import storage
+
+
+def steady(seconds, hr, pace=1000, interval_at=None):
+    """Strokes every 2.5s at a constant heart rate, restarting at interval_at."""
+    t = np.arange(25, seconds * 10 + 1, 25, dtype=float)
+    if interval_at is not None:
+        t = np.where(t > interval_at * 10, t - interval_at * 10, t)
+    return np.column_stack([t, np.full(len(t), pace), np.full(len(t), hr)])
+
+
+class TestHeartRateZones(unittest.TestCase):
+    def test_zones(self):
+        thresholds = np.array([[120, 140, 160, 180], [130, 150, 170, 185]], dtype=float)
+        pieces = [steady(600, 150), steady(300, 150, interval_at=150)]
+        pieces[1][:40, 2] = 0  # No heart rate for the first 100s
+        seconds, drift = hr_zones.analyse(pieces, thresholds)
+        np.testing.assert_allclose(seconds[0], [0, 0, 600, 0, 0])
+        np.testing.assert_allclose(seconds[1], [0, 200, 0, 0, 0])
+        # A steady piece does not drift; a short one has no drift
+        self.assertAlmostEqual(drift[0], 0)
+        self.assertTrue(np.isnan(drift[1]))
+
+    def test_drift(self):
+        piece = steady(1200, 140)
+        piece[len(piece) // 2 :, 2] = 154  # 10% more beats for the same pace
+        _, drift = hr_zones.analyse([piece], np.array([[120, 140, 160, 180]]))
+        self.assertAlmostEqual(drift[0], 100 * (1 - 140 / 154), places=1)
+
+    def test_weekly(self):
+        results = [fake_api.make_result(user, n) for user in (1, 2) for n in range(10)]
+        with storage.using(storage.MemoryStorage()):
+            for result in results:
+                cache.write_json("strokes", result["id"], {"data": fake_api.make_strokes(result)})
+            hr_zones.set_zones(1, thresholds=[130, 150, 165, 180])
+            hr_zones.set_zones(2, max_hr=200)
+            np.testing.assert_allclose(hr_zones.zone_thresholds([2])[2], [120, 140, 160, 180])
+            with self.assertRaises(ValueError):
+                hr_zones.set_zones(1, thresholds=[150, 130, 165, 180])
+
+            self.assertEqual(hr_zones.update_pieces(results), len(results))
+            self.assertEqual(hr_zones.update_pieces(results), 0)
+            rows = hr_zones.weekly()
+
+            # New zones bin the pieces already analysed again
+            before = {row["week"]: row for row in rows if row["user_id"] == 1}
+            hr_zones.set_zones(1, thresholds=[60, 70, 80, 90])
+            self.assertEqual(hr_zones.update_pieces(results), 10)
+            after = [row for row in hr_zones.weekly() if row["user_id"] == 1]
+        for row in after:
+            self.assertAlmostEqual(row["zone_5"], row["total"])
+            self.assertAlmostEqual(row["total"], before[row["week"]]["total"])
+        self.assertEqual(sum(row["pieces"] for row in rows), len(results))
+        total = sum(r["time"] for r in results) / 10
+        self.assertAlmostEqual(sum(row["total"] for row in rows), total, delta=len(results))
+        self.assertTrue(all(hr_zones.week_of(row["week"]) == row["week"] for row in rows))
+
+
+if __name__ == '__main__':
+    unittest.main()
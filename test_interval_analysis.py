@@ -0,0 +1,61 @@
+import unittest
+
+import numpy as np
+
+import converter as cv
+import interval_analysis as ia
+
+
+def interval(spm):
+    """A 400m interval of 100s, faster over the first half."""
+    return np.array(
+        [
+            [250, 1100, 1100, spm[0]],
+            [500, 2200, 1150, spm[1]],
+            [750, 3100, 1300, spm[2]],
+            [1000, 4000, 1350, spm[3]],
+        ],
+        dtype=float,
+    )
+
+
+class TestIntervalAnalysis(unittest.TestCase):
+    def test_segment_restart(self):
+        strokes = np.vstack([interval([30] * 4), interval([20] * 4)])
+        np.testing.assert_array_equal(ia.segment(strokes, {}), [0, 0, 0, 0, 1, 1, 1, 1])
+
+    def test_segment_summary(self):
+        # The counters run on through both intervals, so the summary splits them
+        strokes = np.array([[100, 300, 0, 0], [300, 900, 0, 0], [400, 1200, 0, 0], [600, 1800, 0, 0]], dtype=float)
+        result = {"workout": {"intervals": [{"time": 300}, {"time": 300}]}}
+        np.testing.assert_array_equal(ia.segment(strokes, result), [0, 0, 1, 1])
+        np.testing.assert_array_equal(strokes[:, ia.T], [100, 300, 100, 300])
+        np.testing.assert_array_equal(strokes[:, ia.D], [300, 900, 300, 900])
+        self.assertFalse(ia.segment(strokes[:2], {}).any())
+
+    def test_analyse(self):
+        strokes = np.vstack([interval([30, 28, 26, 24]), interval([20, 20, 20, 20])])
+        first, second = ia.analyse_strokes(strokes, {"type": "rower"})
+        self.assertEqual((first["interval"], second["interval"]), (1, 2))
+        self.assertAlmostEqual(first["time"], 100)
+        self.assertAlmostEqual(first["distance"], 400)
+        self.assertAlmostEqual(first["split"], 125)
+        self.assertAlmostEqual(first["watts"], 2.80 / 0.25**3)
+        self.assertAlmostEqual(first["peak_split"], 110)
+        self.assertAlmostEqual(first["peak_watts"], cv.split_seconds_to_watts(110))
+        # Stroke rate weighted by the time of each stroke
+        self.assertAlmostEqual(first["spm"], 27)
+        self.assertAlmostEqual(second["spm"], 20)
+        # Half distance at 45.45s: 113.6s/500m over the first half, 136.4s after
+        half = 25 + 25 * 900 / 1100
+        self.assertAlmostEqual(first["fade"], (100 - 2 * half) / 200 * 500)
+        self.assertAlmostEqual(second["fade"], first["fade"])
+        self.assertEqual(ia.analyse_strokes(np.empty((0, 4)), {}), [])
+
+    def test_watts(self):
+        np.testing.assert_allclose(cv.split_seconds_to_watts(np.array([100.0, 120.0])), [350.0, 202.546296], rtol=1e-6)
+        self.assertEqual(cv.split_to_watts("2:00.0"), 203)
+
+
+if __name__ == '__main__':
+    unittest.main()
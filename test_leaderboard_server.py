@@ -0,0 +1,106 @@
+import json
+import unittest
+
+from requests import get
+
+import leaderboard_server as ls
+import storage
+from leaderboards import partitions
+
+
+def entry(n, user_id, erg, date):
+    return {
+        "user_id": user_id,
+        "result_id": n,
+        "type": erg,
+        "date": date,
+        "row": [f"Athlete {user_id}", erg, date, n],
+        "age": None,
+        "age_band": None,
+        "lightweight": user_id == 1,
+        "novice": user_id == 2,
+        "category": "lightweight" if user_id == 1 else "novice" if user_id == 2 else "open",
+    }
+
+
+class TestLeaderboardServer(unittest.TestCase):
+    def setUp(self):
+        self.previous = storage.configure(storage.MemoryStorage())
+        # More bikes than top_k rank ahead of the rowers
+        entries = [entry(n, n % 5 + 1, "bike", "2024-01-01") for n in range(120)]
+        entries += [entry(n, n % 5 + 1, "rower", f"2024-01-{n % 28 + 1:02}") for n in range(120, 150)]
+        # Each partition keeps its own top_k, as save_ranking writes them
+        boards = {}
+        for e in entries:
+            for name in partitions(e, e):
+                boards.setdefault(name, []).append(e)
+        ranking = {
+            "workout": "2k",
+            "ranked": "2024-02-01",
+            "top_k": 100,
+            "entries": entries[:100],
+            "partitions": {name: board[:100] for name, board in boards.items()},
+        }
+        with storage.atomic("results/2k.json", "w", encoding="utf-8") as f:
+            json.dump(ranking, f)
+        ls.rankings.clear()
+        self.server = ls.serve(port=0)
+        # Only this machine by default
+        self.assertEqual(self.server.server_address[0], "127.0.0.1")
+        self.root = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.entries = entries
+
+    def tearDown(self):
+        self.server.shutdown()
+        storage.configure(self.previous)
+
+    def board(self, query=""):
+        res = get(f"{self.root}/leaderboards/2k.json{query}", timeout=10)
+        self.assertEqual(res.status_code, 200)
+        return res.json()["entries"]
+
+    def test_endpoints(self):
+        self.assertEqual(get(f"{self.root}/leaderboards", timeout=10).json(), {"leaderboards": ["2k"]})
+        res = get(f"{self.root}/leaderboards/2k", timeout=10)
+        self.assertTrue(res.headers["Content-Type"].startswith("text/html"))
+        self.assertIn("<table>", res.text)
+        res = get(f"{self.root}/leaderboards/2k.json", timeout=10)
+        self.assertEqual(res.headers["Content-Type"], "application/json")
+        self.assertEqual(len(res.json()["entries"]), 100)
+
+        for path in ("/leaderboards/6k.json", "/leaderboards/nope", "/other/2k", "/leaderboards/2k.json?partition=x/y/z"):
+            self.assertEqual(get(self.root + path, timeout=10).status_code, 404)
+
+    def test_etag(self):
+        res = get(f"{self.root}/leaderboards/2k.json", timeout=10)
+        etag = res.headers["ETag"]
+        cached = get(f"{self.root}/leaderboards/2k.json", headers={"If-None-Match": etag}, timeout=10)
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(cached.content, b"")
+        other = get(f"{self.root}/leaderboards/2k.json?bikes=0", headers={"If-None-Match": etag}, timeout=10)
+        self.assertEqual(other.status_code, 200)
+
+    def test_filters(self):
+        rowers = self.board("?bikes=0")
+        self.assertEqual(len(rowers), 30)
+        self.assertTrue(all(e["type"] == "rower" for e in rowers))
+        # The flags stored on each entry, as no roster is in the database
+        self.assertEqual({e["user_id"] for e in self.board("?lightweight=1")}, {1})
+        self.assertEqual({e["user_id"] for e in self.board("?novice=1")}, {2})
+        # Dates filter the top_k of the partition
+        self.assertEqual(self.board("?from=2024-01-05&to=2024-01-10"), [])
+        dated = self.board("?bikes=0&from=2024-01-05&to=2024-01-10")
+        self.assertEqual(len(dated), sum(1 for e in self.entries if "2024-01-05" <= e["date"] <= "2024-01-10"))
+        self.assertTrue(all("2024-01-05" <= e["date"] <= "2024-01-10" for e in dated))
+
+        partition = self.board("?partition=lightweight/rower/all")
+        self.assertEqual(len(partition), 6)
+        self.assertTrue(all(e["user_id"] == 1 and e["type"] == "rower" for e in partition))
+        # The filters pick the partition they match, below the overall top_k
+        self.assertEqual(self.board("?bikes=0&lightweight=1"), partition)
+        self.assertEqual(ls.select_partition("open/all/U23", {"novice": ["1"], "bikes": ["0"]}), "novice/rower/U23")
+        self.assertEqual(ls.select_partition(None, {}), "open/all/all")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,42 @@
+import random
+import unittest
+
+from leaderboards import OVERALL, Leaderboards, TopK, partitions
+
+
+class TestLeaderboards(unittest.TestCase):
+    def test_top_k(self):
+        # Same as a full stable sort cut at k, ties included
+        rng = random.Random(0)
+        items = [(rng.randint(0, 50), n) for n in range(1000)]
+        for reverse in (False, True):
+            top = TopK(25, key=lambda item: item[0], reverse=reverse)
+            for item in items:
+                top.push(item)
+            expected = sorted(items, key=lambda item: item[0], reverse=reverse)[:25]
+            self.assertEqual(top.ranked(), expected)
+            self.assertEqual(len(top), 25)
+
+    def test_partitions(self):
+        result = {"type": "bike"}
+        info = {"lightweight": True, "novice": False, "age_band": "U23"}
+        self.assertEqual(len(partitions(result, info)), 8)
+        self.assertIn("lightweight/bike/U23", partitions(result, info))
+        info = {"lightweight": False, "novice": False, "age_band": None}
+        self.assertEqual(partitions(result, info), ["open/all/all", "open/bike/all"])
+
+    def test_leaderboards(self):
+        roster = {1: {"lightweight": False, "novice": True}, 2: {"lightweight": False, "novice": False}}
+        boards = Leaderboards(lambda row: row[0], top_k=2, roster=roster, cached={}, sheet=[])
+        for n, user_id in enumerate([1, 2, 2, 1, 2]):
+            boards.add({"user_id": user_id, "type": "rower", "date": "2024-01-01"}, [10 - n])
+        # Every partition keeps its top_k, the sheet every row
+        self.assertEqual([row for _, row, _ in boards.ranked()], [[6], [7]])
+        self.assertEqual([row for _, row, _ in boards.ranked("open/rower/all")], [[6], [7]])
+        self.assertEqual(boards.sheet_rows(), [[6], [7], [8], [9], [10]])
+        self.assertEqual([row for _, row, _ in boards.ranked("novice/all/all")], [[7], [10]])
+        self.assertEqual(boards.ranked(OVERALL)[0][2]["category"], "open")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import os
+import random
+import tempfile
+import unittest
+
+import fake_api
+from live_leaderboards import LiveLeaderboards, rebuild, score, update, workout_of
+
+
+class TestLiveLeaderboards(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "live.json")
+        self.results = [r for user in range(1, 61) for r in fake_api.make_results(user, days=60)]
+        # Repeat pieces so athletes have several results per workout
+        for number in range(fake_api.RESULTS_PER_USER, 3 * fake_api.RESULTS_PER_USER):
+            self.results += [fake_api.make_result(user, number, 60) for user in range(1, 61)]
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_incremental_equals_rebuild(self):
+        # Sync the results in random batches, saving and loading in between
+        rng = random.Random(1)
+        shuffled = list(self.results)
+        rng.shuffle(shuffled)
+        while shuffled:
+            size = rng.randint(1, 40)
+            batch, shuffled = shuffled[:size], shuffled[size:]
+            update(batch, self.path)
+        # Syncing the same results again changes nothing
+        self.assertEqual(update(self.results[:100], self.path), 0)
+        incremental = LiveLeaderboards(self.path)
+
+        full = rebuild(self.results, os.path.join(self.tmp.name, "full.json"))
+        self.assertEqual(sorted(incremental.boards), sorted(full.boards))
+        for key, board in full.boards.items():
+            self.assertEqual(incremental.boards[key].top(), board.top())
+
+        # Both match the best result of every athlete, sorted
+        bests = {}
+        for result in self.results:
+            name = workout_of(result)
+            value = score(result, name) if name else None
+            if value is None:
+                continue
+            key = (f"{name}/{result['type']}", result["user_id"])
+            entry = (value, result["date"], result["id"], result["user_id"])
+            bests[key] = min(bests.get(key, entry), entry)
+        for key, board in full.boards.items():
+            expected = sorted(entry for (k, _), entry in bests.items() if k == key)
+            self.assertEqual(board.top(), expected)
+
+    def test_rank(self):
+        boards = LiveLeaderboards(self.path)
+        boards.add_results(self.results)
+        board = boards.board("2k", "rower")
+        for position, entry in enumerate(board.top(), start=1):
+            self.assertEqual(boards.rank("2k", "rower", entry[3]), position)
+        self.assertIsNone(boards.rank("2k", "rower", 999999))
+
+
+if __name__ == '__main__':
+    unittest.main()
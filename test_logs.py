@@ -0,0 +1,55 @@
+import concurrent.futures
+import logging
+import os
+import tempfile
+import unittest
+from json import loads
+
+import logs
+
+
+class TestLogs(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "debug.log")
+        self.root_handlers = logging.getLogger().handlers[:]
+        logs.stop()
+        logs.setup(self.path)
+
+    def tearDown(self):
+        logs.stop()
+        logging.getLogger().handlers[:] = self.root_handlers
+        self.tmp.cleanup()
+
+    def read(self):
+        logs.stop()
+        with open(self.path, "r", encoding="utf-8") as f:
+            return [loads(line) for line in f]
+
+    def test_records_carry_run_and_ids(self):
+        def download(user_id):
+            logging.info("Downloaded %s", user_id, extra={"user_id": user_id})
+
+        with logs.run("2k") as run_id:
+            with concurrent.futures.ThreadPoolExecutor(4) as executor:
+                list(executor.map(logs.in_context(download), range(20)))
+            try:
+                raise KeyError("t")
+            except KeyError:
+                logging.exception("Bad strokes", extra={"result_id": 7})
+        logging.info("Outside")
+
+        records = self.read()
+        downloads = [r for r in records if r["message"].startswith("Downloaded")]
+        self.assertEqual(sorted(r["user_id"] for r in downloads), list(range(20)))
+        self.assertTrue(all(r["run_id"] == run_id for r in downloads))
+        self.assertTrue(all(r["category"] == "2k" for r in downloads))
+        error = next(r for r in records if r["message"] == "Bad strokes")
+        self.assertEqual(error["result_id"], 7)
+        self.assertIn("KeyError", error["exception"])
+        self.assertIn("elapsed", records[-2])
+        self.assertEqual((records[-1]["run_id"], records[-1]["category"]), (None, None))
+
+
+if __name__ == '__main__':
+    unittest.main()
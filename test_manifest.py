@@ -0,0 +1,53 @@
+import os
+import tempfile
+import unittest
+
+from cache import atomic_path
+from manifest import DONE, FAILED, Manifest
+
+
+class TestManifest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "manifest.json")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_resume(self):
+        manifest = Manifest("2024-01-01", "2024-01-01", self.path)
+        for user in (1, 2, 3):
+            manifest.plan(f"results/{user}")
+        manifest.done("results/1", results=[{"id": 1001}])
+        manifest.failed("results/2", "Unauthenticated.")
+        manifest.save()
+
+        # The interrupted sync keeps its window and only the requests left are made
+        resumed = Manifest.resume("2024-01-05", "2024-01-02", self.path)
+        self.assertEqual(resumed.since, "2024-01-01")
+        self.assertFalse(resumed.plan("results/1"))
+        self.assertTrue(resumed.plan("results/2"))
+        self.assertTrue(resumed.plan("results/3"))
+        self.assertEqual(resumed.info("results/1")["results"], [{"id": 1001}])
+        self.assertEqual(resumed.keys("results/", FAILED), ["results/2"])
+
+        resumed.finish()
+        self.assertEqual(Manifest.resume("2024-01-05", "2024-01-02", self.path).count(DONE), 0)
+
+    def test_atomic_path(self):
+        with open(self.path, "w", encoding="utf-8") as f:
+            f.write("old")
+
+        # A failed write leaves the old file and no temporary file behind
+        with self.assertRaises(RuntimeError):
+            with atomic_path(self.path) as tmp:
+                with open(tmp, "w", encoding="utf-8") as f:
+                    f.write("partial")
+                raise RuntimeError
+        with open(self.path, "r", encoding="utf-8") as f:
+            self.assertEqual(f.read(), "old")
+        self.assertEqual(os.listdir(self.tmp.name), ["manifest.json"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+import os
+import tempfile
+import unittest
+
+import cache
+import fake_api
+import parquet_export as pe
+
+
+@unittest.skipUnless(pe.available(), "pyarrow is not installed")
+class TestParquetExport(unittest.TestCase):
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp.name)
+        for directory in ("data", "strokes"):
+            os.makedirs(directory)
+        self.results = [r for user in (1, 2, 3) for r in fake_api.make_results(user, days=400)]
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+    def test_season(self):
+        self.assertEqual(pe.season("2024-04-30 23:59:59"), 2024)
+        self.assertEqual(pe.season("2024-05-01"), 2025)
+
+    def test_export_appends(self):
+        with_strokes = [r for r in self.results if "workout" in r][:5]
+        for result in with_strokes[:3]:
+            cache.write_json("strokes", result["id"], {"data": fake_api.make_strokes(result)})
+        self.assertEqual(pe.export(self.results[:20]), {"results": 20, "strokes": 3})
+
+        # Only what is new is appended, including strokes downloaded since
+        for result in with_strokes[3:]:
+            cache.write_json("strokes", result["id"], {"data": fake_api.make_strokes(result)})
+        counts = pe.export(self.results)
+        self.assertEqual(counts, {"results": len(self.results) - 20, "strokes": 2})
+
+        pe.compact()
+        results = pe.load("results")
+        self.assertEqual(sorted(results.column("id").to_pylist()), sorted(r["id"] for r in self.results))
+        piece = with_strokes[0]
+        row = pe.load("results", id=piece["id"]).to_pylist()[0]
+        self.assertEqual(row["season"], pe.season(piece["date"]))
+        self.assertEqual(row["intervals"], len(piece["workout"]["intervals"]))
+        self.assertEqual(row["interval_1_time"], piece["workout"]["intervals"][0]["time"])
+
+        strokes = pe.load("strokes", result_id=piece["id"]).to_pylist()
+        self.assertEqual(len(strokes), len(fake_api.make_strokes(piece)))
+        self.assertEqual(strokes[-1]["interval"], len(piece["workout"]["intervals"]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import cache
+import downloader as dl
+import fake_api
+import roster
+import storage
+from pipeline import SyncPipeline
+from workouts import needs_strokes
+
+
+class TestSyncPipeline(unittest.TestCase):
+    def setUp(self):
+        self.previous = storage.configure(storage.MemoryStorage())
+        self.tmp = tempfile.TemporaryDirectory()
+        path = os.path.join(self.tmp.name, "roster.csv")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("user_id,name\n")
+            f.writelines(f"{user},Athlete {user}\n" for user in range(1, 13))
+        roster.import_roster(path)
+        self.server = fake_api.serve(latency=2)
+        self.api_root, dl.API_ROOT = dl.API_ROOT, self.server.root
+
+    def tearDown(self):
+        self.server.shutdown()
+        dl.API_ROOT = self.api_root
+        storage.configure(self.previous)
+        self.tmp.cleanup()
+
+    def test_stream(self):
+        pipeline = SyncPipeline(fake_api.TOKEN, "2000-01-01", "2000-01-01", queue_size=4)
+        streamed = []
+        for result in pipeline:
+            # Each result arrives with its stroke data already saved
+            if needs_strokes(result):
+                self.assertTrue(cache.exists("strokes", result["id"]))
+            streamed.append(result["id"])
+
+        saved = [r["id"] for user in cache.keys("json") for r in cache.read_json("json", user)["data"]]
+        self.assertEqual(sorted(streamed), sorted(saved))
+        self.assertEqual(sorted(r["id"] for r in pipeline.new), sorted(saved))
+        self.assertEqual(pipeline.strokes, sum(map(needs_strokes, pipeline.new)))
+
+    def test_failed_strokes(self):
+        failed = set()
+
+        def get_stroke_data(user_id, result_id, api_token):
+            # Every other download fails
+            if result_id % 2:
+                failed.add(result_id)
+                return False
+            return download(user_id, result_id, api_token)
+
+        download = dl.get_stroke_data
+        with mock.patch.object(dl, "get_stroke_data", get_stroke_data):
+            pipeline = SyncPipeline(fake_api.TOKEN, "2000-01-01", "2000-01-01")
+            new = pipeline.run()
+        self.assertTrue(failed)
+        self.assertEqual(pipeline.queued, sum(map(needs_strokes, new)))
+        self.assertEqual(pipeline.strokes, pipeline.queued - len(failed))
+        self.assertEqual(pipeline.strokes, len(cache.keys("strokes")))
+
+    def test_close_early(self):
+        pipeline = SyncPipeline(fake_api.TOKEN, "2000-01-01", "2000-01-01", queue_size=2)
+        for count, _ in enumerate(pipeline):
+            if count == 3:
+                break
+        # Breaking out stops every stage instead of leaving them blocked
+        pipeline.close()
+        self.assertFalse(any(thread.is_alive() for thread in pipeline._threads))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,37 @@
+import unittest
+
+import numpy as np
+
+from power_curve import DURATIONS, piece_curve
+
+
+def strokes(seconds, pace, start=0):
+    # One stroke every 2.5s at a steady pace (tenths per 500m)
+    t = np.arange(25, seconds * 10 + 1, 25, dtype=float)
+    return np.column_stack([t, t * 5000 / pace, np.full(len(t), pace), np.full(len(t), 24)])
+
+
+class TestPowerCurve(unittest.TestCase):
+    def test_steady_piece(self):
+        # 2:00/500m is 202.5 watts for every duration the piece covers
+        curve = piece_curve(strokes(300, 1200))
+        covered = DURATIONS <= 300
+        np.testing.assert_allclose(curve[covered], 2.80 / (120 / 500) ** 3)
+        self.assertTrue(np.isnan(curve[~covered]).all())
+
+    def test_best_window(self):
+        # A fast minute in the middle of a steady piece
+        piece = strokes(600, 1200)
+        piece[(piece[:, 0] > 2400) & (piece[:, 0] <= 3000), 2] = 1000
+        curve = piece_curve(piece)
+        self.assertAlmostEqual(curve[DURATIONS == 60][0], 2.80 / (100 / 500) ** 3)
+
+    def test_intervals(self):
+        # Windows do not span the rest between intervals
+        curve = piece_curve(np.vstack([strokes(120, 1100), strokes(120, 1100)]))
+        self.assertFalse(np.isnan(curve[DURATIONS == 120][0]))
+        self.assertTrue(np.isnan(curve[DURATIONS == 180][0]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+
+import downloader as dl
+import fake_api
+import storage
+from profiles import age_band, age_on, enrich, fetch_profiles, get_profiles, stale_users
+from storage import connect
+
+
+class TestProfiles(unittest.TestCase):
+    def test_age_on(self):
+        self.assertEqual(age_on("2000-06-15", "2024-06-14 08:00:00"), 23)
+        self.assertEqual(age_on("2000-06-15", "2024-06-15"), 24)
+        self.assertIsNone(age_on(None, "2024-06-15"))
+
+    def test_age_band(self):
+        self.assertEqual(age_band(18), "U19")
+        self.assertEqual(age_band(22), "U23")
+        self.assertEqual(age_band(23), "23-29")
+        self.assertEqual(age_band(64), "50+")
+        self.assertIsNone(age_band(None))
+
+    def test_enrich(self):
+        result = {"user_id": 1, "date": "2024-03-01 10:00:00"}
+        profiles = {1: {"dob": "2003-01-01", "gender": "F", "weight_class": "L"}}
+
+        # Profile weight class and roster flags both count, novice comes first
+        info = enrich(result, {1: {"lightweight": False, "novice": False}}, profiles)
+        self.assertEqual((info["age"], info["age_band"]), (21, "U23"))
+        self.assertEqual(info["category"], "lightweight")
+        info = enrich(result, {1: {"lightweight": False, "novice": True}}, profiles)
+        self.assertEqual(info["category"], "novice")
+
+        # Athletes without a cached profile are still ranked
+        info = enrich({"user_id": 2, "date": "2024-03-01"}, {}, profiles)
+        self.assertEqual((info["age"], info["category"]), (None, "open"))
+
+
+class TestFetchProfiles(unittest.TestCase):
+    def setUp(self):
+        self.previous = storage.configure(storage.MemoryStorage())
+        self.server = fake_api.serve()
+        self.api_root, dl.API_ROOT = dl.API_ROOT, self.server.root
+
+    def tearDown(self):
+        self.server.shutdown()
+        dl.API_ROOT = self.api_root
+        storage.configure(self.previous)
+
+    def test_fetch(self):
+        users = list(range(1, 6))
+        self.assertEqual(stale_users(users), users)
+        done = []
+        fetched = fetch_profiles(users, fake_api.TOKEN, progress=lambda *args: done.append(args))
+        self.assertEqual(fetched, 5)
+        self.assertEqual(done[-1], ("profiles", 5, 5))
+        profiles = get_profiles()
+        for user in users:
+            expected = fake_api.make_profile(user)
+            self.assertEqual(profiles[user]["dob"], expected["dob"])
+            self.assertEqual(profiles[user]["weight_class"], expected["weight_class"])
+
+        # Fresh profiles are not fetched again
+        self.assertEqual(stale_users(users), [])
+        with mock.patch.object(dl, "get_profile") as get_profile:
+            self.assertEqual(fetch_profiles(users, fake_api.TOKEN), 0)
+        get_profile.assert_not_called()
+
+    def test_ttl(self):
+        fetch_profiles([1, 2, 3], fake_api.TOKEN)
+        old = (datetime.now() - timedelta(days=8)).isoformat(timespec="seconds")
+        conn = connect()
+        with conn:
+            conn.execute("UPDATE profiles SET fetched = ? WHERE user_id = '2'", (old,))
+        conn.close()
+
+        # Only the profile older than the TTL and the missing one are fetched
+        self.assertEqual(stale_users([1, 2, 3, 4]), [2, 4])
+        self.assertEqual(stale_users([1, 2, 3, 4], ttl=0), [1, 2, 3, 4])
+        self.assertEqual(fetch_profiles([1, 2, 3, 4], fake_api.TOKEN), 2)
+        self.assertGreater(get_profiles()[2]["fetched"], old)
+
+        # A failed fetch leaves the user stale, so the next refresh retries it
+        with mock.patch.object(dl, "get_profile", side_effect=ValueError("No profile")):
+            self.assertEqual(fetch_profiles([5], fake_api.TOKEN), 0)
+        self.assertEqual(stale_users([5]), [5])
+
+
+if __name__ == '__main__':
+    unittest.main()
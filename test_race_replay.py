@@ -0,0 +1,43 @@
+import unittest
+
+import numpy as np
+
+import fake_api
+from race_replay import piece_track, race
+
+
+def strokes_of(result):
+    rows = [(s["t"], s["d"], s["p"], s["spm"]) for s in fake_api.make_strokes(result)]
+    return np.array(rows, dtype=float)
+
+
+class TestRaceReplay(unittest.TestCase):
+    def test_even_pace(self):
+        # Athletes at 1:40, 1:45 and 1:50 per 500m over 2k
+        tracks = [(np.array([0.0, 2000.0]), np.array([0.0, 4 * split])) for split in (100, 105, 110)]
+        replayed = race(tracks, step=100, split_length=500)
+        self.assertEqual(replayed["winner"], 0)
+        self.assertEqual(len(replayed["grid"]), 21)
+        np.testing.assert_allclose(replayed["time_gaps"][:, -1], [0, 20, 40])
+        np.testing.assert_allclose(replayed["distance_gaps"][:, -1], [0, 2000 - 2000 * 100 / 105, 2000 - 2000 * 100 / 110])
+        np.testing.assert_allclose(replayed["splits"], [[100] * 4, [105] * 4, [110] * 4])
+        np.testing.assert_allclose(replayed["split_deltas"][2], [10] * 4)
+
+    def test_piece_track(self):
+        pieces = [fake_api.make_result(user, number) for user in range(1, 30) for number in range(20)]
+        single = next(r for r in pieces if "workout" not in r and r["type"] == "rower" and r["distance"] == 2000)
+        distance, time = piece_track(strokes_of(single), single)
+        self.assertAlmostEqual(distance[-1], 2000, delta=1)
+        self.assertAlmostEqual(time[-1], single["time"] / 10, delta=1)
+
+        # Intervals are joined end to end without the rests
+        intervals = next(r for r in pieces if "workout" in r and r["type"] == "bike")
+        strokes = strokes_of(intervals)
+        distance, time = piece_track(strokes, intervals)
+        self.assertTrue((np.diff(distance) >= 0).all() and (np.diff(time) >= 0).all())
+        self.assertAlmostEqual(distance[-1], intervals["distance"] / 2 , delta=len(intervals["workout"]["intervals"]))
+        self.assertAlmostEqual(time[-1], intervals["time"] / 10, delta=len(intervals["workout"]["intervals"]))
+
+
+if __name__ == '__main__':
+    unittest.main()
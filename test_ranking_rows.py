@@ -0,0 +1,52 @@
+import sys
+import unittest
+
+from ranking_rows import RankingRow
+from workouts import BANNERS, COLUMNS, WORKOUTS
+
+
+def piece(user, time, distance, erg="rower"):
+    return {
+        "user_id": user,
+        "type": erg,
+        "date": "2024-01-01",
+        "time": time,
+        "distance": distance,
+        "stroke_rate": 30,
+    }
+
+
+class TestRankingRows(unittest.TestCase):
+    def test_key(self):
+        # Numeric times sort correctly where their strings do not ("10:00.0" < "9:00.0")
+        rows = [RankingRow.from_result(piece(1, 6000, 2000), "A"), RankingRow.from_result(piece(2, 5400, 2000), "B")]
+        self.assertEqual([r.name for r in sorted(rows, key=lambda r: r.key("single_distance"))], ["B", "A"])
+        # The longest distance ranks first in a time piece, and bikes before ergs
+        rows = [
+            RankingRow.from_result(piece(1, 600, 300), "A"),
+            RankingRow.from_result(piece(2, 600, 320), "B"),
+            RankingRow.from_result(piece(3, 600, 500, "bike"), "C"),
+        ]
+        self.assertEqual([r.name for r in sorted(rows, key=lambda r: r.key("1min"))], ["C", "B", "A"])
+
+    def test_cells(self):
+        row = RankingRow.from_result(piece(1, 4200, 2000), "A", splits=[1050.0] * 8)
+        cells = row.cells("single_distance")
+        self.assertEqual(len(cells), len(BANNERS["2k"]))
+        self.assertEqual(cells[3:6], ["7:00.0", "1:45.0", 302])
+        self.assertEqual(cells[-1], "1:45.0")
+        self.assertEqual(row.as_dict()["split"], 1050.0)
+        for name, spec in WORKOUTS.items():
+            splits = [1050.0] * (len(BANNERS[name]) - len(COLUMNS[spec["kind"]]))
+            cells = RankingRow.from_result(piece(1, 4200, 2000), "A", splits).cells(spec["kind"])
+            self.assertEqual(len(cells), len(BANNERS[name]))
+
+    def test_memory(self):
+        row = RankingRow.from_result(piece(1, 4200, 2000), "A")
+        self.assertFalse(hasattr(row, "__dict__"))
+        cells = row.cells("single_distance")
+        self.assertLess(sys.getsizeof(row), sys.getsizeof(cells) + sum(sys.getsizeof(c) for c in cells))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import os
+import tempfile
+import unittest
+from sqlite3 import connect
+
+from roster import export_roster, import_roster, validate
+
+
+class TestRoster(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.database = os.path.join(self.tmp.name, "users.db")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write(self, name, text):
+        path = os.path.join(self.tmp.name, name)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+        return path
+
+    def test_upsert(self):
+        path = self.write("roster.csv", "user_id,name,lightweight,novice\n1,Ann,yes,\n2,Bea,n,1\n")
+        self.assertEqual(import_roster(path, self.database), 2)
+        con = connect(self.database)
+        con.execute("UPDATE users SET Two_KM = '7:00.0' WHERE user_id = '1'")
+        con.commit()
+
+        # Existing athletes are updated and keep their PBs
+        path = self.write("roster.json", '[{"user_id": 1, "name": "Ann B", "lightweight": false}]')
+        import_roster(path, self.database)
+        row = con.execute("SELECT name, lightweight, Two_KM FROM users WHERE user_id = '1'").fetchone()
+        self.assertEqual(row, ("Ann B", 0, "7:00.0"))
+        self.assertEqual(con.execute("SELECT COUNT(*) FROM users").fetchone()[0], 2)
+        con.close()
+
+    def test_round_trip(self):
+        path = self.write("roster.csv", "user_id,name,novice\n3,Cat,true\n4,Dee,false\n")
+        import_roster(path, self.database)
+        for name in ("export.csv", "export.json"):
+            export = os.path.join(self.tmp.name, name)
+            self.assertEqual(export_roster(export, self.database), 2)
+            self.assertEqual(import_roster(export, self.database), 2)
+
+    def test_invalid(self):
+        rows = [
+            {"user_id": "5", "name": "Eve"},
+            {"user_id": "abc", "name": "Fay"},
+            {"user_id": "5", "name": "Eve again"},
+            {"user_id": "6", "name": ""},
+            {"user_id": "7", "name": "Gus", "novice": "maybe"},
+        ]
+        with self.assertRaises(ValueError) as context:
+            validate(rows)
+        # One message per invalid row, the valid first row not among them
+        self.assertEqual(
+            str(context.exception).splitlines()[1:],
+            [
+                "row 2: user_id 'abc' is not a Concept2 user ID",
+                "row 3: user_id 5 is also in row 1",
+                "row 4: name is empty",
+                "row 5: 'maybe' is not a yes/no value",
+            ],
+        )
+
+        # Nothing is written from an invalid file
+        path = self.write("bad.csv", "user_id,name\n8,Hal\nx,Ivy\n")
+        with self.assertRaises(ValueError):
+            import_roster(path, self.database)
+        self.assertFalse(os.path.exists(self.database))
+
+
+if __name__ == '__main__':
+    unittest.main()
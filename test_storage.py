@@ -0,0 +1,81 @@
+import json
+import os
+import tempfile
+import unittest
+
+import cache
+import fake_api
+import roster
+import storage
+import workout_finder as wf
+from storage import FileStorage, MemoryStorage
+
+
+class TestStorage(unittest.TestCase):
+    def test_roots(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            strokes = os.path.join(tmp, "fast")
+            with storage.using(FileStorage(tmp, strokes=strokes)):
+                cache.write_json("json", 1, {"data": [1]})
+                cache.write_json("strokes", 2, {"data": [2]})
+                self.assertEqual(cache.read_json("json", 1), {"data": [1]})
+                self.assertEqual(cache.keys("strokes"), ["2"])
+            self.assertTrue(os.path.exists(os.path.join(tmp, "json", "1.json.gz")))
+            self.assertTrue(os.path.exists(os.path.join(strokes, "2.json.gz")))
+        with self.assertRaises(ValueError):
+            FileStorage(".", cache="/tmp")
+
+    def test_memory(self):
+        with storage.using(MemoryStorage()):
+            cache.write_json("json", 1, {"data": [1, 2]})
+            self.assertTrue(cache.exists("json", 1))
+            self.assertEqual(cache.read_json("json", 1), {"data": [1, 2]})
+            self.assertIsNone(storage.local_path("json/1.json.gz"))
+
+            # A failed write leaves the old file in place
+            with self.assertRaises(RuntimeError):
+                with storage.atomic("data/status.json", "w", encoding="utf-8") as f:
+                    f.write("partial")
+                    raise RuntimeError()
+            self.assertFalse(storage.exists("data/status.json"))
+
+            # Every connection sees the same database
+            roster.create_table()
+            conn = storage.connect()
+            with conn:
+                conn.execute("INSERT INTO users (user_id, name) VALUES (1, 'A B')")
+            conn.close()
+            conn = storage.connect()
+            self.assertEqual(conn.execute("SELECT name FROM users").fetchall(), [("A B",)])
+            conn.close()
+        self.assertNotIsInstance(storage.get(), MemoryStorage)
+
+    def test_rank_in_memory(self):
+        results = [fake_api.make_result(user, n) for user in range(1, 6) for n in range(20)]
+        with storage.using(MemoryStorage()):
+            roster.create_table()
+            conn = storage.connect()
+            with conn:
+                conn.executemany(
+                    "INSERT INTO users (user_id, name) VALUES (?, ?)",
+                    [(user, f"Athlete {user}") for user in range(1, 6)],
+                )
+            conn.close()
+            for user in range(1, 6):
+                cache.write_json("json", user, {"data": [r for r in results if r["user_id"] == user]})
+            for result in results:
+                cache.write_json("strokes", result["id"], {"data": fake_api.make_strokes(result)})
+
+            wf.rank(fake_api.TOKEN, "2k", bikes=True)
+            self.assertTrue(any(name.endswith("_2k.xlsx") for name in storage.listdir("results")))
+            with storage.open_file("results/2k.json", "r", encoding="utf-8") as f:
+                ranked = json.load(f)
+            with storage.open_file("results/2k_team.json", "r", encoding="utf-8") as f:
+                team = json.load(f)
+        self.assertEqual(ranked["workout"], "2k")
+        self.assertTrue(ranked["entries"])
+        self.assertEqual(team["partitions"]["open/all/all"]["time"]["count"], len(ranked["entries"]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,40 @@
+import io
+import json
+import unittest
+from json import JSONDecodeError
+
+from stroke_reader import iter_strokes
+
+
+class TestStrokeReader(unittest.TestCase):
+    def setUp(self):
+        self.strokes = [
+            {"t": 25 * n, "d": 100 * n, "p": 1050 + n, "spm": 24, "hr": 150}
+            for n in range(1, 200)
+        ]
+
+    def test_iter_strokes(self):
+        # Pretty-printed files are read across many small chunks
+        text = json.dumps({"data": self.strokes}, indent=4)
+        strokes = list(iter_strokes(io.StringIO(text), chunk_size=7))
+        self.assertEqual(strokes, [(s["t"], s["d"], s["p"], s["spm"]) for s in self.strokes])
+
+    def test_early_termination(self):
+        f = io.StringIO(json.dumps({"data": self.strokes}))
+        strokes = iter_strokes(f, chunk_size=64)
+        self.assertEqual(next(strokes), (25, 100, 1051, 24))
+        self.assertLess(f.tell(), 256)
+
+    def test_no_data(self):
+        # Error bodies have no stroke data
+        text = json.dumps({"error": "unauthenticated", "message": "Unauthenticated."})
+        self.assertEqual(list(iter_strokes(io.StringIO(text), chunk_size=4)), [])
+
+    def test_truncated(self):
+        text = json.dumps({"data": self.strokes})[:-100]
+        with self.assertRaises(JSONDecodeError):
+            list(iter_strokes(io.StringIO(text), chunk_size=16))
+
+
+if __name__ == '__main__':
+    unittest.main()
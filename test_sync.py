@@ -0,0 +1,121 @@
+import threading
+import unittest
+from unittest import mock
+
+import downloader as dl
+import fake_api
+import roster
+import storage
+import cache
+import sync
+from manifest import DONE, FAILED, MANIFEST_FILE, Manifest
+
+
+class TestSync(unittest.TestCase):
+    def setUp(self):
+        self.previous = storage.configure(storage.MemoryStorage())
+        roster.create_table()
+        conn = storage.connect()
+        with conn:
+            conn.executemany(
+                "INSERT INTO users (user_id, name) VALUES (?, ?)",
+                [(user, f"Athlete {user}") for user in range(1, 6)],
+            )
+        conn.close()
+        self.server = fake_api.serve()
+        self.api_root, dl.API_ROOT = dl.API_ROOT, self.server.root
+
+    def tearDown(self):
+        self.server.shutdown()
+        dl.API_ROOT = self.api_root
+        storage.configure(self.previous)
+
+    def test_sync(self):
+        self.assertEqual(sync.read_status()["status"], "never synced")
+        status = sync.sync_once(fake_api.TOKEN, 21)
+        self.assertEqual(status["status"], "ok")
+        self.assertIsNotNone(status["last_sync"])
+        self.assertEqual(sorted(cache.keys("json")), [str(user) for user in range(1, 6)])
+        self.assertEqual(status["results"], sum(len(fake_api.make_results(user)) for user in range(1, 6)))
+        self.assertFalse(storage.exists(MANIFEST_FILE))
+        self.assertEqual(sync.read_status(), status)
+
+    def test_steps(self):
+        seen = []
+        status = sync.sync_once(fake_api.TOKEN, 21, steps=[("pieces", lambda results: seen.extend(results) or len(results))])
+        self.assertEqual(status["steps"], {"pieces": status["results"]})
+        self.assertEqual(len(seen), status["results"])
+
+    def test_resume(self):
+        cancel = threading.Event()
+
+        def progress(stage, done, total):
+            if stage == "sync" and done == 2:
+                cancel.set()
+
+        status = sync.sync_once(fake_api.TOKEN, 21, progress, cancel)
+        self.assertEqual(status["status"], "cancelled")
+        self.assertIsNone(status.get("last_sync"))
+        done = len(Manifest.resume("2000-01-01", "2000-01-01").keys("results/", DONE))
+        self.assertGreaterEqual(done, 2)
+
+        # The next sync skips the users done and finishes the rest
+        requests = []
+        fetch = dl.get_all_pages
+        with mock.patch.object(dl, "get_all_pages", lambda *args: requests.append(args) or fetch(*args)):
+            status = sync.sync_once(fake_api.TOKEN, 21)
+        self.assertEqual(status["status"], "ok")
+        self.assertLessEqual(len(requests), 5 - done)
+        self.assertEqual(len(cache.keys("json")), 5)
+
+    def test_service_survives_errors(self):
+        calls = []
+
+        def sync_once(*args):
+            calls.append(args)
+            if len(calls) == 1:
+                raise KeyError("data")
+            service._stop.set()
+            return {"status": "ok"}
+
+        service = sync.SyncService(lambda: fake_api.TOKEN, interval=0)
+        with mock.patch.object(sync, "sync_once", sync_once):
+            service.start()
+            service._thread.join(5)
+        self.assertFalse(service._thread.is_alive())
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(sync.read_status()["error"], "'data'")
+
+    def test_stop_cancels(self):
+        started = threading.Event()
+
+        def sync_once(api_token, days, progress, cancel, *args):
+            started.set()
+            (cancel or threading.Event()).wait(10)
+            return {"status": "cancelled"}
+
+        service = sync.SyncService(lambda: fake_api.TOKEN)
+        with mock.patch.object(sync, "sync_once", sync_once):
+            service.start()
+            self.assertTrue(started.wait(5))
+            # Stopping does not wait for the sync to finish on its own
+            stopper = threading.Thread(target=service.stop)
+            stopper.start()
+            stopper.join(5)
+        self.assertFalse(stopper.is_alive())
+        self.assertFalse(service._thread.is_alive())
+
+    def test_partial(self):
+        with mock.patch.object(dl, "get_stroke_data", lambda *args: False):
+            status = sync.sync_once(fake_api.TOKEN, 21)
+        self.assertEqual(status["status"], "partial")
+        self.assertIsNone(status.get("last_sync"))
+        # The manifest is kept, so the next sync retries the failed requests
+        self.assertTrue(storage.exists(MANIFEST_FILE))
+        manifest = Manifest.resume("2000-01-01", "2000-01-01")
+        self.assertTrue(manifest.count(FAILED))
+        self.assertTrue(manifest.resumed)
+
+
+if __name__ == '__main__':
+    unittest.main()
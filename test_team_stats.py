@@ -0,0 +1,74 @@
+import unittest
+
+import numpy as np
+
+import fake_api
+import roster
+import storage
+import team_stats
+from ranking_rows import RankingRow
+from team_stats import Moments, QuantileSketch, TeamStats
+from workouts import classify
+
+
+class TestTeamStats(unittest.TestCase):
+    def test_moments(self):
+        values = np.random.default_rng(1).normal(1050, 60, 1000)
+        first, second = Moments(), Moments()
+        for value in values[:300]:
+            first.add(value)
+        for value in values[300:]:
+            second.add(value)
+        first.merge(second)
+        self.assertEqual(first.count, len(values))
+        self.assertAlmostEqual(first.mean, values.mean())
+        self.assertAlmostEqual(first.std, values.std(ddof=1))
+        self.assertEqual((first.minimum, first.maximum), (values.min(), values.max()))
+
+    def test_sketch(self):
+        values = np.random.default_rng(2).normal(1050, 60, 50000)
+        sketches = [QuantileSketch(seed=n) for n in range(5)]
+        for n, value in enumerate(values):
+            sketches[n % 5].add(value)
+        merged = sketches[0]
+        for sketch in sketches[1:]:
+            merged.merge(QuantileSketch.from_dict(sketch.to_dict()))
+        self.assertEqual(merged.count, len(values))
+        self.assertLess(len(merged), 3 * merged.k)
+        ordered = np.sort(values)
+        for q, estimate in zip(team_stats.QUANTILES, merged.quantiles(team_stats.QUANTILES)):
+            self.assertLess(abs(np.searchsorted(ordered, estimate) / len(values) - q), 0.02)
+        self.assertEqual(QuantileSketch().quantiles([0.5]), [None])
+
+    def test_weeks(self):
+        results = [r for user in range(1, 6) for r in fake_api.make_results(user, 60)]
+        with storage.using(storage.MemoryStorage()):
+            roster.create_table()
+            conn = storage.connect()
+            with conn:
+                conn.executemany(
+                    "INSERT INTO users (user_id, name, lightweight) VALUES (?, ?, ?)",
+                    [(user, f"Athlete {user}", user % 2) for user in range(1, 6)],
+                )
+            conn.close()
+            written = team_stats.update_weeks(iter(results))
+            self.assertGreater(written, 1)
+            merged = team_stats.season("2k")
+
+        expected = TeamStats("single_distance")
+        for result in results:
+            if classify(result) == "2k":
+                expected.add(RankingRow.from_result(result, ""), ["all"])
+        self.assertTrue(expected.count("all"))
+        self.assertEqual(merged.count("open/all/all"), expected.count("all"))
+        summary = merged.summary()["open/all/all"]["time"]
+        self.assertAlmostEqual(summary["mean"], expected.summary()["all"]["time"]["mean"])
+        self.assertLessEqual(summary["min"], summary["p50"])
+        self.assertLessEqual(summary["p50"], summary["max"])
+        # Lightweights are users 1, 3 and 5
+        lightweight = [r for r in results if classify(r) == "2k" and r["user_id"] % 2]
+        self.assertEqual(merged.count("lightweight/all/all"), len(lightweight))
+
+
+if __name__ == '__main__':
+    unittest.main()
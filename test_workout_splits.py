@@ -0,0 +1,50 @@
+import json
+import unittest
+
+import cache
+import storage
+import workout_finder as wf
+
+
+def steady(seconds, meters):
+    """Strokes every 2.5s at a steady pace, t in tenths and d in decimeters."""
+    count = seconds * 10 // 25
+    return [{"t": 25 * n, "d": meters * 10 * n // count, "p": 1000, "spm": 24} for n in range(1, count + 1)]
+
+
+class TestSplits(unittest.TestCase):
+    def setUp(self):
+        self.previous = storage.configure(storage.MemoryStorage())
+        # 2000m in 400s: 100s per 500m
+        cache.write_json("strokes", 1, {"data": steady(400, 2000)})
+
+    def tearDown(self):
+        storage.configure(self.previous)
+
+    def test_splits(self):
+        splits, accumulated = wf.get_intervals(1, 500, 3)
+        self.assertEqual(len(splits), 3)
+        self.assertAlmostEqual(accumulated, 3000)
+        for split in splits:
+            self.assertAlmostEqual(split, 1000, delta=1)
+        splits, accumulated = wf.get_times(1, 1000, 3)
+        self.assertEqual(len(splits), 3)
+        self.assertAlmostEqual(accumulated, 1500)
+
+    def test_skipped(self):
+        # A missing stroke file, or one ending before the splits, is skipped
+        self.assertIsNone(wf.get_intervals(2, 500, 3))
+        self.assertIsNone(wf.get_times(2, 1000, 3))
+        cache.write_json("strokes", 3, {"data": steady(400, 2000)[:40]})
+        self.assertIsNone(wf.get_intervals(3, 500, 3))
+        self.assertIsNone(wf.get_times(3, 1000, 3))
+        # Strokes without a distance, or a truncated file
+        cache.write_json("strokes", 4, {"data": [{"t": 25, "p": 1000, "spm": 24}]})
+        self.assertIsNone(wf.get_intervals(4, 500, 3))
+        with storage.open_file("strokes/5.json", "w", encoding="utf-8") as f:
+            f.write(json.dumps({"data": steady(400, 2000)})[:2000])
+        self.assertIsNone(wf.get_times(5, 1000, 3))
+
+
+if __name__ == '__main__':
+    unittest.main()
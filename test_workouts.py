@@ -0,0 +1,35 @@
+import unittest
+from workouts import WORKOUTS, build_index, classify
+
+
+class TestWorkouts(unittest.TestCase):
+    def test_classify(self):
+        # Single pieces are keyed on distance or time
+        result = {"workout_type": "FixedDistanceSplits", "type": "rower", "distance": 2000, "time": 4200}
+        self.assertEqual(classify(result), "2k")
+        result = {"workout_type": "FixedTimeSplits", "type": "rower", "distance": 15000, "time": 36000}
+        self.assertEqual(classify(result), "hour")
+
+        # Bike distances are halved
+        result = {"workout_type": "FixedDistanceSplits", "type": "bike", "distance": 12000, "time": 9000}
+        self.assertEqual(classify(result), "6k")
+
+        # Variable intervals match on distance or time
+        result = {"workout_type": "VariableInterval", "type": "rower", "distance": 4000, "time": 8000}
+        self.assertEqual(classify(result), "4x1k")
+        result = {"workout_type": "VariableInterval", "type": "rower", "distance": 9500, "time": 21600}
+        self.assertEqual(classify(result), "3x12min")
+
+        # Anything else is not ranked
+        result = {"workout_type": "JustRow", "type": "rower", "distance": 2000, "time": 4200}
+        self.assertIsNone(classify(result))
+
+    def test_build_index(self):
+        workouts = dict(WORKOUTS)
+        workouts["2k_copy"] = WORKOUTS["2k"]
+        with self.assertRaises(ValueError):
+            build_index(workouts)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -4,40 +4,45 @@ Valkyrie is a workout ranking and management tool for Concept2 rowing machines.
 
 Functions:
 - open_settings(): Open the settings window and read the values of the settings.
+- run_jobs(): Run the queued syncs and rankings on a worker thread.
+- queue_job(workout_name, job_bikes, since): Queue a ranking or a sync.
+- cancel_jobs(): Drop the waiting jobs and stop the running one.
 """
 
-from os import path, listdir, remove, getcwd
+from os import path
 from subprocess import Popen
+from datetime import datetime, timedelta
+from queue import Queue, Empty
 import logging
+import threading
 
 import PySimpleGUI as sg
 
-import downloader as dl
 import workout_finder as wf
 import authorization as auth
+import logs
+import storage
+import sync
+from workouts import WORKOUTS
 
-logging.basicConfig(
-    filename="data/debug.log",
-    level=logging.INFO,
-    format="%(asctime)s - %(levelname)s - %(message)s",
-)
+logs.setup()
 
 bikes, days = True, 2
 # Define the layout of the GUI
 layout = [
     [sg.Button("Settings"), sg.Button("Manage Database")],
     [sg.Text("Choose an option to rank the workout:")],
-    [sg.Radio("Peak Power", "RADIO1", key="Peak Power")],
-    [sg.Radio("1 Minute", "RADIO1", key="1 Minute")],
-    [sg.Radio("1km", "RADIO1", key="1km")],
-    [sg.Radio("2km", "RADIO1", key="2km")],
-    [sg.Radio("6km", "RADIO1", key="6km")],
-    [sg.Radio("Hour of Power", "RADIO1", key="Hour of Power")],
-    [sg.Radio("4x1km", "RADIO1", key="4x1km")],
-    [sg.Radio("3x6km", "RADIO1", key="3x6km")],
-    [sg.Radio("3x12", "RADIO1", key="3x12")],
-    [sg.Radio("3x30", "RADIO1", key="3x30")],
-    [sg.Button("Run"), sg.Button("Log"), sg.Button("Exit")],
+    *[[sg.Radio(spec["label"], "RADIO1", key=name)] for name, spec in WORKOUTS.items()],
+    [
+        sg.Button("Run"),
+        sg.Button("Sync Now"),
+        sg.Button("Cancel"),
+        sg.Button("Log"),
+        sg.Button("Exit"),
+    ],
+    [sg.Text("", size=(40, 1), key="-STAGE-")],
+    [sg.ProgressBar(1, orientation="h", size=(30, 20), key="-PROGRESS-")],
+    [sg.Text("", key="-SYNC-")],
 ]
 
 
@@ -70,10 +75,9 @@ def open_settings():
             break
 
         elif event == "Clean":
-            for file in listdir(path.join(getcwd(), "strokes")):
-                remove(path.join(getcwd(), "strokes", file))
-            for file in listdir(path.join(getcwd(), "results")):
-                remove(path.join(getcwd(), "results", file))
+            for directory in ("strokes", "results"):
+                for file in storage.listdir(directory):
+                    storage.remove(path.join(directory, file))
             clean = sg.Window(
                 title="Clean-up",
                 layout=[[sg.Text("Clean-up complete")], [sg.Button("Exit")]],
@@ -93,13 +97,114 @@ def open_settings():
     )
 
 
+def sync_text():
+    """Describe the status of the background sync."""
+    status = sync.read_status()
+    text = f"Sync: {status['status']}, last synced {status['last_sync'] or 'never'}"
+    endpoints = status.get("concurrency") or {}
+    rates = [
+        f"{kind} {stats['throughput']}/s x{stats['limit']}"
+        for kind, stats in endpoints.items()
+        if stats["requests"]
+    ]
+    return f"{text} ({', '.join(rates)})" if rates else text
+
+
+def run_jobs():
+    """Run the queued syncs and rankings on a worker thread.
+
+    Progress and results are posted back to the window as events, since the
+    window must only be updated from the event loop.
+    """
+
+    def progress(stage, done, total):
+        window.write_event_value("-JOB-PROGRESS-", (stage, done, total))
+
+    while True:
+        workout_name, job_bikes, since, cancel = jobs.get()
+        try:
+            # Rank straight from the local data, only syncing if it was never synced
+            if workout_name is None:
+                sync_service.sync(progress, cancel)
+                if cancel.is_set():
+                    raise wf.Cancelled("Cancelled during sync")
+            elif sync.read_status()["last_sync"] is None:
+                # Rank the results as they arrive instead of after the sync
+                sync_service.sync(
+                    progress,
+                    cancel,
+                    rank=lambda results: wf.rank(
+                        sync_service.token(),
+                        workout_name,
+                        job_bikes,
+                        since,
+                        progress,
+                        cancel,
+                        results,
+                    ),
+                    rank_since=since,
+                )
+            else:
+                wf.rank(
+                    sync_service.token(),
+                    workout_name,
+                    job_bikes,
+                    since,
+                    progress,
+                    cancel,
+                )
+            window.write_event_value("-JOB-DONE-", workout_name)
+        except wf.Cancelled:
+            window.write_event_value("-JOB-CANCELLED-", workout_name)
+        except Exception as e:  # pylint: disable=broad-except
+            # Report any failure to the window instead of killing the worker
+            logging.exception("Job %s failed", workout_name)
+            window.write_event_value("-JOB-ERROR-", (workout_name, str(e)))
+        finally:
+            with jobs_lock:
+                pending.discard(cancel)
+
+
+def queue_job(workout_name, job_bikes, since):
+    """Queue a ranking, or a sync without a workout name, for the worker thread."""
+    cancel = threading.Event()
+    with jobs_lock:
+        pending.add(cancel)
+    jobs.put((workout_name, job_bikes, since, cancel))
+
+
+def cancel_jobs():
+    """Drop the waiting jobs and stop the running one."""
+    try:
+        while True:
+            jobs.get_nowait()
+    except Empty:
+        pass
+    with jobs_lock:
+        for cancel in pending:
+            cancel.set()
+        pending.clear()
+
+
+# Keep the results and stroke data warm in the background
+sync_service = sync.SyncService(auth.auth)
+sync_service.start()
+
+# Queue the rankings for the worker thread, each with the event a Cancel sets.
+# The event is created when the job is queued, so a Cancel clicked while the
+# worker is picking the job up still stops it.
+jobs = Queue()
+pending = set()
+jobs_lock = threading.Lock()
+
 # Create the window
-window = sg.Window("Valkyrie", layout, icon="resources/VarsityV.ico")
+window = sg.Window("Valkyrie", layout, icon="resources/VarsityV.ico", finalize=True)
+threading.Thread(target=run_jobs, daemon=True).start()
 
 # Write the event loop
 while True:
-    # Read the events and values from the window
-    event, values = window.read()
+    # Read the events and values from the window, timing out to refresh the sync status
+    event, values = window.read(timeout=1000)
     # If the user clicks the Exit button or closes the window, break the loop
     if event == sg.WINDOW_CLOSED or event == "Exit":
         break
@@ -107,6 +212,34 @@ while True:
     elif event == "Settings":
         bikes, days = open_settings()
 
+    elif event == sg.TIMEOUT_EVENT:
+        window["-SYNC-"].update(sync_text())
+
+    elif event == "Sync Now":
+        queue_job(None, bikes, None)
+        window["-STAGE-"].update(f"Queued sync ({jobs.qsize()} waiting)")
+
+    elif event == "Cancel":
+        cancel_jobs()
+
+    elif event == "-JOB-PROGRESS-":
+        stage, done, total = values[event]
+        window["-STAGE-"].update(f"{stage.capitalize()}: {done}/{total}")
+        window["-PROGRESS-"].update(done, max=total)
+
+    elif event == "-JOB-DONE-":
+        window["-STAGE-"].update(f"Done ({jobs.qsize()} waiting)")
+        if values[event] is not None:
+            wf.open_xlsx(values[event])
+
+    elif event == "-JOB-CANCELLED-":
+        window["-STAGE-"].update("Cancelled")
+        window["-PROGRESS-"].update(0)
+
+    elif event == "-JOB-ERROR-":
+        workout_name, error = values[event]
+        sg.popup_error(f"Ranking {workout_name or 'sync'} failed: {error}")
+
     elif event == "Manage Database":
         # Open the "Manage Databases" window as a persisting popup
         Popen(["python", "data_gui.py"])
@@ -150,71 +283,18 @@ while True:
         log.close()
     # If the user clicks the Run button, check which option is selected and run the API script
     elif event == "Run":
-        if values["Peak Power"]:
-            api_token = auth.auth()
-            dl.get_results(api_token, days)
-            wf.find_peak_power(api_token)
-            wf.open_xlsx("peak_power")
-
-        elif values["1 Minute"]:
-            api_token = auth.auth()
-            dl.get_results(api_token, days)
-            wf.find_1min(bikes)
-            wf.open_xlsx("1min")
-
-        elif values["1km"]:
-            api_token = auth.auth()
-            dl.get_results(api_token, days)
-            wf.rank_single_distance(api_token, 200, 5, "1k", bikes)
-            wf.open_xlsx("1k")
-
-        elif values["2km"]:
-            api_token = auth.auth()
-            dl.get_results(api_token, days)
-            print("downloaded results")
-            wf.rank_single_distance(api_token, 250, 8, "2k", bikes)
-            wf.open_xlsx("2k")
-
-        elif values["6km"]:
-            api_token = auth.auth()
-            dl.get_results(api_token, days)
-            wf.rank_single_distance(api_token, 500, 12, "6k", bikes)
-            wf.open_xlsx("6k")
-
-        elif values["Hour of Power"]:
-            api_token = auth.auth()
-            dl.get_results(api_token, days)
-            wf.rank_single_time(api_token, 3000, 12, "hour", bikes)
-            wf.open_xlsx("hour")
-
-        elif values["4x1km"]:
-            api_token = auth.auth()
-            dl.get_results(api_token, days)
-            wf.rank_intervals_distance(1000 * 4, 1000, 4, "4x1k", bikes)
-            wf.open_xlsx("4x1k")
-
-        elif values["3x6km"]:
-            api_token = auth.auth()
-            dl.get_results(api_token, days)
-            wf.rank_intervals_distance(6000 * 3, 6000, 3, "3x6k", bikes)
-            wf.open_xlsx("3x6k")
-
-        elif values["3x12"]:
-            api_token = auth.auth()
-            dl.get_results(api_token, days)
-            wf.rank_intervals_time(7200, 3, "3x12min", bikes)
-            wf.open_xlsx("3x12min")
-
-        elif values["3x30"]:
-            # Run the API script with option 10
-            api_token = auth.auth()
-            dl.get_results(api_token, days)
-            wf.rank_intervals_time(18000, 3, "3x30min", bikes)
-            wf.open_xlsx("3x30min")
-
-        else:
+        selected = next((name for name in WORKOUTS if values[name]), None)
+        if selected is None:
             # No option is selected, show an error message
             sg.popup_error("Please select an option before running the script")
 
-# Close the window
+        else:
+            # Queue the ranking behind any running or waiting ones
+            since = (datetime.today() - timedelta(days=days)).strftime("%Y-%m-%d")
+            queue_job(selected, bikes, since)
+            window["-STAGE-"].update(f"Queued {selected} ({jobs.qsize()} waiting)")
+
+# Close the window, stopping the running job
+cancel_jobs()
 window.close()
+sync_service.stop()
@@ -3,163 +3,69 @@ This module contains functions for finding and analyzing workout data,
 and saving the results to an Excel file.
 
 Functions:
+- rank_key(kind: str) -> Callable
+- leaderboards_of(kind: str) -> Leaderboards
 - output_to_xlsx(ranking: list, name: str, banner: list) -> None
+- save_ranking(boards: Leaderboards, workout_name: str) -> None
 - open_xlsx(name: str) -> None
 - find_approx(dist1: float, dist2: float, time1: float, time2: float, target_distance: int) -> float
-- get_intervals(workout_id: str, split_length: int, num_splits: int) -> list
-- get_times(workout_id: str, split_length: int, num_splits: int) -> list
+- get_intervals(workout_id: str, split_length: int, num_splits: int) -> tuple
+- get_times(workout_id: str, split_length: int, num_splits: int) -> tuple
+- process_workout(workout: dict, splits: tuple) -> RankingRow
+- iter_results(since: str, progress: Callable, cancel: Event, results: Iterable) -> Iterator[dict]
+- rank(api_token: str, workout_name: str, bikes: bool, since: str, ...) -> None
 """
 
 import logging
 import os
-from json import load
+import subprocess
+import sys
+from json import dump
 from datetime import datetime, timedelta
-from typing import List, Union
+from threading import Event
+from typing import Callable, Iterable
 
 from openpyxl import Workbook
-import PySimpleGUI as sg
 
+import cache
 import converter as cv
 import database_request as dr
 import downloader as dl
-
-logging.basicConfig(
-    filename="data/debug.log",
-    level=logging.INFO,
-    format="%(asctime)s - %(levelname)s - %(message)s",
-)
+import logs
+import storage
+from leaderboards import OVERALL, Leaderboards
+from ranking_rows import RankingRow
+from stroke_reader import stream_strokes
+from team_stats import TeamStats
+from workouts import BANNERS, BIKE_DISTANCE_FACTOR, WORKOUTS, classify, included
 
 date = (datetime.today() - timedelta(days=7)).strftime("%Y-%m-%d")
-JSON = os.path.join(os.getcwd(), "json")
-STROKES = os.path.join(os.getcwd(), "strokes")
-USERS = dr.get_number_users()
-BIKE_DISTANCE_FACTOR = 2
+JSON = "json"
+STROKES = "strokes"
 TENTHS_PER_SECOND = 10
 SECONDS_PER_MINUTE = 60
 TENTHS_PER_MINUTE = 600
 DATE_CONSTANT = 10
-LAYOUT = [
-    [sg.Text("Ranking workouts...")],
-    [sg.ProgressBar(USERS, orientation="h", size=(20, 20), key="progress")],
-]
-BANNERS = {
-    "peak_power": ["Name", "PB", "Date", "Watts", "Split", "SPM"],
-    "1min": ["Name", "PB", "Date", "Distance", "Split", "Watts", "SPM"],
-    "1k": [
-        "Name",
-        "PB",
-        "Date",
-        "Time",
-        "Avg Split",
-        "Watts",
-        "SPM",
-        "200m",
-        "400m",
-        "600m",
-        "800m",
-        "1000m",
-    ],
-    "2k": [
-        "Name",
-        "PB",
-        "Date",
-        "Time",
-        "Avg Split",
-        "Watts",
-        "SPM",
-        "250m",
-        "500m",
-        "750m",
-        "1000m",
-        "1250m",
-        "1500m",
-        "1750m",
-        "2000m",
-    ],
-    "6k": [
-        "Name",
-        "PB",
-        "Date",
-        "Time",
-        "Avg Split",
-        "Watts",
-        "SPM",
-        "500m",
-        "1000m",
-        "1500m",
-        "2000m",
-        "2500m",
-        "3000m",
-        "3500m",
-        "4000m",
-        "4500m",
-        "5000m",
-        "5500m",
-        "6000m",
-    ],
-    "hour": [
-        "Name",
-        "PB",
-        "Date",
-        "Distance",
-        "Avg Split",
-        "Watts",
-        "SPM",
-        "250m",
-        "500m",
-        "750m",
-        "1000m",
-        "1250m",
-        "1500m",
-        "1750m",
-        "2000m",
-    ],
-    "4x1k": [
-        "Name",
-        "PB",
-        "Date",
-        "AVG Split",
-        "Watts",
-        "SPM",
-        "Split 1",
-        "Split 2",
-        "Split 3",
-        "Split 4",
-    ],
-    "3x6k": [
-        "Name",
-        "PB",
-        "Date",
-        "AVG Split",
-        "Watts",
-        "SPM",
-        "Split 1",
-        "Split 2",
-        "Split 3",
-    ],
-    "3x12min": [
-        "Name",
-        "PB",
-        "Date",
-        "AVG Split",
-        "Watts",
-        "SPM",
-        "Split 1",
-        "Split 2",
-        "Split 3",
-    ],
-    "3x30min": [
-        "Name",
-        "PB",
-        "Date",
-        "AVG Split",
-        "Watts",
-        "SPM",
-        "Split 1",
-        "Split 2",
-        "Split 3",
-    ],
-}
+
+
+def rank_key(kind: str) -> Callable:
+    """
+    The sort key of the ranking rows of a workout kind: bikes first, then best
+    first by the field in RANK_BY, e.g. the fastest time or the longest distance.
+
+    Args:
+        kind (str): The kind of the workout.
+
+    Returns:
+        callable: Returns the sort key of a RankingRow.
+    """
+    return lambda row: row.key(kind)
+
+
+def leaderboards_of(kind: str) -> Leaderboards:
+    """Create the leaderboards of a workout kind, with its team statistics and the
+    sheet of every row for the spreadsheet."""
+    return Leaderboards(rank_key(kind), stats=TeamStats(kind), sheet=[])
 
 
 def output_to_xlsx(ranking: list, name: str, banner: list) -> None:
@@ -174,34 +80,112 @@ def output_to_xlsx(ranking: list, name: str, banner: list) -> None:
     Returns:
         None
     """
-    if os.path.exists(name):
-        os.chmod(name, 0o777)
+    local = storage.local_path(name)
+    if local is not None and os.path.exists(local):
+        os.chmod(local, 0o777)
     wb = Workbook()
     ws = wb.active
     ws.append(banner)
     for row in ranking:
         ws.append(row)
 
-    wb.save(name)
+    with storage.atomic(name, "wb") as f:
+        wb.save(f)
 
-    os.chmod(name, 0o777)
+    if local is not None:
+        os.chmod(local, 0o777)
 
-    print("File saved successfully")
+    logging.info("Saved %s", name)
+
+
+def save_ranking(boards: Leaderboards, workout_name: str) -> None:
+    """
+    Save the overall leaderboard to an Excel file, and every partition leaderboard
+    to a JSON file for the leaderboard service. The team statistics of every
+    partition, over all the results ranked, are saved to results/<workout>_team.json.
+
+    The spreadsheet lists every result ranked, from the sheet of the leaderboards.
+    The JSON file holds the best top_k of the overall leaderboard as its
+    "entries" and of every partition.
+
+    Each JSON entry carries the displayed cells of its row, its typed values and
+    the age and category of the athlete, taken from the roster and the cached
+    profiles.
+
+    Args:
+        boards (Leaderboards): The leaderboards of the workout.
+        workout_name (str): The name of the workout in the registry.
+
+    Returns:
+        None
+    """
+    today = datetime.today().strftime("%Y-%m-%d")
+    kind = WORKOUTS[workout_name]["kind"]
+    output_to_xlsx(
+        [row.cells(kind) for row in boards.sheet_rows()],
+        f"results/{today}_{workout_name}.xlsx",
+        BANNERS[workout_name],
+    )
+
+    def entries(partition):
+        return [
+            {
+                "user_id": result["user_id"],
+                "result_id": result["id"],
+                "type": result["type"],
+                "date": result["date"][:DATE_CONSTANT],
+                "row": row.cells(kind),
+                "values": row.as_dict(),
+                **info,
+            }
+            for result, row, info in boards.ranked(partition)
+        ]
+
+    leaderboard = {
+        "workout": workout_name,
+        "ranked": today,
+        "top_k": boards.top_k,
+        "entries": entries(OVERALL),
+        "partitions": {name: entries(name) for name in boards.partitions()},
+    }
+    with storage.atomic(f"results/{workout_name}.json", "w", encoding="utf-8") as f:
+        dump(leaderboard, f)
+
+    if boards.stats is not None:
+        team = {
+            "workout": workout_name,
+            "ranked": today,
+            "partitions": boards.stats.summary(),
+        }
+        with storage.atomic(
+            f"results/{workout_name}_team.json", "w", encoding="utf-8"
+        ) as f:
+            dump(team, f)
 
 
 def open_xlsx(name: str) -> None:
     """
-    Open the Excel file.
+    Open today's Excel file of a workout with the default application.
+
+    The file is found through the storage in use, so it opens from any results
+    root without changing the working directory. Nothing opens when the storage
+    keeps it in memory.
 
     Args:
-        name (str): The name of the Excel file.
+        name (str): The name of the workout.
 
     Returns:
         None
     """
-    os.chdir("results")
-    os.startfile(str(datetime.today().strftime("%Y-%m-%d")) + "_" + name + ".xlsx")
-    os.chdir("..")
+    today = datetime.today().strftime("%Y-%m-%d")
+    local = storage.local_path(f"results/{today}_{name}.xlsx")
+    if local is None:
+        logging.warning("Not opening %s: the results are kept in memory", name)
+        return
+    if hasattr(os, "startfile"):
+        os.startfile(local)
+    else:
+        subprocess.Popen(["open" if sys.platform == "darwin" else "xdg-open", local])
 
 
 def find_approx(
@@ -227,499 +211,459 @@ def find_approx(
     return approx_time
 
 
-def get_intervals(workout_id: str, split_length: int, num_splits: int) -> list:
+def get_intervals(workout_id: str, split_length: int, num_splits: int) -> tuple:
     """
     Get the split times for a given workout ID.
 
+    The stroke file is streamed and reading stops once num_splits are found.
+
     Args:
         id (str): The workout ID.
-        split_length (int): The length of each split.
+        split_length (int): The length of each split in meters.
         num_splits (int): The number of splits to retrieve.
 
     Returns:
-        list: The split times and the accumulated time.
+        tuple: The splits, in tenths of a second per 500m, and the accumulated
+        time, or None if the stroke file is missing, unreadable or ends before
+        num_splits are found, so the workout is skipped.
     """
+    splits = []
+    target = split_length
+    accumulated_time = 0
+    previous_t, previous_d = 0, 0
     try:
-        file_path = os.path.join(STROKES, str(workout_id) + ".json")
-        with open(file_path, "r", encoding="utf-8") as f:
-            data = load(f)
-        splits = []
-        target = split_length
-        accumulated_time = 0
-        for num, stroke in enumerate(data["data"]):
-            stroke = data["data"][num]
-            if stroke["d"] == target * TENTHS_PER_SECOND:
-                splits.append(
-                    cv.calculate_split(stroke["t"] - accumulated_time, split_length)
-                )
-                accumulated_time = stroke["t"]
-                if len(splits) == num_splits:
-                    return splits, accumulated_time
-                target += split_length
-
-            elif stroke["d"] > target * TENTHS_PER_SECOND:
-                previous = data["data"][num - 1]
-                split_time = find_approx(
-                    previous["d"],
-                    stroke["d"],
-                    previous["t"],
-                    stroke["t"],
-                    target,
+        strokes = stream_strokes(cache.locate(STROKES, workout_id))
+        for t, d, _, _ in strokes:
+            while d >= target * TENTHS_PER_SECOND and len(splits) < num_splits:
+                split_time = (
+                    t
+                    if d == target * TENTHS_PER_SECOND
+                    else find_approx(previous_d, d, previous_t, t, target)
                 )
                 splits.append(
-                    cv.calculate_split(split_time - accumulated_time, split_length)
+                    cv.split_tenths(split_time - accumulated_time, split_length)
                 )
                 accumulated_time = split_time
-                if len(splits) == num_splits:
-                    return splits, accumulated_time
                 target += split_length
-    except KeyError as e:
-        logging.error(e)
-
-
-def get_times(workout_id: str, split_length: int, num_splits: int) -> list:
+            if len(splits) == num_splits:
+                strokes.close()
+                break
+            previous_t, previous_d = t, d
+    except (KeyError, ValueError, OSError, EOFError) as e:
+        logging.error("Unreadable strokes: %s", e, extra={"result_id": workout_id})
+        return None
+    if len(splits) < num_splits:
+        logging.warning(
+            "Strokes end after %d of %d splits",
+            len(splits),
+            num_splits,
+            extra={"result_id": workout_id},
+        )
+        return None
+    return splits, accumulated_time
+
+
+def get_times(workout_id: str, split_length: int, num_splits: int) -> tuple:
     """
     Get the split distances for a given workout ID.
 
+    The stroke file is streamed and reading stops once num_splits are found.
+
     Args:
         id (str): The workout ID.
-        split_length (int): The length of each split.
+        split_length (int): The length of each split in tenths of a second.
         num_splits (int): The number of splits to retrieve.
 
     Returns:
-        list: The split distances and the accumulated distance.
+        tuple: The splits, in tenths of a second per 500m, and the accumulated
+        distance in meters, or None if the stroke file is missing, unreadable or
+        ends before num_splits are found, so the workout is skipped.
     """
+    splits = []
+    target = split_length
+    accumulated_dist = 0
+    previous_t, previous_d = 0, 0
     try:
-        file_path = os.path.join(STROKES, str(workout_id) + ".json")
-        with open(file_path, "r", encoding="utf-8") as f:
-            data = load(f)
-        splits = []
-        found = 0
-        target = split_length
-        accumulated_dist = 0
-        for num, stroke in enumerate(data["data"]):
-            stroke = data["data"][num]
-            if stroke["d"] == target:
-                splits.append(
-                    cv.calculate_split(split_length, stroke["d"] - accumulated_dist)
+        strokes = stream_strokes(cache.locate(STROKES, workout_id))
+        for t, d, _, _ in strokes:
+            while t >= target and len(splits) < num_splits:
+                # Interpolate the distance (in decimeters) rowed at the target time
+                split_dist = previous_d + (d - previous_d) * (target - previous_t) / (
+                    t - previous_t
                 )
-                found += 1
-                accumulated_dist = stroke["d"]
-                if len(splits) == num_splits:
-                    return splits, accumulated_dist
-                target += split_length
-
-            elif stroke["d"] > target * TENTHS_PER_SECOND:
-                previous = data["data"][num - 1]
-                split_dist = find_approx(
-                    previous["t"],
-                    stroke["t"],
-                    previous["d"],
-                    stroke["d"],
-                    target,
-                )
-                found += 1
+                split_dist /= TENTHS_PER_SECOND
                 splits.append(
-                    cv.calculate_split(split_length, split_dist - accumulated_dist)
+                    cv.split_tenths(split_length, split_dist - accumulated_dist)
                 )
                 accumulated_dist = split_dist
-                if len(splits) == num_splits:
-                    return splits, accumulated_dist
                 target += split_length
-    except KeyError as e:
-        logging.error(e)
-
-
-def process_workout(
-    workout: dict, category: str, is_interval=False
-) -> List[Union[str, int]]:
+            if len(splits) == num_splits:
+                strokes.close()
+                break
+            previous_t, previous_d = t, d
+    except (KeyError, ValueError, OSError, EOFError) as e:
+        logging.error("Unreadable strokes: %s", e, extra={"result_id": workout_id})
+        return None
+    if len(splits) < num_splits:
+        logging.warning(
+            "Strokes end after %d of %d splits",
+            len(splits),
+            num_splits,
+            extra={"result_id": workout_id},
+        )
+        return None
+    return splits, accumulated_dist
+
+
+def process_workout(workout: dict, splits: tuple = ()) -> RankingRow:
     """
-    Processes an individual workout and returns information about it.
+    Processes an individual workout into its ranking row.
 
     Args:
         workout (dict): The workout dictionary containing information about the workout.
-        category (str): The type of information to return ("time" or "distance").
-        is_interval (bool, optional): Whether the workout is an interval workout. Defaults to False.
+        splits (tuple, optional): The splits of the workout, in tenths of a second per 500m.
 
     Returns:
-        List[Union[str, int]]: A list of information about the workout.
+        RankingRow: The typed ranking row of the workout.
+    """
+    name = cv.format_name(dr.get_name(workout["user_id"]))
+    return RankingRow.from_result(workout, name, splits)
 
+
+class Cancelled(Exception):
+    """Raised when a ranking is cancelled before it finishes."""
+
+
+def iter_results(
+    since: str = None,
+    progress: Callable[[str, int, int], None] = None,
+    cancel: Event = None,
+    results: Iterable = None,
+):
     """
-    dist = (
-        workout["distance"]
-        if workout["type"] == "rower"
-        else workout["distance"] / BIKE_DISTANCE_FACTOR
-    )
-    info = [
-        cv.format_name(dr.get_name(workout["user_id"])),
-        "bike" if workout["type"] == "bike" else "",
-        workout["date"][:DATE_CONSTANT],
-        (
-            workout["distance"]
-            if category == "time"
-            else cv.time_to_real(workout["time"])
-        ),
-        cv.calculate_split(workout["time"], dist),
-        cv.calculate_watts(workout["time"], dist),
-        (
-            workout["stroke_rate"]
-            if "stroke_rate" in workout
-            else (workout["stroke_count"] // (workout["time"] / TENTHS_PER_MINUTE))
-        ),
-    ]
-    if is_interval:
-        info.remove(info[3])
-    return info
-
-
-def find_peak_power(api_token: str) -> None:
+    Iterate over every downloaded result.
+
+    Args:
+        since (str, optional): Only yield results from this date ('YYYY-MM-DD') on.
+        progress (callable, optional): Called with ("rank", done, total) after each
+            results file is ranked.
+        cancel (Event, optional): Stops the iteration when set.
+        results (Iterable, optional): Iterate over these results instead of the
+            saved ones, e.g. a SyncPipeline streaming them as they are synced.
+
+    Yields:
+        dict: Each result.
+
+    Raises:
+        Cancelled: If cancel is set.
+    """
+    if results is not None:
+        for result in results:
+            if cancel is not None and cancel.is_set():
+                raise Cancelled("Cancelled during sync")
+            if since is None or result["date"][:DATE_CONSTANT] >= since:
+                yield result
+        if cancel is not None and cancel.is_set():
+            raise Cancelled("Cancelled during sync")
+        return
+    user_ids = cache.keys(JSON)
+    for i, user_id in enumerate(user_ids):
+        if cancel is not None and cancel.is_set():
+            raise Cancelled(f"Cancelled after {i} of {len(user_ids)} files")
+        data = cache.read_json(JSON, user_id)
+
+        for result in data.get("data", []):
+            if since is None or result["date"][:DATE_CONSTANT] >= since:
+                yield result
+
+        if progress is not None:
+            progress("rank", i + 1, len(user_ids))
+
+
+def find_peak_power(
+    api_token: str,
+    workout_name: str = "peak_power",
+    bikes: bool = True,
+    since: str = None,
+    progress: Callable[[str, int, int], None] = None,
+    cancel: Event = None,
+    results: Iterable = None,
+) -> None:
     """
     Find the peak power for each user's workout and save the results to an Excel file.
 
     Args:
         api_token (str): The API token for authentication.
+        workout_name (str): The name of the workout in the registry.
+        bikes (bool): Flag indicating whether to include bike workouts.
+        since (str, optional): Only rank results from this date ('YYYY-MM-DD') on.
+        progress (callable, optional): Called with the stage, done and total.
+        cancel (Event, optional): Cancels the ranking when set.
+        results (Iterable, optional): Rank these results instead of the saved ones.
 
     Returns:
         None
     """
-    ranking = []
-    window = sg.Window(
-        "Progress Bar", LAYOUT, finalize=True, icon="resources/VarsityV.ico"
-    )
-
-    for i, filename in enumerate(os.listdir(JSON)):
-        file_path = os.path.join(JSON, filename)
-        with open(file_path, "r", encoding="utf-8") as f:
-            data = load(f)
-
-        if "data" not in data:
+    spec = WORKOUTS[workout_name]
+    boards = leaderboards_of(spec["kind"])
+    for result in iter_results(since, progress, cancel, results):
+        if result["distance"] > spec["value"] or not included(result, bikes):
             continue
 
         maximum, spm = float("inf"), 0
-        for result in data["data"]:
-            if result["distance"] <= 200:
-                dl.get_stroke_data(result["user_id"], result["id"], api_token)
-                path = os.path.join(STROKES, str(result["id"]) + ".json")
-
-                with open(path, "r", encoding="utf-8") as f:
-                    piece = load(f)
-
-                for stroke in piece["data"]:
-                    if stroke["p"] < maximum:
-                        maximum, spm = stroke["p"], stroke["spm"]
-
-                if maximum not in [float("inf"), 0]:
-                    ranking.append(
-                        [
-                            cv.format_name(dr.get_name(result["user_id"])),
-                            "",
-                            result["date"][:DATE_CONSTANT],
-                            cv.split_to_watts(cv.time_to_real(maximum)),
-                            cv.time_to_real(maximum),
-                            spm,
-                        ]
-                    )
-                    window["progress"].update(i + 1)
-
-    ranking.sort(key=lambda x: x[2], reverse=True)
+        if not dl.get_stroke_data(result["user_id"], result["id"], api_token):
+            continue
+        path = cache.locate(STROKES, result["id"])
+
+        for _, _, pace, rate in stream_strokes(path):
+            if pace < maximum:
+                maximum, spm = pace, rate
+
+        if maximum not in [float("inf"), 0]:
+            # Peak power is not grouped by erg
+            row = RankingRow(
+                cv.format_name(dr.get_name(result["user_id"])),
+                "",
+                result["date"][:DATE_CONSTANT],
+                result["time"],
+                result["distance"],
+                maximum,
+                cv.split_seconds_to_watts(maximum / TENTHS_PER_SECOND),
+                spm,
+            )
+            boards.add(result, row)
 
-    output_to_xlsx(
-        ranking,
-        f'results/{str(datetime.today().strftime("%Y-%m-%d"))}_peak_power.xlsx',
-        BANNERS["peak_power"],
-    )
-    window.close()
+    save_ranking(boards, workout_name)
 
 
-def find_1min(bikes: bool) -> None:
+def find_1min(
+    api_token: str,
+    workout_name: str = "1min",
+    bikes: bool = False,
+    since: str = None,
+    progress: Callable[[str, int, int], None] = None,
+    cancel: Event = None,
+    results: Iterable = None,
+) -> None:
     """
     Find the 1-minute ranking for each user's workout and save the results to an Excel file.
 
     Args:
+        api_token (str): The API token for authentication, unused as no strokes are needed.
+        workout_name (str): The name of the workout in the registry.
         bikes (bool): Flag indicating whether to include bike workouts.
+        since (str, optional): Only rank results from this date ('YYYY-MM-DD') on.
+        progress (callable, optional): Called with the stage, done and total.
+        cancel (Event, optional): Cancels the ranking when set.
+        results (Iterable, optional): Rank these results instead of the saved ones.
 
     Returns:
         None
     """
-    ranking = []
-    window = sg.Window(
-        "Progress Bar", LAYOUT, finalize=True, icon="resources/VarsityV.ico"
-    )
-
-    for i, filename in enumerate(os.listdir(JSON)):
-        file_path = os.path.join(JSON, filename)
+    boards = leaderboards_of(WORKOUTS[workout_name]["kind"])
+    for result in iter_results(since, progress, cancel, results):
+        if classify(result) == workout_name and included(result, bikes):
+            boards.add(result, process_workout(result))
 
-        with open(file_path, "r", encoding="utf-8") as f:
-            data = load(f)
-        if not "data" in data:
-            continue
-
-        for result in data["data"]:
-            if (
-                result["workout_type"] == "FixedTimeSplit"
-                and result["time"] == 600
-                and (result["type"] == "rower" if not bikes else True)
-            ):
-                ranking += process_workout(result, "time")
-
-                window["progress"].update(i + 1)
-
-    ranking.sort(key=lambda x: (x[1] != "bike", x[3]))
-
-    output_to_xlsx(
-        ranking,
-        f'results/{str(datetime.today().strftime("%Y-%m-%d"))}_1min.xlsx',
-        BANNERS["1min"],
-    )
-    window.close()
+    save_ranking(boards, workout_name)
 
 
 def rank_single_distance(
     api_token: str,
-    split_length: int,
-    num_intervals: int,
     workout_name: str,
     bikes: bool = False,
+    since: str = None,
+    progress: Callable[[str, int, int], None] = None,
+    cancel: Event = None,
+    results: Iterable = None,
 ) -> None:
     """Rank the workouts for a single distance and save the results
 
     Args: api_token (str): The API token for authentication
-    split_length (int): The length of each split
-    num_intervals (int): The number of intervals
-    workout_name (str): The name of the workout
+    workout_name (str): The name of the workout in the registry
     bikes (bool): Flag indicating whether to include bike workouts
+    since (str, optional): Only rank results from this date ('YYYY-MM-DD') on
+    progress (callable, optional): Called with the stage, done and total
+    cancel (Event, optional): Cancels the ranking when set
+    results (Iterable, optional): Rank these results instead of the saved ones
 
     Returns: None"""
     logging.info("Ranking %s workout", workout_name)
-    distance = split_length * num_intervals
-    ranking = []
-    window = sg.Window(
-        "Progress Bar", LAYOUT, finalize=True, icon="resources/VarsityV.ico"
-    )
-
-    for i, filename in enumerate(os.listdir(JSON)):
-        file_path = os.path.join(JSON, filename)
-        with open(file_path, "r", encoding="utf-8") as f:
-            data = load(f)
-        for result in data["data"]:
-            dist = (
-                result["distance"]
-                if result["type"] == "rower"
-                else result["distance"] / BIKE_DISTANCE_FACTOR
-            )
-            if (
-                result["workout_type"] == "FixedDistanceSplits"
-                and dist == distance
-                and (result["type"] == "rower" if not bikes else True)
-            ):
-
-                rank = process_workout(result, "distance")
-
-                dl.get_stroke_data(result["user_id"], result["id"], api_token)
-                splits, accumulated = get_intervals(
-                    result["id"], split_length, num_intervals - 1
-                )
-                splits.append(
-                    cv.calculate_split(result["time"] - accumulated, split_length)
-                )
+    spec = WORKOUTS[workout_name]
+    split_length, num_intervals = spec["split_length"], spec["intervals"]
+    boards = leaderboards_of(spec["kind"])
+    for result in iter_results(since, progress, cancel, results):
+        if classify(result) == workout_name and included(result, bikes):
+            if not dl.get_stroke_data(result["user_id"], result["id"], api_token):
+                continue
+            found = get_intervals(result["id"], split_length, num_intervals - 1)
+            if found is None:
+                continue
+            splits, accumulated = found
+            splits.append(cv.split_tenths(result["time"] - accumulated, split_length))
 
-                rank += splits
-                ranking.append(rank)
-                window["progress"].update(i + 1)
+            boards.add(result, process_workout(result, splits))
 
-    window.close()
-
-    ranking.sort(key=lambda x: (x[1] != "bike", x[3]))
-
-    output_to_xlsx(
-        ranking,
-        f"results/{str(datetime.today().strftime('%Y-%m-%d'))}_{workout_name}.xlsx",
-        BANNERS[workout_name],
-    )
-    window.close()
+    save_ranking(boards, workout_name)
 
 
 def rank_single_time(
     api_token: str,
-    time: int,
-    split_length: int,
-    num_intervals: int,
     workout_name: str,
+    bikes: bool = False,
+    since: str = None,
+    progress: Callable[[str, int, int], None] = None,
+    cancel: Event = None,
+    results: Iterable = None,
 ) -> None:
-    """Rank the workouts for a single time interval and save the results"""
-    ranking = []
+    """Rank the workouts for a single time interval and save the results
 
-    window = sg.Window(
-        "Progress Bar", LAYOUT, finalize=True, icon="resources/VarsityV.ico"
-    )
-
-    for i, filename in enumerate(os.listdir(JSON)):
-        file_path = os.path.join(JSON, filename)
-
-        with open(file_path, "r", encoding="utf-8") as f:
-            data = load(f)
-        if "data" not in data:
-            continue
-
-        for result in data["data"]:
-            if result["workout_type"] == "FixedTimeSplits" and result["time"] == time:
-                rank = process_workout(result, "time")
-
-                dl.get_stroke_data(result["user_id"], result["id"], api_token)
-                splits, accumulated = get_times(
-                    result["id"], split_length, num_intervals - 1
-                )
-                splits.append(
-                    cv.calculate_split(split_length, result["distance"] - accumulated)
-                )
-                rank += splits
-                ranking.append(rank)
-                window["progress"].update(i + 1)
-
-    window.close()
+    Args: api_token (str): The API token for authentication
+    workout_name (str): The name of the workout in the registry
+    bikes (bool): Flag indicating whether to include bike workouts
+    since (str, optional): Only rank results from this date ('YYYY-MM-DD') on
+    progress (callable, optional): Called with the stage, done and total
+    cancel (Event, optional): Cancels the ranking when set
+    results (Iterable, optional): Rank these results instead of the saved ones
 
-    ranking.sort(key=lambda x: (x[1] != "bike", x[3]))
+    Returns: None"""
+    spec = WORKOUTS[workout_name]
+    split_length, num_intervals = spec["split_length"], spec["intervals"]
+    boards = leaderboards_of(spec["kind"])
+
+    for result in iter_results(since, progress, cancel, results):
+        if classify(result) == workout_name and included(result, bikes):
+            if not dl.get_stroke_data(result["user_id"], result["id"], api_token):
+                continue
+            found = get_times(result["id"], split_length, num_intervals - 1)
+            if found is None:
+                continue
+            splits, accumulated = found
+            splits.append(
+                cv.split_tenths(split_length, result["distance"] - accumulated)
+            )
+            boards.add(result, process_workout(result, splits))
 
-    output_to_xlsx(
-        ranking,
-        f"results/{str(datetime.today().strftime('%Y-%m-%d'))}_{workout_name}.xlsx",
-        BANNERS[workout_name],
-    )
-    window.close()
+    save_ranking(boards, workout_name)
 
 
 def rank_intervals_distance(
-    dist: int, interval_length: int, num_intervals: int, workout_name: str, bikes: bool
+    api_token: str,
+    workout_name: str,
+    bikes: bool = False,
+    since: str = None,
+    progress: Callable[[str, int, int], None] = None,
+    cancel: Event = None,
+    results: Iterable = None,
 ) -> None:
     """Rank the workouts for a distance with intervals and save the results.
 
     Args:
-        dist (int): The distance of the workout
-        interval_length (int): The length of each interval
-        num_intervals (int): The number of intervals
-        workout_name (str): The name of the workout
+        api_token (str): The API token for authentication, unused as no strokes are needed
+        workout_name (str): The name of the workout in the registry
         bikes (bool): Flag indicating whether to include bike workouts
+        since (str, optional): Only rank results from this date ('YYYY-MM-DD') on
+        progress (callable, optional): Called with the stage, done and total
+        cancel (Event, optional): Cancels the ranking when set
+        results (Iterable, optional): Rank these results instead of the saved ones
 
     Returns: None"""
-    ranking = []
-    window = sg.Window(
-        "Progress Bar", LAYOUT, finalize=True, icon="resources/VarsityV.ico"
-    )
-
-    for i, filename in enumerate(os.listdir(JSON)):
-        file_path = os.path.join(JSON, filename)
-        with open(file_path, "r", encoding="utf-8") as f:
-            data = load(f)
-
-        if "data" not in data:
-            continue
-
-        for result in data["data"]:
-            if (
-                (
-                    (
-                        result["workout_type"] == "FixedTimeInterval"
-                        or result["workout_type"] == "VariableInterval"
-                    )
-                    and result["distance"] == dist
-                )
-                or (
-                    bikes
-                    and (
-                        result["workout_type"] == "FixedTimeInterval"
-                        or result["workout_type"] == "VariableInterval"
-                    )
-                )
-                and result["distance"] == dist * BIKE_DISTANCE_FACTOR
-            ):
-                rank = process_workout(result, "distance", is_interval=True)
-
-                for interval in range(num_intervals):
-                    time = result["workout"]["intervals"][interval]["time"]
-                    if result["type"] == "bike":
-                        time /= BIKE_DISTANCE_FACTOR
-                    rank.append(
-                        cv.calculate_split(
-                            result["workout"]["intervals"][interval]["time"],
-                            interval_length,
-                        )
-                    )
-                ranking.append(rank)
-                window["progress"].update(i + 1)
-
-    ranking.sort(key=lambda x: (x[1] != "bike", x[3]))
-
-    output_to_xlsx(
-        ranking,
-        f'results/{str(datetime.today().strftime("%Y-%m-%d"))}_{workout_name}.xlsx',
-        BANNERS[workout_name],
-    )
-    window.close()
+    spec = WORKOUTS[workout_name]
+    interval_length, num_intervals = spec["split_length"], spec["intervals"]
+    boards = leaderboards_of(spec["kind"])
+    for result in iter_results(since, progress, cancel, results):
+        if classify(result) == workout_name and included(result, bikes):
+            # Bike intervals are twice as long, so the split is taken over the
+            # normalised interval length with the unscaled time.
+            splits = [
+                cv.split_tenths(interval["time"], interval_length)
+                for interval in result["workout"]["intervals"][:num_intervals]
+            ]
+            boards.add(result, process_workout(result, splits))
+
+    save_ranking(boards, workout_name)
 
 
 def rank_intervals_time(
-    interval_length: int, num_intervals: int, workout_name: str, bikes: bool
+    api_token: str,
+    workout_name: str,
+    bikes: bool = False,
+    since: str = None,
+    progress: Callable[[str, int, int], None] = None,
+    cancel: Event = None,
+    results: Iterable = None,
 ) -> None:
     """Rank the workouts for a time workout with intervals and save the results.
 
     Args:
-        interval_length (int): The length of each interval
-        num_intervals (int): The number of intervals
-        workout_name (str): The name of the workout
+        api_token (str): The API token for authentication, unused as no strokes are needed
+        workout_name (str): The name of the workout in the registry
         bikes (bool): Flag indicating whether to include bike workouts
+        since (str, optional): Only rank results from this date ('YYYY-MM-DD') on
+        progress (callable, optional): Called with the stage, done and total
+        cancel (Event, optional): Cancels the ranking when set
+        results (Iterable, optional): Rank these results instead of the saved ones
 
     Returns: None"""
-    time = interval_length * num_intervals
-    ranking = []
-    window = sg.Window(
-        "Progress Bar", LAYOUT, finalize=True, icon="resources/VarsityV.ico"
-    )
-
-    for i, filename in enumerate(os.listdir(JSON)):
-        file_path = os.path.join(JSON, filename)
-
-        with open(file_path, "r", encoding="utf-8") as f:
-            data = load(f)
-        if not "data" in data:
-            continue
+    spec = WORKOUTS[workout_name]
+    interval_length, num_intervals = spec["split_length"], spec["intervals"]
+    boards = leaderboards_of(spec["kind"])
+    for result in iter_results(since, progress, cancel, results):
+        if classify(result) == workout_name and included(result, bikes):
+            splits = []
+            for interval in result["workout"]["intervals"][:num_intervals]:
+                dist = interval["distance"]
+                if result["type"] == "bike":
+                    dist /= BIKE_DISTANCE_FACTOR
+                splits.append(cv.split_tenths(interval_length, dist))
+
+            boards.add(result, process_workout(result, splits))
+
+    save_ranking(boards, workout_name)
+
+
+RANKERS = {
+    "peak_power": find_peak_power,
+    "1min": find_1min,
+    "single_distance": rank_single_distance,
+    "single_time": rank_single_time,
+    "intervals_distance": rank_intervals_distance,
+    "intervals_time": rank_intervals_time,
+}
 
-        for result in data["data"]:
-            if (
-                (
-                    result["workout_type"] == "FixedTimeInterval"
-                    or result["workout_type"] == "VariableInterval"
-                )
-                and result["time"] == time
-                and (result["type"] == "rower" if not bikes else True)
-            ):
 
-                rank = process_workout(result, "time", is_interval=True)
+def rank(
+    api_token: str,
+    workout_name: str,
+    bikes: bool = False,
+    since: str = None,
+    progress: Callable[[str, int, int], None] = None,
+    cancel: Event = None,
+    results: Iterable = None,
+) -> None:
+    """Rank a workout from the registry with the ranking function for its kind.
 
-                for interval in range(num_intervals):
-                    dist = result["workout"]["intervals"][interval]["distance"]
-                    if result["type"] == "bike":
-                        dist /= BIKE_DISTANCE_FACTOR
-                    rank.append(
-                        cv.calculate_split(
-                            interval_length,
-                            dist,
-                        )
-                    )
+    Args:
+        api_token (str): The API token for authentication
+        workout_name (str): The name of the workout in the registry
+        bikes (bool): Flag indicating whether to include bike workouts
+        since (str, optional): Only rank results from this date ('YYYY-MM-DD') on
+        progress (callable, optional): Called with the stage, done and total
+        cancel (Event, optional): Cancels the ranking when set
+        results (Iterable, optional): Rank these results instead of the saved ones
 
-                ranking.append(rank)
-                window["progress"].update(i + 1)
+    Returns: None"""
+    with logs.run(workout_name):
+        RANKERS[WORKOUTS[workout_name]["kind"]](
+            api_token, workout_name, bikes, since, progress, cancel, results
+        )
 
-    ranking.sort(key=lambda x: (x[1] != "bike", x[3]))
 
-    output_to_xlsx(
-        ranking,
-        f'results/{str(datetime.today().strftime("%Y-%m-%d"))}_{workout_name}.xlsx',
-        BANNERS[workout_name],
-    )
-    window.close()
+if __name__ == "__main__":
+    import PySimpleGUI as sg
 
+    logs.setup()
 
-if __name__ == "__main__":
     ID10T = sg.Window(
         title="Error ID10T",
         layout=[[sg.Text("Dumbass")], [sg.Button("Resign to your repeated failure")]],
@@ -0,0 +1,351 @@
+"""
+This module contains the registry of rankable workouts and the index used to
+classify Concept2 results against it.
+
+Every workout is described once, as data, in WORKOUTS. The registry is compiled
+into INDEX, a dictionary keyed on (workout_type, measure, value), so a result is
+matched against every category with at most two dictionary lookups. Adding a new
+piece only requires a new entry in WORKOUTS.
+
+The columns of each kind of ranking are described in COLUMNS, which the banners
+in BANNERS are built from, and the field each kind is ranked by in RANK_BY.
+
+Functions:
+- distance_splits(split_length: int, num_splits: int) -> list
+- time_splits(split_length: int, num_splits: int) -> list
+- interval_splits(num_intervals: int) -> list
+- banner(spec: dict) -> list
+- build_index(workouts: dict) -> dict
+- classify(result: dict, index: dict = None) -> str
+- included(result: dict, bikes: bool) -> bool
+- needs_strokes(result: dict) -> bool
+"""
+
+BIKE_DISTANCE_FACTOR = 2
+TENTHS_PER_MINUTE = 600
+STROKE_KINDS = (
+    "single_distance",
+    "single_time",
+    "intervals_distance",
+    "intervals_time",
+)
+DISTANCE = "distance"
+TIME = "time"
+
+
+# The (header, field) of each column of a ranking row, by workout kind. The
+# fields are those of ranking_rows.RankingRow; the splits of the workout follow.
+INTERVAL_COLUMNS = (
+    ("Name", "name"),
+    ("PB", "erg"),
+    ("Date", "date"),
+    ("AVG Split", "split"),
+    ("Watts", "watts"),
+    ("SPM", "spm"),
+)
+COLUMNS = {
+    "peak_power": (
+        ("Name", "name"),
+        ("PB", "erg"),
+        ("Date", "date"),
+        ("Watts", "watts"),
+        ("Split", "split"),
+        ("SPM", "spm"),
+    ),
+    "1min": (
+        ("Name", "name"),
+        ("PB", "erg"),
+        ("Date", "date"),
+        ("Distance", "distance"),
+        ("Split", "split"),
+        ("Watts", "watts"),
+        ("SPM", "spm"),
+    ),
+    "single_distance": (
+        ("Name", "name"),
+        ("PB", "erg"),
+        ("Date", "date"),
+        ("Time", "time"),
+        ("Avg Split", "split"),
+        ("Watts", "watts"),
+        ("SPM", "spm"),
+    ),
+    "single_time": (
+        ("Name", "name"),
+        ("PB", "erg"),
+        ("Date", "date"),
+        ("Distance", "distance"),
+        ("Avg Split", "split"),
+        ("Watts", "watts"),
+        ("SPM", "spm"),
+    ),
+    "intervals_distance": INTERVAL_COLUMNS,
+    "intervals_time": INTERVAL_COLUMNS,
+}
+# The field each kind is ranked by, and whether higher values rank first
+RANK_BY = {
+    "peak_power": ("watts", True),
+    "1min": ("distance", True),
+    "single_distance": ("time", False),
+    "single_time": ("distance", True),
+    "intervals_distance": ("split", False),
+    "intervals_time": ("split", False),
+}
+
+SINGLE_DISTANCE_HEADER = [header for header, _ in COLUMNS["single_distance"]]
+SINGLE_TIME_HEADER = [header for header, _ in COLUMNS["single_time"]]
+INTERVAL_HEADER = [header for header, _ in INTERVAL_COLUMNS]
+
+
+def distance_splits(split_length: int, num_splits: int) -> list:
+    """
+    Create the split headers for a distance piece, e.g. '250m', '500m', ...
+
+    Args:
+        split_length (int): The length of each split in meters.
+        num_splits (int): The number of splits.
+
+    Returns:
+        list: The split headers.
+    """
+    return [f"{split_length * n}m" for n in range(1, num_splits + 1)]
+
+
+def time_splits(split_length: int, num_splits: int) -> list:
+    """
+    Create the split headers for a time piece, e.g. '5min', '10min', ...
+
+    Args:
+        split_length (int): The length of each split in tenths of a second.
+        num_splits (int): The number of splits.
+
+    Returns:
+        list: The split headers.
+    """
+    return [
+        f"{split_length * n // TENTHS_PER_MINUTE}min" for n in range(1, num_splits + 1)
+    ]
+
+
+def interval_splits(num_intervals: int) -> list:
+    """
+    Create the split headers for an interval piece, e.g. 'Split 1', 'Split 2', ...
+
+    Args:
+        num_intervals (int): The number of intervals.
+
+    Returns:
+        list: The split headers.
+    """
+    return [f"Split {n}" for n in range(1, num_intervals + 1)]
+
+
+def banner(spec: dict) -> list:
+    """
+    Create the header row of a workout from the columns of its kind and its splits.
+
+    Args:
+        spec (dict): The workout, as described in WORKOUTS.
+
+    Returns:
+        list: The headers of the columns, then of the splits.
+    """
+    kind = spec["kind"]
+    headers = [header for header, _ in COLUMNS[kind]]
+    if kind == "single_distance":
+        return headers + distance_splits(spec["split_length"], spec["intervals"])
+    if kind == "single_time":
+        return headers + time_splits(spec["split_length"], spec["intervals"])
+    if kind in ("intervals_distance", "intervals_time"):
+        return headers + interval_splits(spec["intervals"])
+    return headers
+
+
+# kind:           The ranking function in workout_finder used for the workout.
+# workout_types:  The Concept2 workout types that can count for the workout.
+# measure:        Whether the workout is fixed by distance (meters) or time (tenths).
+# value:          The total distance or time of the workout, excluding rest.
+# intervals:      The number of splits (single pieces) or intervals (interval pieces).
+# split_length:   The length of each split or interval, in meters or tenths.
+WORKOUTS = {
+    "peak_power": {
+        "label": "Peak Power",
+        "kind": "peak_power",
+        "workout_types": (),
+        "measure": DISTANCE,
+        "value": 200,
+        "intervals": 0,
+        "split_length": 0,
+    },
+    "1min": {
+        "label": "1 Minute",
+        "kind": "1min",
+        "workout_types": ("FixedTimeSplits",),
+        "measure": TIME,
+        "value": 600,
+        "intervals": 1,
+        "split_length": 600,
+    },
+    "1k": {
+        "label": "1km",
+        "kind": "single_distance",
+        "workout_types": ("FixedDistanceSplits",),
+        "measure": DISTANCE,
+        "value": 1000,
+        "intervals": 5,
+        "split_length": 200,
+    },
+    "2k": {
+        "label": "2km",
+        "kind": "single_distance",
+        "workout_types": ("FixedDistanceSplits",),
+        "measure": DISTANCE,
+        "value": 2000,
+        "intervals": 8,
+        "split_length": 250,
+    },
+    "6k": {
+        "label": "6km",
+        "kind": "single_distance",
+        "workout_types": ("FixedDistanceSplits",),
+        "measure": DISTANCE,
+        "value": 6000,
+        "intervals": 12,
+        "split_length": 500,
+    },
+    "hour": {
+        "label": "Hour of Power",
+        "kind": "single_time",
+        "workout_types": ("FixedTimeSplits",),
+        "measure": TIME,
+        "value": 36000,
+        "intervals": 12,
+        "split_length": 3000,
+    },
+    "4x1k": {
+        "label": "4x1km",
+        "kind": "intervals_distance",
+        "workout_types": ("FixedDistanceInterval", "VariableInterval"),
+        "measure": DISTANCE,
+        "value": 4000,
+        "intervals": 4,
+        "split_length": 1000,
+    },
+    "5x1500m": {
+        "label": "5x1500m",
+        "kind": "intervals_distance",
+        "workout_types": ("FixedDistanceInterval", "VariableInterval"),
+        "measure": DISTANCE,
+        "value": 7500,
+        "intervals": 5,
+        "split_length": 1500,
+    },
+    "3x6k": {
+        "label": "3x6km",
+        "kind": "intervals_distance",
+        "workout_types": ("FixedDistanceInterval", "VariableInterval"),
+        "measure": DISTANCE,
+        "value": 18000,
+        "intervals": 3,
+        "split_length": 6000,
+    },
+    "3x12min": {
+        "label": "3x12",
+        "kind": "intervals_time",
+        "workout_types": ("FixedTimeInterval", "VariableInterval"),
+        "measure": TIME,
+        "value": 21600,
+        "intervals": 3,
+        "split_length": 7200,
+    },
+    "3x30min": {
+        "label": "3x30",
+        "kind": "intervals_time",
+        "workout_types": ("FixedTimeInterval", "VariableInterval"),
+        "measure": TIME,
+        "value": 54000,
+        "intervals": 3,
+        "split_length": 18000,
+    },
+}
+
+
+def build_index(workouts: dict) -> dict:
+    """
+    Compile a workout registry into a hash index.
+
+    Args:
+        workouts (dict): The workout registry, keyed by workout name.
+
+    Returns:
+        dict: The workout names keyed on (workout_type, measure, value).
+
+    Raises:
+        ValueError: If two workouts would match the same results.
+    """
+    index = {}
+    for name, spec in workouts.items():
+        for workout_type in spec["workout_types"]:
+            key = (workout_type, spec["measure"], spec["value"])
+            if key in index:
+                raise ValueError(f"{name} and {index[key]} both match {key}")
+            index[key] = name
+    return index
+
+
+INDEX = build_index(WORKOUTS)
+BANNERS = {name: banner(spec) for name, spec in WORKOUTS.items()}
+
+
+def classify(result: dict, index: dict = None) -> str:
+    """
+    Find the workout a Concept2 result counts for.
+
+    Bike distances are halved before the lookup so bikes and ergs share a key.
+
+    Args:
+        result (dict): The result as returned by the Concept2 API.
+        index (dict, optional): The index to look up. Defaults to INDEX.
+
+    Returns:
+        str: The name of the matching workout, or None if there is no match.
+    """
+    if index is None:
+        index = INDEX
+    workout_type = result.get("workout_type")
+    distance = result.get("distance", 0)
+    if result.get("type") == "bike":
+        distance /= BIKE_DISTANCE_FACTOR
+    return index.get((workout_type, DISTANCE, distance)) or index.get(
+        (workout_type, TIME, result.get("time"))
+    )
+
+
+def included(result: dict, bikes: bool) -> bool:
+    """
+    Check if a result is included by the bikes setting.
+
+    Args:
+        result (dict): The result as returned by the Concept2 API.
+        bikes (bool): Flag indicating whether to include bike workouts.
+
+    Returns:
+        bool: True if the result should be ranked.
+    """
+    return bikes or result.get("type") == "rower"
+
+
+def needs_strokes(result: dict) -> bool:
+    """
+    Check if ranking a result requires its stroke data.
+
+    Args:
+        result (dict): The result as returned by the Concept2 API.
+
+    Returns:
+        bool: True if the result is a peak power, split ranked or interval piece.
+    """
+    if result.get("distance", 0) <= WORKOUTS["peak_power"]["value"]:
+        return True
+    name = classify(result)
+    return name is not None and WORKOUTS[name]["kind"] in STROKE_KINDS